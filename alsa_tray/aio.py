@@ -0,0 +1,270 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+############################################################################
+##                                                                        ##
+## ALSA Tray - provides a tray icon for setting ALSA mixers volume        ##
+##                                                                        ##
+## Copyright (C) 2010-2012  Fabien Loison (www.flogisoft.com)             ##
+## Copyright (C) 2018 Beniamin Kalinowski (beniamin.kalinowski@gmail.com) ##
+##                                                                        ##
+## This program is free software: you can redistribute it and/or modify   ##
+## it under the terms of the GNU General Public License as published by   ##
+## the Free Software Foundation, either version 3 of the License, or      ##
+## (at your option) any later version.                                    ##
+##                                                                        ##
+## This program is distributed in the hope that it will be useful,        ##
+## but WITHOUT ANY WARRANTY; without even the implied warranty of         ##
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          ##
+## GNU General Public License for more details.                           ##
+##                                                                        ##
+## You should have received a copy of the GNU General Public License      ##
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.  ##
+##                                                                        ##
+############################################################################
+
+
+"""An asyncio API for the ALSA Tray volume control (Python >= 3.6).
+
+Each AsyncMixer drives its own alsa_tray.VolumeController, so several
+mixers can be controlled from the same process. The ALSA calls of an
+AsyncMixer run in a single thread executor: the coroutines never block the
+event loop, and they all share the same mixer handle (and its reopen with
+backoff, see alsa_tray.MixerHandle). The changes are watched through the
+mixer poll descriptors registered with the event loop.
+
+USAGE:
+    from alsa_tray import aio
+
+    mixer = await aio.open_mixer()
+    print(await mixer.get_state())
+    await mixer.adjust(+5)
+    async for state in mixer.events():
+        print(state)
+"""
+
+
+import asyncio
+import concurrent.futures
+import threading
+
+from alsa_tray import alsa_tray
+
+
+#Fallback interval of events() when the mixer can't be watched
+POLL_INTERVAL = 0.8
+
+#The card and mixer of the configuration file, read once (see _select())
+_config = None
+_config_lock = threading.Lock()
+
+
+class AsyncMixer(object):
+
+    """A mixer driven from an asyncio event loop.
+
+    The states are the dicts of VolumeController.get_state(), with volume
+    and mute set to None while the mixer is unavailable.
+
+    Methods:
+        * get_state -- read the mixer state
+        * set_volume -- set the volume and unmute
+        * adjust -- change the volume and unmute
+        * set_mute -- mute/unmute
+        * toggle_mute -- toggle the mute state
+        * events -- async iterator of the mixer states
+        * close -- shut the executor down
+
+    Attribute:
+        * controller -- the alsa_tray.VolumeController
+    """
+
+    def __init__(self, controller, loop=None):
+        """The constructor.
+
+        Argument:
+            * controller -- the alsa_tray.VolumeController
+
+        Keyword argument:
+            * loop -- the event loop (default: the running loop)
+        """
+        self.controller = controller
+        self._loop = loop
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._descriptors = []
+        self._generation = None
+        self._watched = []
+        self._waiters = set()
+
+    async def get_state(self):
+        state, descriptors = await self._run(self._read_state)
+        return state
+
+    async def set_volume(self, volume):
+        """Sets the volume (in percent) and unmutes, returns the new state."""
+        return await self._write(self.controller.set_volume, volume)
+
+    async def adjust(self, value):
+        """Changes the volume (in percent) and unmutes, returns the new
+        state.
+        """
+        return await self._write(self.controller.change_volume, value)
+
+    async def set_mute(self, mute):
+        """Mutes (True) or unmutes (False), returns the new state."""
+        return await self._write(self.controller.set_mute, mute)
+
+    async def toggle_mute(self):
+        return await self._write(self.controller.toggle_mute)
+
+    async def events(self):
+        """Yields the mixer state, then each new state when it changes."""
+        last_state = None
+        while True:
+            state, descriptors = await self._run(self._read_state)
+            if state != last_state:
+                yield state
+                last_state = state
+            if state['volume'] is None:
+                await asyncio.sleep(max(
+                        self.controller.handle.retry_delay(),
+                        POLL_INTERVAL,
+                        ))
+            elif descriptors:
+                await self._wait_change(descriptors)
+            else:
+                await asyncio.sleep(POLL_INTERVAL)
+
+    def close(self):
+        self._unwatch()
+        self._executor.shutdown(wait=False)
+
+    def _get_loop(self):
+        if self._loop is None:
+            #get_running_loop() is new in Python 3.7
+            self._loop = getattr(asyncio, "get_running_loop",
+                                 asyncio.get_event_loop)()
+        return self._loop
+
+    async def _run(self, function, *args):
+        return await self._get_loop().run_in_executor(
+                self._executor,
+                function,
+                *args
+                )
+
+    async def _write(self, function, *args):
+        try:
+            await self._run(function, *args)
+        finally:
+            #The write fetched the pending events of the handle: the
+            #iterators must read the state again
+            self._wake_up()
+        return await self.get_state()
+
+    def _read_state(self):
+        """Reads the state and the poll descriptors (executor thread)"""
+        handle = self.controller.handle
+        try:
+            state = self.controller.get_state()
+        except alsa_tray.alsaaudio.ALSAAudioError:
+            self._generation = None
+            return (self.controller.unavailable_state(), [])
+        if self._generation != handle.generation:
+            #(Re)opened mixer
+            self._generation = handle.generation
+            try:
+                descriptors = handle.get().polldescriptors()
+                self._descriptors = [fd for fd, events in descriptors]
+            except (AttributeError, alsa_tray.alsaaudio.ALSAAudioError):
+                self._descriptors = []
+        return (state, self._descriptors)
+
+    async def _wait_change(self, descriptors):
+        waiter = self._get_loop().create_future()
+        self._waiters.add(waiter)
+        self._watch(descriptors)
+        try:
+            await waiter
+        finally:
+            self._waiters.discard(waiter)
+
+    def _watch(self, descriptors):
+        """Registers the poll descriptors, one reader shared by all the
+        iterators.
+        """
+        if self._watched == descriptors:
+            return
+        self._unwatch()
+        loop = self._get_loop()
+        for fd in descriptors:
+            loop.add_reader(fd, self._wake_up)
+        self._watched = list(descriptors)
+
+    def _unwatch(self):
+        for fd in self._watched:
+            self._loop.remove_reader(fd)
+        self._watched = []
+
+    def _wake_up(self):
+        #The descriptors stay readable until the next read of the state:
+        #stop watching them meanwhile
+        self._unwatch()
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+
+def _read_config():
+    """Returns the (card, mixer) of the configuration file, read on the
+    first call only (the volume limits are read at the same time).
+    """
+    global _config
+    with _config_lock:
+        if _config is None:
+            controller = alsa_tray.VolumeController()
+            alsa_tray.read_config(controller)
+            _config = (controller.card, controller.mixer)
+        return _config
+
+
+def _select(controller, card, mixer):
+    """Lists the mixers of the controller registry and selects the given
+    ones (executor thread)
+    """
+    controller.registry.scan()
+    if card is None:
+        controller.card, controller.mixer = _read_config()
+        if not controller.select(controller.card, controller.mixer) and \
+           not controller.select(controller.card) and \
+           not (controller.select_default_card() and
+                controller.select(controller.card)):
+            raise alsa_tray.alsaaudio.ALSAAudioError("No usable sound card found")
+    elif not controller.select(card, mixer):
+        raise alsa_tray.alsaaudio.ALSAAudioError(
+                "Unknown or unusable mixer '%s' for card 'hw:%i'" % (
+                        mixer or "", card))
+
+
+async def open_mixer(card=None, mixer=None, loop=None):
+    """Selects a mixer and returns its AsyncMixer.
+
+    Keyword arguments:
+        * card -- the card index (default: the configured one, else the
+          first card with an usable mixer)
+        * mixer -- the mixer name (default: the configured one if card is
+          not given, else Master, PCM or the first usable mixer)
+        * loop -- the event loop (default: the running loop)
+
+    Raises alsaaudio.ALSAAudioError if there is no such card or mixer, and
+    ImportError if pyAlsaAudio is not available.
+    """
+    if alsa_tray.alsaaudio is None:
+        raise ImportError("pyAlsaAudio is not available")
+    controller = alsa_tray.VolumeController(
+            registry=alsa_tray.MixerRegistry(),
+            )
+    async_mixer = AsyncMixer(controller, loop)
+    await async_mixer._run(_select, async_mixer.controller, card, mixer)
+    return async_mixer
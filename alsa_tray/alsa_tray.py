@@ -36,6 +36,14 @@ USAGE:
     * Run in systray:
         alsa-tray, alsa-tray --tray, +tray
 
+    * Run in systray with the StatusNotifierItem protocol (KDE Plasma,
+      Xfce, LXQt, waybar...; needs dbus-python, GTK+ is only loaded for the
+      slider popup and the dialogs):
+        alsa-tray --sni, +sni
+
+    * Run without systray icon (multimedia keys and notifications only):
+        alsa-tray --daemon, +daemon
+
     * Change the volume:
         * Increase volume:
             alsa-tray +<value>
@@ -53,6 +61,22 @@ USAGE:
         * Toggle mute/Unmute
             alsa-tray mute
 
+    * Print the state of the mixer (volume, mute, channels):
+        alsa-tray --get, alsa-tray --get --json
+
+    * Print the state of the mixer each time it changes (for status bars):
+        alsa-tray --watch, alsa-tray --watch --json
+
+    * Print the state published by the running tray or daemon, without
+      touching ALSA (exits with status 10 if none is running):
+        alsa-tray --peek, alsa-tray --peek --json
+
+    * Save the volume and mute state of all the mixers of all the cards:
+        alsa-tray --save-scene=<Name>
+
+    * Restore a saved scene:
+        alsa-tray --load-scene=<Name>
+
     * Liste of available mixers:
         alsa-tray --mixer-list
 
@@ -81,6 +105,39 @@ OPTIONS:
         -notify
              Disable notifications
 
+    * Output format of --get, --watch and --peek:
+        --json
+            One JSON object per line
+
+    * Record the input events and the mixer states (see alsa_tray.trace):
+        --trace=<File>
+
+    * Profile the session (also enabled by the ALSA_TRAY_PROFILE=<File>
+      environment variable):
+        --profile=<File>
+        The profile is written at exit, or when SIGUSR1 is received, to
+        <File> (all subsystems) and <File>.<subsystem> (enumeration,
+        refresh, rendering, notification, keys, cli). It can be read with
+        'python -m pstats <File>'.
+
+    * Volume limits (configuration file only):
+        limit.<CardName>.<MixerName>=[<Floor>-]<Ceiling>
+        e.g. 'limit.PCH.Master=10-80'. The volume of the mixer is kept
+        between the floor and the ceiling, including when it is changed by
+        other programs.
+
+    * Simulated sound cards, for trying ALSA Tray without sound hardware
+      (see alsa_tray.simulated; the volume memory, the state file and the
+      scenes are kept in a temporary directory):
+        --simulated
+        --simulated=<StateFile>
+            Keep the volumes of the simulated cards in <StateFile>, shared
+            by the processes given the same file (the volume memory, the
+            mixer lock, the state file and the scenes are then kept in its
+            directory).
+        The ALSA_TRAY_SIMULATED_LATENCY=<Milliseconds> environment variable
+        sets the duration of each simulated ALSA call (default: 0).
+
     * Debug mode:
         +debug, --debug
             Enable debug mode
@@ -119,14 +176,25 @@ __website__ = "http://projects.flogisoft.com/alsa-tray/ (pyGtk)," \
 
 import sys
 import os
+import atexit
+import fcntl
+import functools
+import signal
+import json
+import tempfile
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 import gettext
-gettext.install(__appname__)
+import locale
 
 try:
     import alsaaudio
 except ImportError:
-    print("E: pyAlsaAudio is not available")
-    sys.exit(2)
+    alsaaudio = None #main() exits, unless another backend is set
 try:
     from xdg import BaseDirectory
     XDG = True
@@ -134,13 +202,11 @@ except ImportError:
     XDG = False
 try:
     import gi
-    gi.require_version("Gtk", "3.0")
-    from gi.repository import Gtk
-    from gi.repository import Gdk
     from gi.repository import GLib
-    GTK_PLUS = True
+    GLIB = True
 except ImportError:
-    GTK_PLUS = False
+    GLIB = False
+GTK_PLUS = False #GTK+ is only imported by load_gtk()
 try:
     import dbus
     from dbus.mainloop.glib import DBusGMainLoop
@@ -154,8 +220,6 @@ except ImportError:
     NOTIFY = False
 
 
-MIXER = "Master"
-CARD = 0 #hw:0
 VOL_ICON = [
         "audio-volume-high",   # > 66%
         "audio-volume-medium", # > 33%
@@ -168,31 +232,213 @@ OSD_ICON = [
         "notification-audio-volume-low",    # > 0%
         "notification-audio-volume-muted",  # = 0%
         ]
+DEGRADED_ICON = "dialog-warning" #Sound card busy or unavailable
 DEBUG = False
 CLI = False
 GUI = False
+DAEMON = False
+SNI = False #StatusNotifierItem tray icon (see alsa_tray.sni)
+PANEL = False #Show all the mixers of the card in the popup
+VOLUME_LIMITS = {} #{(card name, mixer name): (floor, ceiling)}
+TRACE = None #The alsa_tray.trace.TraceRecorder (--trace)
+PROFILER = None #The SessionProfiler (--profile)
 CLI_OPTS = {
         'volume': "+0",
         'mute': "none",
-        'notify': "none"
+        'notify': "none",
+        'query': "none",
+        'json': False,
+        'scene': None,
         }
-CARD_LIST = []
-MIXER_LIST = {}
 if XDG:
     CONFIG_FILE_PATH = os.path.join(
             BaseDirectory.save_config_path(__appname__),
             "%s.rc" % __appname__,
             )
+    SCENES_DIR_PATH = os.path.join(
+            BaseDirectory.xdg_config_home,
+            __appname__,
+            "scenes",
+            )
+    MEMORY_FILE_PATH = os.path.join(
+            BaseDirectory.xdg_config_home,
+            __appname__,
+            "volumes.json",
+            )
 else:
     CONFIG_FILE_PATH = os.path.join(
             os.environ["HOME"],
             ".%s.rc" % __appname__,
             )
+    SCENES_DIR_PATH = os.path.join(
+            os.environ["HOME"],
+            ".%s-scenes" % __appname__,
+            )
+    MEMORY_FILE_PATH = os.path.join(
+            os.environ["HOME"],
+            ".%s-volumes.json" % __appname__,
+            )
+
+if os.environ.get("XDG_RUNTIME_DIR"):
+    LOCK_FILE_PATH = os.path.join(
+            os.environ["XDG_RUNTIME_DIR"],
+            "%s.lock" % __appname__,
+            )
+else:
+    LOCK_FILE_PATH = os.path.join(
+            tempfile.gettempdir(),
+            "%s-%i.lock" % (__appname__, os.getuid()),
+            )
+STATE_FILE_PATH = None #Default: alsa_tray.statefile.get_state_file_path()
 
 
 CONFIG_GUI_PATH = "alsa_tray/alsa_tray_config.glade"
 MIXER_ICON_PATH = "pixmaps/mixer_icon.png"
 AT_ICON_PATH = "pixmaps/alsa-tray_icon.png"
+#The catalogs compiled by setup.py, else the system wide ones
+LOCALE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locale")
+HOTPLUG_DELAY = 250 #ms
+HOTPLUG_RETRIES = 3
+MIXER_LAUNCHERS = [
+        #(label, needed executables, command)
+        ("GNOME ALSA Mixer", ["/usr/bin/gnome-alsamixer"], ["gnome-alsamixer"]),
+        ("Gamix", ["/usr/bin/gamix"], ["gamix"]),
+        ("ALSA Mixer GUI", ["/usr/bin/alsamixergui"], ["alsamixergui"]),
+        ("XFCE4 Mixer", ["/usr/bin/xfce4-mixer"], ["xfce4-mixer"]),
+        ("ALSA Mixer", ["/usr/bin/alsamixer", "/usr/bin/gnome-terminal"],
+            ["terminator", "-x", "alsamixer"]),
+        ]
+_AVAILABLE_LAUNCHERS = None
+_MIXER_ICON = None
+_TRANSLATIONS = None #Loaded by the first translated message
+_LOCALE = None
+_VOLUME_TEXTS = {} #{(locale, volume, mute): text}
+
+class SessionProfiler(object):
+
+    """Profiles an ALSA Tray session with one cProfile per subsystem.
+
+    Only one subsystem is profiled at a time: a section entered while
+    another one is active (nested call or other thread) is run without
+    being profiled, its time being counted by the active section if nested.
+
+    Methods:
+        * section -- returns the context manager profiling a subsystem
+        * dump -- writes the profile files
+    """
+
+    SUBSYSTEMS = (
+            "enumeration",
+            "refresh",
+            "rendering",
+            "notification",
+            "keys",
+            "cli",
+            )
+
+    def __init__(self, path):
+        """The constructor.
+
+        Argument:
+            * path -- the path of the profile file
+        """
+        self.path = path
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def section(self, subsystem):
+        return _ProfilerSection(self, subsystem)
+
+    def dump(self):
+        """Writes the profile of each subsystem to <path>.<subsystem>, and
+        their sum to <path>.
+        """
+        #Wait for the active section, if any, to end
+        for i in range(100):
+            if self._lock.acquire(False):
+                break
+            time.sleep(0.01)
+        else:
+            print("W: Profile not written: a profiled section is running.")
+            return
+        import pstats
+        try:
+            stats = None
+            for subsystem in self.SUBSYSTEMS:
+                if subsystem not in self._profiles:
+                    continue
+                profile = self._profiles[subsystem]
+                profile.dump_stats("%s.%s" % (self.path, subsystem))
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            if stats is not None:
+                stats.dump_stats(self.path)
+                print("I: Profile written to '%s'." % self.path)
+        except (IOError, OSError) as detail:
+            print("E: Can't write the profile: %s" % detail)
+        finally:
+            self._lock.release()
+
+
+class _ProfilerSection(object):
+
+    def __init__(self, profiler, subsystem):
+        self._profiler = profiler
+        self._subsystem = subsystem
+        self._profile = None
+
+    def __enter__(self):
+        if self._profiler._lock.acquire(False):
+            self._profile = self._profiler._profiles.get(self._subsystem)
+            if self._profile is None:
+                import cProfile
+                self._profile = cProfile.Profile()
+                self._profiler._profiles[self._subsystem] = self._profile
+            self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile = None
+            self._profiler._lock.release()
+        return False
+
+
+class _NoProfilerSection(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+def profile_section(subsystem):
+    """Returns a context manager profiling the given subsystem if the
+    profiling is enabled (see SessionProfiler).
+    """
+    if PROFILER is None:
+        return _NoProfilerSection()
+    return PROFILER.section(subsystem)
+
+
+def profiled(subsystem):
+    """Decorator profiling the decorated function as part of the given
+    subsystem, if the profiling is enabled.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if PROFILER is None:
+                return function(*args, **kwargs)
+            with PROFILER.section(subsystem):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
 
 class Timer(object):
 
@@ -225,445 +471,2399 @@ class Timer(object):
     def start(self):
         """ Starts the timer """
         self._enabled = True
-        self._timer_loop()
+        if self._timer is None:
+            self._timer = GLib.timeout_add(self._interval, self._timer_loop)
+        self._callback(*self._args, **self._kwargs)
 
     def stop(self):
         """ Stops the timer """
         self._enabled = False
+        if self._timer is not None:
+            GLib.source_remove(self._timer)
+            self._timer = None
 
     def _timer_loop(self):
-        """ Main loop """
-        if self._enabled:
-            self._timer = GLib.timeout_add(self._interval, self._timer_loop)
-            self._callback(*self._args, **self._kwargs)
+        """ Main loop, the same GLib source is kept while enabled """
+        if not self._enabled:
+            self._timer = None
+            return False
+        self._callback(*self._args, **self._kwargs)
+        return True
 
 
-class MMKeys(object):
+class MixerLock(object):
 
-    """Handle multimedia keys via dbus/Hal
+    """An advisory lock shared by all the ALSA Tray processes.
 
-    This class comes originally from the Volti project
-    <http://code.google.com/p/volti/>
+    Relative volume changes are read-modify-write operations: two processes
+    (e.g. two "alsa-tray +5" spawned by a held volume key, or the CLI and
+    the tray slider) reading the same volume would lose one of the
+    changes. Holding this lock around the read and the write serializes
+    them. The mixer must be opened once the lock is held.
+
+    Usage:
+        with MixerLock():
+            mixer = controller.handle.get()
+            ...
     """
 
-    def __init__(self, main_instance):
-        """Constructor"""
-        loop = DBusGMainLoop()
-        self.main = main_instance
-        bus = dbus.SystemBus(mainloop=loop)
-        for udi in self.get_inputs():
-            obj = bus.get_object("org.freedesktop.Hal", udi)
-            iface = dbus.Interface(obj, "org.freedesktop.Hal.Device")
-            iface.connect_to_signal(
-                    "Condition",
-                    self.button_handler,
-                    path_keyword="path",
-                    )
+    def __init__(self, path=None):
+        """The constructor.
 
-    def hal_manager(self):
-        """Hal manager"""
-        bus = dbus.SystemBus()
-        obj = bus.get_object(
-                "org.freedesktop.Hal",
-                "/org/freedesktop/Hal/Manager",
-                )
-        return dbus.Interface(obj, "org.freedesktop.Hal.Manager")
+        Keyword argument:
+            * path -- the lock file path (default: LOCK_FILE_PATH)
+        """
+        self._path = path or LOCK_FILE_PATH
+        self._fd = None
 
-    def get_inputs(self):
-        """Get keys"""
-        return self.hal_manager().FindDeviceByCapability("input.keys")
+    def __enter__(self):
+        from alsa_tray.statefile import open_user_file
+        try:
+            #Never a file planted in /tmp by another user
+            self._fd = open_user_file(self._path, os.O_RDWR | os.O_CREAT)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except (IOError, OSError) as detail:
+            #Better an unserialized change than no change at all
+            if DEBUG:
+                print("W: Can't lock '%s': %s" % (self._path, detail))
+            self._close()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._close()
+        return False
 
-    def button_handler(self, sender, destination, path):
-        """Handle button events and pass them to main app"""
-        if sender == "ButtonPressed":
-            self.main.on_mmkey_pressed(destination)
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd) #Releases the lock too
+            self._fd = None
 
 
-class ALSATrayConfig(object):
+class MixerInfo(object):
 
-    """The ALSA Tray preferences dialog"""
+    """The capabilities of an usable mixer.
 
-    def __init__(self):
-        """The constructor"""
-        self.gui = Gtk.Builder()
-        self.gui.set_translation_domain(__appname__)
-        self.gui.add_from_file(CONFIG_GUI_PATH)
-        self.gui.connect_signals(self)
-        self.gui.get_object("win_config").set_icon_from_file(AT_ICON_PATH)
-        self.enabled = False #prevent error when setting the comboboxes
-        #Cards
-        cbox_card = self.gui.get_object("cbox_card")
-        lsst_card = Gtk.ListStore(str)
-        cbox_card.set_model(lsst_card)
-        cell_card = Gtk.CellRendererText()
-        cbox_card.pack_start(cell_card, True)
-        cbox_card.add_attribute(cell_card, "text", 0)
-        for card_name in CARD_LIST:
-            lsst_card.append( [MIXER_LIST[card_name]['pretty_name']] )
-        cbox_card.set_active(CARD)
-        #Mixer
-        self.cbox_mixer = self.gui.get_object("cbox_mixer")
-        self.lsst_mixer = Gtk.ListStore(str)
-        self.cbox_mixer.set_model(self.lsst_mixer)
-        cell_mixer = Gtk.CellRendererText()
-        self.cbox_mixer.pack_start(cell_mixer, True)
-        self.cbox_mixer.add_attribute(cell_mixer, "text", 0)
-        self._set_mixer_list()
-        self.enabled = True
+    They are read once when the cards are listed, so that they can be
+    checked without querying ALSA (or catching its errors) on each call.
 
-    def _set_mixer_list(self):
-        self.lsst_mixer.clear()
-        for mixer_name in MIXER_LIST[CARD_LIST[CARD]]['mixers']:
-            self.lsst_mixer.append( [mixer_name] )
-        self.cbox_mixer.set_active(MIXER_LIST[CARD_LIST[CARD]]['mixers'].index(MIXER))
+    Attributes:
+        * card -- the card index
+        * name -- the mixer name
+        * volumecap -- the volume capabilities (alsaaudio volumecap())
+        * switchcap -- the switch capabilities (alsaaudio switchcap())
+        * channels -- the number of channels
+        * volume_range -- the (min, max) raw volume range
+        * has_mute -- True if the mixer have a playback switch
+    """
 
-    def on_cbox_card_changed(self, widget):
-        if not self.enabled:
-            return #prevent error when setting the comboboxes
-        if len(MIXER_LIST[CARD_LIST[widget.get_active()]]['mixers']) > 0:
-            global CARD
-            CARD = widget.get_active()
-            select_default_mixer(CARD)
-            self._set_mixer_list()
-            write_config()
-            self.cbox_mixer.set_sensitive(True)
-        else:
-            self.cbox_mixer.set_sensitive(False)
-            self.lsst_mixer.clear()
+    def __init__(self, card, name, mixer):
+        """The constructor.
 
-    def on_cbox_mixer_changed(self, widget):
-        if not self.enabled or not self.cbox_mixer.get_sensitive():
-            return #prevent error when setting the comboboxes
-        global MIXER
-        MIXER = MIXER_LIST[CARD_LIST[CARD]]['mixers'][widget.get_active()]
-        write_config()
+        Arguments:
+            * card -- the card index
+            * name -- the mixer name
+            * mixer -- an alsaaudio.Mixer opened on this mixer
+        """
+        self.card = card
+        self.name = name
+        self.volumecap = mixer.volumecap()
+        self.switchcap = mixer.switchcap()
+        self.channels = len(mixer.getvolume())
+        self.volume_range = tuple(mixer.getrange())
+        self.has_mute = False
+        for cap in self.switchcap:
+            if cap in ("Mute", "Joined Mute", "Playback Mute",
+                       "Joined Playback Mute"):
+                self.has_mute = True
+
+
+class CardInfo(object):
+
+    """A sound card and its usable mixers.
+
+    Attributes:
+        * index -- the card index
+        * name -- the card name
+        * pretty_name -- the name displayed to the user
+        * mixers -- the usable mixers names, in ALSA order
+    """
 
-    def on_btn_close_clicked(self, widget):
-        self.gui.get_object("win_config").destroy()
+    def __init__(self, index, name):
+        self.index = index
+        self.name = name
+        self.pretty_name = "%s (hw:%i)" % (name, index)
+        self.mixers = []
+        self._mixers = {}
 
+    def add_mixer(self, info):
+        self._mixers[info.name] = (len(self.mixers), info)
+        self.mixers.append(info.name)
 
+    def get_mixer(self, mixer_name):
+        """Returns the MixerInfo of the given mixer, None if not usable"""
+        if mixer_name in self._mixers:
+            return self._mixers[mixer_name][1]
+        return None
 
-class ALSATray(object):
+    def mixer_index(self, mixer_name):
+        """Returns the position of the given mixer in the mixers list"""
+        return self._mixers[mixer_name][0]
 
-    """The Alsa Volume tray icon"""
+
+class MixerRegistry(object):
+
+    """The available cards and their usable mixers.
+
+    Cards are indexed by index and by name, mixers by (card, name).
+
+    Methods:
+        * scan -- list the cards and mixers
+        * get_card -- get a card by index
+        * get_card_by_name -- get a card by name
+        * get_mixer -- get a mixer by card index and name
+    """
 
     def __init__(self):
-        self.handle_menu_mute = True
-        #### Widgets ####
-        #Tray icon
-        self.tray_icon = Gtk.StatusIcon()
-        #Slider
-        self.slider = Gtk.VScale()
-        self.slider.set_inverted(True)
-        self.slider.set_range(0, 100)
-        self.slider.set_increments(1, 10)
-        self.slider.set_digits(0)
-        self.slider.set_size_request(30, 150)
-        self.slider.set_value_pos(Gtk.PositionType.BOTTOM)
-        #Window
-        self.window = Gtk.Window(type=Gtk.WindowType.TOPLEVEL)
-        self.window.set_decorated(False)
-        self.window.set_skip_taskbar_hint(True)
-        self.window.set_skip_pager_hint(True)
-        self.window.set_border_width(3)
-        self.window.add(self.slider)
-        #Menu
-        self.menu_mute = Gtk.CheckMenuItem(label=_("Mute"))
-        #
-        menu_separator0 = Gtk.MenuItem()
-        #
-        menu_mixer0 = Gtk.ImageMenuItem(label="GNOME ALSA Mixer")
-        menu_mixer0_img = Gtk.Image()
-        menu_mixer0_img.set_from_file(MIXER_ICON_PATH)
-        menu_mixer0.set_always_show_image(True)
-        menu_mixer0.set_image(menu_mixer0_img)
-        #
-        menu_mixer_1 = Gtk.MenuItem()
-        menu_mixer_1_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
-        menu_mixer_1_box.set_homogeneous(False)
-        menu_mixer_1_label = Gtk.Label("ALSA Mixer")
-        menu_mixer_1_img = Gtk.Image()
-        menu_mixer_1_img.set_from_file(MIXER_ICON_PATH)
-        menu_mixer_1_box.pack_start(menu_mixer_1_img, False, False, 0)
-        menu_mixer_1_box.pack_start(menu_mixer_1_label, False, False, 0)
-        menu_mixer_1.add(menu_mixer_1_box)
-
-        menu_mixer1 = Gtk.ImageMenuItem(label="ALSA Mixer")
-        menu_mixer1_img = Gtk.Image()
-        menu_mixer1_img.set_from_file(MIXER_ICON_PATH)
-        menu_mixer1.set_always_show_image(True)
-        menu_mixer1.set_image(menu_mixer1_img)
-        #
-        menu_mixer2 = Gtk.ImageMenuItem(label="XFCE4 Mixer")
-        menu_mixer2_img = Gtk.Image()
-        menu_mixer2_img.set_from_file(MIXER_ICON_PATH)
-        menu_mixer2.set_always_show_image(True)
-        menu_mixer2.set_image(menu_mixer2_img)
-        #
-        menu_mixer3 = Gtk.ImageMenuItem(label="Gamix")
-        menu_mixer3_img = Gtk.Image()
-        menu_mixer3_img.set_from_file(MIXER_ICON_PATH)
-        menu_mixer3.set_always_show_image(True)
-        menu_mixer3.set_image(menu_mixer3_img)
-        #
-        menu_mixer4 = Gtk.ImageMenuItem(label="ALSA Mixer GUI")
-        menu_mixer4_img = Gtk.Image()
-        menu_mixer4_img.set_from_file(MIXER_ICON_PATH)
-        menu_mixer4.set_always_show_image(True)
-        menu_mixer4.set_image(menu_mixer4_img)
-        #
-        menu_separator1 = Gtk.MenuItem()
-        #
-        menu_preferences = Gtk.ImageMenuItem(label=Gtk.STOCK_PREFERENCES)
-        #
-        menu_separator2 = Gtk.MenuItem()
-        #
-        menu_about = Gtk.ImageMenuItem(label=Gtk.STOCK_ABOUT)
-        #
-        menu_quit = Gtk.ImageMenuItem(label=Gtk.STOCK_QUIT)
-        #
-        self.menu = Gtk.Menu()
-        self.menu.append(self.menu_mute)
-        self.menu.append(menu_separator0)
-        show_separator1 = False
-        if os.path.isfile("/usr/bin/gnome-alsamixer"):
-            self.menu.append(menu_mixer0)
-            show_separator1 = True
-        if os.path.isfile("/usr/bin/gamix"):
-            self.menu.append(menu_mixer3)
-            show_separator1 = True
-        if os.path.isfile("/usr/bin/alsamixergui"):
-            self.menu.append(menu_mixer4)
-            show_separator1 = True
-        if os.path.isfile("/usr/bin/xfce4-mixer"):
-            self.menu.append(menu_mixer2)
-            show_separator1 = True
-        if os.path.isfile("/usr/bin/alsamixer") and \
-           os.path.isfile("/usr/bin/gnome-terminal"):
-            self.menu.append(menu_mixer1)
-            self.menu.append(menu_mixer_1)
-            show_separator1 = True
-        if show_separator1:
-            self.menu.append(menu_separator1)
-        self.menu.append(menu_preferences)
-        self.menu.append(menu_separator2)
-        self.menu.append(menu_about)
-        self.menu.append(menu_quit)
-        #### Signals ####
-        #Tray icon
-        self.tray_icon.connect("activate", self.on_tray_icon_activate)
-        self.tray_icon.connect(
-                "button-release-event",
-                self.on_tray_icon_button_release_event,
-                )
-        self.tray_icon.connect("scroll-event", self.on_tray_icon_scroll_event)
-        self.tray_icon.connect("popup-menu", self.on_tray_icon_popup_menu)
-        #Slider
-        self.slider.connect("value-changed", self.on_slider_value_changed)
-        #Window
-        self.window.connect("focus-out-event", self.on_window_focus_out_event)
-        #### MM Keys ####
-        if DBUS:
+        self.cards = []
+        self._cards_by_name = {}
+
+    def scan(self):
+        """List all the available cards and all the usable mixers of each
+        card.
+
+        The previous lists stay in use until the scan is done, so that the
+        registry can be rescanned outside of the main loop.
+        """
+        cards = []
+        cards_by_name = {}
+        for index, card_name in enumerate(alsaaudio.cards()):
+            card = CardInfo(index, card_name)
+            cards.append(card)
+            cards_by_name.setdefault(card_name, card)
             try:
-                MMKeys(self)
-            except dbus.exceptions.DBusException as detail:
-                if DEBUG:
-                    print("W: Multimedia key support non available:\n%s" % detail)
-                else:
-                    print("W: Multimedia key support non available...")
-        #Menu
-        self.menu_mute.connect("activate", self.on_menu_mute_activate)
-        menu_mixer0.connect(
-                "activate",
-                self.on_menu_mixer_activate,
-                "gnome-alsamixer &",
-                )
-        menu_mixer1.connect(
-                "activate",
-                self.on_menu_mixer_activate,
-                "terminator -x alsamixer &",
-                )
-        menu_mixer2.connect(
-                "activate",
-                self.on_menu_mixer_activate,
-                "xfce4-mixer &",
-                )
-        menu_mixer3.connect(
-                "activate",
-                self.on_menu_mixer_activate,
-                "gamix &",
+                for mixer_name in alsaaudio.mixers(index):
+                    mixer = alsaaudio.Mixer(control=mixer_name, cardindex=index)
+                    volumecap = mixer.volumecap()
+                    if len(volumecap) > 0 and volumecap[0] in \
+                        ("Volume", "Playback Volume", "Joined Playback Volume"):
+                        try:
+                            card.add_mixer(MixerInfo(index, mixer_name, mixer))
+                        except alsaaudio.ALSAAudioError:
+                            pass
+            except alsaaudio.ALSAAudioError:
+                pass
+        self.cards, self._cards_by_name = cards, cards_by_name
+
+    def get_card(self, card):
+        """Returns the CardInfo of the given card index, None if unknown"""
+        if 0 <= card < len(self.cards):
+            return self.cards[card]
+        return None
+
+    def get_card_by_name(self, card_name):
+        """Returns the CardInfo of the given card name, None if unknown"""
+        return self._cards_by_name.get(card_name)
+
+    def get_mixer(self, card, mixer_name):
+        """Returns the MixerInfo of the given mixer of the given card index,
+        None if unknown or unusable.
+        """
+        card_info = self.get_card(card)
+        if card_info is None:
+            return None
+        return card_info.get_mixer(mixer_name)
+
+
+REGISTRY = MixerRegistry()
+
+
+class ScrollAccumulator(object):
+
+    """Merges the scroll events into one volume change per frame.
+
+    Mouse wheels send one event per notch, touchpads many small smooth
+    deltas per gesture. The deltas (in notches) are summed and applied once
+    per frame, the fractional part being carried over to the next frame.
+    Fast scrolling is accelerated: above ACCEL_THRESHOLD notches per
+    second, the step grows with the speed, up to ACCEL_MAX times.
+    """
+
+    ACCEL_THRESHOLD = 10.0 #notches/s
+    ACCEL_MAX = 4.0
+    GESTURE_TIMEOUT = 0.3 #s without event ends a gesture
+
+    def __init__(self, callback, step=5, frame=16):
+        """The constructor.
+
+        Arguments:
+            * callback -- the function called with the volume delta (in
+              percent) at most once per frame
+        Keyword arguments:
+            * step -- the volume delta of one notch (in percent)
+            * frame -- the frame duration (in milliseconds)
+        """
+        self._callback = callback
+        self._step = step
+        self._frame = frame
+        self._notches = 0.0
+        self._remainder = 0.0
+        self._speed = 0.0
+        self._direction = 0 #The sign of the last delta
+        self._last_event = None
+        self._source = None
+
+    def add(self, notches):
+        """Adds a scroll delta.
+
+        Argument:
+            * notches -- the delta in notches, positive for scrolling up
+        """
+        if notches == 0:
+            return
+        #The raw events, the replay feeds them to an accumulator
+        trace_event("scroll", notches=notches)
+        now = time.time()
+        direction = 1 if notches > 0 else -1
+        if self._last_event is None or \
+           now - self._last_event > self.GESTURE_TIMEOUT or \
+           direction != self._direction:
+            #New gesture or direction change
+            self._speed = 0.0
+            self._remainder = 0.0
+        else:
+            elapsed = max(now - self._last_event, 0.001)
+            self._speed = 0.7 * self._speed + 0.3 * abs(notches) / elapsed
+        self._direction = direction
+        self._last_event = now
+        self._notches += notches
+        if self._source is None:
+            self._source = GLib.timeout_add(self._frame, self._flush)
+
+    def _flush(self):
+        self._source = None
+        factor = min(
+                self.ACCEL_MAX,
+                max(1.0, self._speed / self.ACCEL_THRESHOLD),
                 )
-        menu_mixer4.connect(
-                "activate",
-                self.on_menu_mixer_activate,
-                "alsamixergui &",
+        value = self._notches * self._step * factor + self._remainder
+        delta = int(value)
+        self._remainder = value - delta
+        self._notches = 0.0
+        if delta != 0:
+            self._callback(delta)
+        return False
+
+
+class MixerHandle(object):
+
+    """A self-healing handle on the selected mixer of a VolumeController.
+
+    The alsaaudio.Mixer is opened once and reused. When using it fails
+    (card unplugged, driver error...), fail() marks the handle dead: get()
+    then raises at once without touching ALSA until the next retry, the
+    delay between two retries doubling up to max_delay. The first
+    successful reopen resets the delay, and retry_now() allows to reopen
+    immediately (e.g. when a sound device is plugged).
+
+    Methods:
+        * get -- returns the alsaaudio.Mixer of the selected mixer
+        * fail -- marks the handle dead
+        * retry_now -- allows the next get() to reopen the mixer
+        * retry_delay -- seconds before the next allowed reopen
+
+    Attributes:
+        * dead -- True while the mixer is unavailable
+        * generation -- incremented each time the mixer is (re)opened
+    """
+
+    def __init__(self, controller, min_delay=0.5, max_delay=30.0):
+        """The constructor.
+
+        Argument:
+            * controller -- the VolumeController whose mixer is opened
+
+        Keyword arguments:
+            * min_delay -- the first retry delay (in seconds)
+            * max_delay -- the maximum retry delay (in seconds)
+        """
+        self.dead = False
+        self._controller = controller
+        self.generation = 0
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._delay = min_delay
+        self._retry_at = 0
+        self._mixer = None
+        self._key = None
+
+    def get(self):
+        """Returns the alsaaudio.Mixer of the selected card and mixer.
+
+        Raises alsaaudio.ALSAAudioError if the mixer is unavailable.
+        """
+        key = (self._controller.card, self._controller.mixer)
+        if self._mixer is not None and self._key == key and \
+           hasattr(self._mixer, "handleevents"):
+            #Fetch the changes made by the other processes
+            self._mixer.handleevents()
+            return self._mixer
+        if self.dead and time.time() < self._retry_at:
+            raise alsaaudio.ALSAAudioError(
+                    "Mixer unavailable, next retry in %.1f s" % self.retry_delay())
+        try:
+            self._mixer = alsaaudio.Mixer(control=key[1], cardindex=key[0])
+        except alsaaudio.ALSAAudioError as detail:
+            self._mixer = None
+            self._set_dead(detail)
+            raise
+        self._key = key
+        self.generation += 1
+        if self.dead and DEBUG:
+            print("I: Mixer '%s' of 'hw:%i' available again." % (key[1], key[0]))
+        self.dead = False
+        self._delay = self._min_delay
+        return self._mixer
+
+    def fail(self, detail=None):
+        """Marks the handle dead after an ALSA error.
+
+        Keyword argument:
+            * detail -- the error
+        """
+        if self._mixer is None:
+            return #get() failed, already handled
+        self._mixer = None
+        self._set_dead(detail)
+
+    def retry_now(self):
+        self._retry_at = 0
+
+    def retry_delay(self):
+        return max(0, self._retry_at - time.time())
+
+    def _set_dead(self, detail):
+        if self.dead:
+            self._delay = min(self._delay * 2, self._max_delay)
+        else:
+            #Only the first error of an outage is reported
+            if DEBUG:
+                print("W: Mixer '%s' of 'hw:%i' unavailable: %s" % (
+                        self._controller.mixer, self._controller.card, detail))
+            self.dead = True
+        self._retry_at = time.time() + self._delay
+
+
+class VolumeController(object):
+
+    """The volume control of one mixer of one sound card.
+
+    Owns the card and mixer selection, the MixerHandle of the selected
+    mixer and the volume logic (clamping, unmuting on volume changes,
+    mixers without mute switch). Any number of controllers can be used in
+    the same process; the tray, the daemon and the CLI are clients of the
+    one of the application, CONTROLLER.
+
+    The methods doing mixer I/O raise alsaaudio.ALSAAudioError if the mixer
+    is unavailable, the handle being marked dead (see MixerHandle).
+
+    Methods:
+        * select -- select a card and a mixer
+        * select_default_card -- select the first card with an usable mixer
+        * select_default_mixer -- select the default mixer of the card
+        * get_info -- returns the MixerInfo of the selected mixer
+        * clamp -- clamp a volume in the limits of the mixer
+        * read -- read the volume and the mute state
+        * get_state -- read the state dict (see print_state())
+        * unavailable_state -- the state dict of an unavailable mixer
+        * update -- change the volume and/or the mute state
+        * change_volume -- change the volume and unmute
+        * set_volume -- set the volume and unmute
+        * set_mute -- mute/unmute
+        * toggle_mute -- mute/unmute
+
+    Attributes:
+        * card -- the selected card index
+        * mixer -- the selected mixer name
+        * handle -- the MixerHandle of the selected mixer
+        * registry -- the MixerRegistry the selection is checked against
+    """
+
+    def __init__(self, card=0, mixer="Master", registry=None):
+        """The constructor.
+
+        Keyword arguments:
+            * card -- the card index (default: hw:0)
+            * mixer -- the mixer name (default: Master)
+            * registry -- the MixerRegistry (default: REGISTRY)
+        """
+        self.card = card
+        self.mixer = mixer
+        self.registry = registry or REGISTRY
+        self.handle = MixerHandle(self)
+
+    def select(self, card, mixer=None):
+        """Selects a card and one of its mixers.
+
+        Arguments:
+            * card -- the card index
+            * mixer -- the mixer name (default: see select_default_mixer())
+
+        Returns:
+            True if the mixer is usable, False else (the selection is then
+            unchanged).
+        """
+        card_info = self.registry.get_card(card)
+        if card_info is None or len(card_info.mixers) == 0:
+            return False
+        if mixer is not None and card_info.get_mixer(mixer) is None:
+            return False
+        self.card = card
+        if mixer is None:
+            self.select_default_mixer()
+        else:
+            self.mixer = mixer
+        self.handle.retry_now()
+        return True
+
+    def select_default_card(self):
+        """Selects the first card that haves an usable mixer.
+
+        Returns:
+            True if a card was found, False else.
+        """
+        for card_info in self.registry.cards:
+            if len(card_info.mixers) > 0:
+                self.card = card_info.index
+                return True
+        return False
+
+    def select_default_mixer(self):
+        """Selects the default mixer of the selected card.
+
+        If 'Master' available, select it, else select PCM if available, else
+        select the first usable mixer.
+
+        Returns:
+            True if a mixer was found, False else.
+        """
+        card_info = self.registry.get_card(self.card)
+        if card_info is None or len(card_info.mixers) == 0:
+            return False
+        if card_info.get_mixer("Master") is not None:
+            self.mixer = "Master"
+        elif card_info.get_mixer("PCM") is not None:
+            self.mixer = "PCM"
+        else:
+            self.mixer = card_info.mixers[0]
+        return True
+
+    def get_info(self):
+        return self.registry.get_mixer(self.card, self.mixer)
+
+    def clamp(self, volume):
+        """Returns the volume clamped in the limits of the selected mixer
+        (0-100 by default, see VOLUME_LIMITS).
+        """
+        card_info = self.registry.get_card(self.card)
+        if card_info is None:
+            return limit_volume(None, self.mixer, volume)
+        return limit_volume(card_info.name, self.mixer, volume)
+
+    def read(self):
+        """Returns the (volume, mute) of the selected mixer."""
+        channels, mute = self.read_channels()
+        return (channels[0], mute)
+
+    def read_channels(self):
+        """Returns the (volume of each channel, mute) of the selected
+        mixer.
+        """
+        try:
+            mixer = self.handle.get()
+            return (mixer.getvolume(), get_mute(mixer, self.get_info()))
+        except alsaaudio.ALSAAudioError as detail:
+            self.handle.fail(detail)
+            raise
+
+    def limit_channels(self):
+        """Clamps the volume of each channel of the selected mixer in its
+        limits, keeping the balance of the channels in the limits.
+
+        Returns:
+            The volume of each channel.
+        """
+        try:
+            with MixerLock():
+                mixer = self.handle.get()
+                channels = mixer.getvolume()
+                for channel, volume in enumerate(channels):
+                    limited = self.clamp(volume)
+                    if limited != volume:
+                        mixer.setvolume(limited, channel)
+                        channels[channel] = limited
+        except alsaaudio.ALSAAudioError as detail:
+            self.handle.fail(detail)
+            raise
+        return channels
+
+    def get_state(self):
+        """Returns the state of the selected mixer.
+
+        Returns:
+            A dict with the card, mixer, volume, mute and channels (the
+            volume of each channel) keys.
+        """
+        try:
+            mixer = self.handle.get()
+            channels = mixer.getvolume()
+            mute = get_mute(mixer, self.get_info())
+        except alsaaudio.ALSAAudioError as detail:
+            self.handle.fail(detail)
+            raise
+        return {
+                'card': "hw:%i" % self.card,
+                'mixer': self.mixer,
+                'volume': channels[0],
+                'mute': mute,
+                'channels': channels,
+                }
+
+    def unavailable_state(self):
+        return {
+                'card': "hw:%i" % self.card,
+                'mixer': self.mixer,
+                'volume': None,
+                'mute': None,
+                'channels': [],
+                }
+
+    def update(self, volume=None, delta=0, mute=None, toggle=False):
+        """Changes the volume and/or the mute state of the selected mixer.
+
+        The read and the writes are done in one MixerLock, so that the
+        changes of other processes are not lost.
+
+        Keyword arguments:
+            * volume -- the new volume (in percent), None for keeping it
+            * delta -- the volume change (in percent), added to volume
+            * mute -- True for muting, False for unmuting, None for keeping
+              the mute state
+            * toggle -- toggle the mute state (after applying mute)
+
+        Returns:
+            The new (volume, mute) tuple.
+        """
+        info = self.get_info()
+        try:
+            with MixerLock():
+                mixer = self.handle.get()
+                if volume is None:
+                    volume = mixer.getvolume()[0]
+                    if delta != 0:
+                        volume = self.clamp(volume + delta)
+                        mixer.setvolume(volume)
+                else:
+                    volume = self.clamp(volume + delta)
+                    mixer.setvolume(volume)
+                if toggle:
+                    if mute is None:
+                        mute = get_mute(mixer, info)
+                    mute = not mute
+                if mute is None:
+                    mute = get_mute(mixer, info)
+                else:
+                    set_mute(mixer, mute, info)
+                    if info is None:
+                        mute = get_mute(mixer, info) #Unknown capabilities
+                    else:
+                        mute = mute and info.has_mute
+        except alsaaudio.ALSAAudioError as detail:
+            self.handle.fail(detail)
+            raise
+        return (volume, mute)
+
+    def change_volume(self, value):
+        """Changes the volume (in percent) and unmutes.
+
+        Returns:
+            The new (volume, mute) tuple.
+        """
+        return self.update(delta=value, mute=False)
+
+    def set_volume(self, volume):
+        """Sets the volume (in percent) and unmutes.
+
+        Returns:
+            The new (volume, mute) tuple.
+        """
+        return self.update(volume=volume, mute=False)
+
+    def set_mute(self, mute):
+        return self.update(mute=mute)
+
+    def toggle_mute(self):
+        return self.update(toggle=True)
+
+
+class VolumeGuard(object):
+
+    """Keeps the volume of the mixer of a VolumeController in its limits.
+
+    check() is called with the channels volumes read after a mixer event,
+    so that the changes made by other programs are corrected at once. The
+    corrective writes are at least interval milliseconds apart: a volume
+    out of the limits during that time is corrected by a single delayed
+    recheck, so that a program fighting the limits can't make ALSA Tray
+    flood the mixer. A corrected volume being in the limits, the write
+    itself never triggers another one.
+
+    Methods:
+        * check -- correct the volume if needed
+    """
+
+    def __init__(self, controller, recheck, interval=100):
+        """The constructor.
+
+        Arguments:
+            * controller -- the VolumeController
+            * recheck -- the function reading the volume again (called in
+              the GLib main loop)
+
+        Keyword argument:
+            * interval -- the minimum delay between two corrective writes
+              (in milliseconds)
+        """
+        self._controller = controller
+        self._recheck = recheck
+        self._interval = interval / 1000.0
+        self._last_write = 0
+        self._recheck_source = None
+        self._lock = threading.Lock()
+
+    def check(self, channels):
+        """Corrects the volume of the channels out of the limits, the other
+        channels are left untouched.
+
+        Argument:
+            * channels -- the volume of each channel read
+
+        Returns:
+            The volume of the mixer (its first channel) after the
+            correction.
+        """
+        volume = channels[0]
+        if self._controller.clamp(max(channels)) == max(channels) and \
+           self._controller.clamp(min(channels)) == min(channels):
+            return volume
+        with self._lock:
+            wait = self._last_write + self._interval - time.time()
+            if wait > 0:
+                if self._recheck_source is None and GLIB:
+                    self._recheck_source = GLib.timeout_add(
+                            int(wait * 1000) + 1,
+                            self._on_recheck_timeout,
+                            )
+                return volume
+            self._last_write = time.time()
+        try:
+            channels = self._controller.limit_channels()
+        except alsaaudio.ALSAAudioError:
+            return volume
+        if DEBUG:
+            print("I: Volume out of limits, set to %s%%." % (
+                    ",".join(["%i" % volume for volume in channels])))
+        return channels[0]
+
+    def _on_recheck_timeout(self):
+        with self._lock:
+            self._recheck_source = None
+        self._recheck()
+        return False
+
+
+CONTROLLER = VolumeController()
+
+
+class VolumeMemory(object):
+
+    """The last known volume and mute state of the mixers of each card.
+
+    Cards are identified by name (their index can change between two
+    plugs), so that the state of a card that the kernel resets when it is
+    replugged (e.g. USB headsets) can be restored. The states are kept in a
+    {card name: {mixer name: [[volume of each channel], mute]}} dict, saved
+    as JSON at most once per save delay and at exit. Every mixer observed
+    is recorded: the mixer of the tray or of the daemon, and the mixers
+    shown in the mixers panel.
+
+    Methods:
+        * remember -- record the state of a mixer
+        * update_cards -- returns the cards that appeared since the last call
+        * restore -- restore the recorded states of a card
+        * save -- write the pending changes
+
+    Usage:
+        for card_info in MEMORY.update_cards(REGISTRY):
+            MEMORY.restore(card_info)
+    """
+
+    def __init__(self, path=None, delay=2000):
+        """The constructor.
+
+        Keyword arguments:
+            * path -- the file path (default: MEMORY_FILE_PATH)
+            * delay -- the save delay (in milliseconds)
+        """
+        self._path = path or MEMORY_FILE_PATH
+        self._delay = delay
+        self._states = None
+        self._cards = None
+        self._dirty = False
+        self._save_source = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._states is not None:
+            return
+        self._states = {}
+        try:
+            memory_file = open(self._path, "r")
+            try:
+                states = json.load(memory_file)
+            finally:
+                memory_file.close()
+        except (IOError, OSError, ValueError):
+            return
+        if not isinstance(states, dict):
+            return
+        #Drop the entries of hand-edited or older files
+        for card_name, mixers in states.items():
+            if not isinstance(mixers, dict):
+                continue
+            mixers = dict([(mixer_name, state) for mixer_name, state in mixers.items()
+                           if _is_memory_state(state)])
+            for state in mixers.values():
+                if not isinstance(state[0], list):
+                    state[0] = [state[0]] #Older files: one volume
+            if len(mixers) > 0:
+                self._states[card_name] = mixers
+
+    def remember(self, card_name, mixer_name, volumes, mute):
+        """Records the state of a mixer.
+
+        The states of a card are ignored until it have been seen by
+        update_cards(), so that the state of a card reset by the kernel
+        is not recorded before being restored.
+
+        Arguments:
+            * card_name -- the card name
+            * mixer_name -- the mixer name
+            * volumes -- the volume of each channel (in percent)
+            * mute -- the mute state
+        """
+        with self._lock:
+            if self._cards is None or card_name not in self._cards:
+                return
+            self._load()
+            state = [list(volumes), bool(mute)]
+            mixers = self._states.setdefault(card_name, {})
+            if mixers.get(mixer_name) == state:
+                return
+            mixers[mixer_name] = state
+            self._dirty = True
+            if self._save_source is None and GLIB:
+                self._save_source = GLib.timeout_add(self._delay, self._on_save_timeout)
+
+    def update_cards(self, registry):
+        """Returns the list of the CardInfo of the cards that appeared since
+        the last call (none on the first call).
+
+        Argument:
+            * registry -- the MixerRegistry, already scanned
+        """
+        cards = set([card_info.name for card_info in registry.cards])
+        with self._lock:
+            previous_cards = self._cards
+            self._cards = cards
+        if previous_cards is None:
+            return []
+        return [card_info for card_info in registry.cards
+                if card_info.name not in previous_cards]
+
+    def restore(self, card_info):
+        """Restores the recorded states of the mixers of a card.
+
+        Only the mixers whose state differs are written, all in one
+        MixerLock.
+
+        Argument:
+            * card_info -- the CardInfo of the card
+
+        Returns:
+            The number of mixers changed.
+        """
+        with self._lock:
+            self._load()
+            mixers = dict(self._states.get(card_info.name, {}))
+        changed = 0
+        if len(mixers) == 0:
+            return changed
+        with MixerLock():
+            for mixer_name, (volumes, mute) in mixers.items():
+                info = card_info.get_mixer(mixer_name)
+                if info is None:
+                    continue
+                if len(volumes) == 1:
+                    volumes = volumes * info.channels
+                try:
+                    mixer = alsaaudio.Mixer(control=mixer_name, cardindex=info.card)
+                    if _restore_mixer_state(
+                            mixer,
+                            card_info.name,
+                            info,
+                            volumes,
+                            mute,
+                            ):
+                        changed += 1
+                except alsaaudio.ALSAAudioError as detail:
+                    print("W: Can't restore '%s' of '%s': %s" % (
+                            mixer_name, card_info.name, detail))
+        if DEBUG:
+            print("I: Card '%s' restored (%i mixers changed)." % (
+                    card_info.name, changed))
+        return changed
+
+    def save(self):
+        """Writes the pending changes (atomically)"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._states, sort_keys=True, separators=(",", ":"))
+            self._dirty = False
+        try:
+            directory = os.path.dirname(self._path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            temp_path = "%s.tmp" % self._path
+            memory_file = open(temp_path, "w")
+            try:
+                memory_file.write(data)
+            finally:
+                memory_file.close()
+            os.rename(temp_path, self._path)
+        except (IOError, OSError) as detail:
+            print("W: Can't save the volumes: %s" % detail)
+
+    def _on_save_timeout(self):
+        self._save_source = None
+        self.save()
+        return False
+
+
+def _is_memory_state(state):
+    """Checks a [[volume of each channel], mute] state of the volume memory
+    file (or [volume, mute], in older files)
+    """
+    if not isinstance(state, list) or len(state) != 2 or \
+       not isinstance(state[1], bool):
+        return False
+    volumes = state[0]
+    if not isinstance(volumes, list):
+        volumes = [volumes]
+    return len(volumes) > 0 and all([
+            isinstance(volume, int) and not isinstance(volume, bool) and
+            0 <= volume <= 100 for volume in volumes])
+
+
+MEMORY = VolumeMemory()
+atexit.register(MEMORY.save)
+
+
+class MixerWorker(threading.Thread):
+
+    """Runs the mixer I/O of the tray outside of the GTK+ main loop.
+
+    The GTK+ callbacks only queue commands. The worker merges all the
+    pending ones (volume changes are summed, an absolute volume overrides
+    the previous changes, the state is read once) and posts the resulting
+    mixer state back to the main loop with GLib.idle_add(), so that a slow
+    or wedged sound card never blocks the user interface.
+
+    Methods:
+        * read -- read the mixer state
+        * adjust -- change the volume
+        * set_volume -- set the volume
+        * toggle_mute -- mute/unmute
+        * call -- run any function in the worker
+        * is_busy -- check if the sound card stopped answering
+
+    Attributes:
+        * queued -- the number of commands queued (from the main loop)
+        * done -- the number of commands whose resulting state was passed
+          to the callback
+    """
+
+    def __init__(self, controller, callback):
+        """The constructor.
+
+        Arguments:
+            * controller -- the VolumeController
+            * callback -- function called in the main loop with the volume
+              and the mute state after each batch of commands (both None
+              if the mixer is unavailable)
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._controller = controller
+        self._callback = callback
+        self._queue = queue.Queue()
+        self._busy_since = None
+        self._guard = VolumeGuard(controller, self.read)
+        self._generation = None
+        #The poll descriptors of the mixer, set before posting the state
+        self.event_fds = []
+        self.queued = 0
+        self.done = 0
+
+    def read(self):
+        self._put(("read",))
+
+    def adjust(self, value, do_notify=False):
+        self._put(("adjust", value, do_notify))
+
+    def set_volume(self, volume):
+        self._put(("set", volume))
+
+    def toggle_mute(self, do_notify=False):
+        self._put(("mute", do_notify))
+
+    def call(self, function, *args):
+        self._put(("call", function, args))
+
+    def _put(self, command):
+        self.queued += 1
+        self._queue.put(command)
+
+    def is_busy(self, timeout=2.0):
+        """Check if the sound card stopped answering.
+
+        Keyword argument:
+            * timeout -- the maximum duration of a batch (in seconds)
+
+        Returns:
+            True if the current batch of commands lasts for more than
+            timeout seconds, False else.
+        """
+        busy_since = self._busy_since
+        return busy_since is not None and time.time() - busy_since > timeout
+
+    def run(self):
+        while True:
+            commands = [self._queue.get()]
+            while True:
+                try:
+                    commands.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._busy_since = time.time()
+            try:
+                state = self._run_batch(commands)
+            except Exception:
+                #A failing call must not stop the mixer I/O: the state is
+                #read again by the next batch (e.g. on the next timer tick).
+                #Reported through sys.excepthook, like the exceptions of
+                #the GLib callbacks (see alsa_tray.soak --failure-rate)
+                print("E: Error in the mixer worker:")
+                sys.excepthook(*sys.exc_info())
+                self._generation = None
+                self.event_fds = []
+                state = (None, None, False)
+            finally:
+                self._busy_since = None
+            GLib.idle_add(self._post_state, len(commands), *state)
+
+    @profiled("refresh")
+    def _run_batch(self, commands):
+        """Runs a batch of commands and reads the mixer state.
+
+        Returns:
+            The (volume, mute, do_notify) tuple, volume and mute being None
+            if the mixer is unavailable.
+        """
+        try:
+            do_notify = self._run_commands(commands)
+            channels, mute = self._controller.read_channels()
+            volume = self._guard.check(channels)
+        except alsaaudio.ALSAAudioError:
+            self._generation = None
+            self.event_fds = []
+            return (None, None, False)
+        remember_state(self._controller, channels, mute)
+        handle = self._controller.handle
+        if self._generation != handle.generation:
+            #(Re)opened mixer
+            self._generation = handle.generation
+            try:
+                self.event_fds = handle.get().polldescriptors()
+            except (AttributeError, alsaaudio.ALSAAudioError):
+                self.event_fds = []
+        return (volume, mute, do_notify)
+
+    def _run_commands(self, commands):
+        """Runs a batch of commands, merging the volume changes.
+
+        Returns:
+            True if a notification was requested, False else.
+        """
+        volume = None
+        delta = 0
+        toggles = 0
+        do_notify = False
+        for command in commands:
+            if command[0] == "adjust":
+                delta += command[1]
+                toggles = 0 #changing the volume unmutes
+                do_notify = do_notify or command[2]
+            elif command[0] == "set":
+                volume = command[1]
+                delta = 0
+                toggles = 0
+            elif command[0] == "mute":
+                toggles += 1
+                do_notify = do_notify or command[1]
+            elif command[0] == "call":
+                self._flush(volume, delta, toggles)
+                volume, delta, toggles = None, 0, 0
+                command[1](*command[2])
+        self._flush(volume, delta, toggles)
+        return do_notify
+
+    def _flush(self, volume, delta, toggles):
+        if volume is None and delta == 0 and toggles % 2 == 0:
+            return
+        self._controller.update(
+                volume=volume,
+                delta=delta,
+                #Changing the volume unmutes
+                mute=False if volume is not None or delta != 0 else None,
+                toggle=toggles % 2 == 1,
+                )
+
+    def _post_state(self, count, volume, mute, do_notify):
+        self.done += count
+        if do_notify and volume is not None:
+            if mute:
+                notify(0)
+            else:
+                notify(volume)
+        self._callback(volume, mute)
+        return False
+
+
+class MMKeys(object):
+
+    """Handle multimedia keys via dbus/Hal
+
+    This class comes originally from the Volti project
+    <http://code.google.com/p/volti/>
+    """
+
+    def __init__(self, main_instance):
+        """Constructor"""
+        loop = DBusGMainLoop()
+        self.main = main_instance
+        bus = dbus.SystemBus(mainloop=loop)
+        for udi in self.get_inputs():
+            obj = bus.get_object("org.freedesktop.Hal", udi)
+            iface = dbus.Interface(obj, "org.freedesktop.Hal.Device")
+            iface.connect_to_signal(
+                    "Condition",
+                    self.button_handler,
+                    path_keyword="path",
+                    )
+
+    def hal_manager(self):
+        """Hal manager"""
+        bus = dbus.SystemBus()
+        obj = bus.get_object(
+                "org.freedesktop.Hal",
+                "/org/freedesktop/Hal/Manager",
+                )
+        return dbus.Interface(obj, "org.freedesktop.Hal.Manager")
+
+    def get_inputs(self):
+        """Get keys"""
+        return self.hal_manager().FindDeviceByCapability("input.keys")
+
+    def button_handler(self, sender, destination, path):
+        """Handle button events and pass them to main app"""
+        if sender == "ButtonPressed":
+            self.main.on_mmkey_pressed(destination)
+
+
+class ALSATrayConfig(object):
+
+    """The ALSA Tray preferences dialog"""
+
+    def __init__(self, controller):
+        """The constructor.
+
+        Argument:
+            * controller -- the VolumeController whose selection is edited
+        """
+        self.controller = controller
+        self.gui = Gtk.Builder()
+        self.gui.set_translation_domain(__appname__)
+        self.gui.add_from_file(CONFIG_GUI_PATH)
+        self.gui.connect_signals(self)
+        self.gui.get_object("win_config").set_icon_from_file(AT_ICON_PATH)
+        self.gui.get_object("win_config").connect(
+                "delete-event",
+                self.on_win_config_delete_event,
+                )
+        self.enabled = False #prevent error when setting the comboboxes
+        #Cards
+        self.cbox_card = self.gui.get_object("cbox_card")
+        self.lsst_card = Gtk.ListStore(str)
+        self.cbox_card.set_model(self.lsst_card)
+        cell_card = Gtk.CellRendererText()
+        self.cbox_card.pack_start(cell_card, True)
+        self.cbox_card.add_attribute(cell_card, "text", 0)
+        #Mixer
+        self.cbox_mixer = self.gui.get_object("cbox_mixer")
+        self.lsst_mixer = Gtk.ListStore(str)
+        self.cbox_mixer.set_model(self.lsst_mixer)
+        cell_mixer = Gtk.CellRendererText()
+        self.cbox_mixer.pack_start(cell_mixer, True)
+        self.cbox_mixer.add_attribute(cell_mixer, "text", 0)
+        self._load()
+        self.enabled = True
+
+    def _load(self):
+        """Fills the widgets with the current configuration"""
+        self.lsst_card.clear()
+        for card_info in self.controller.registry.cards:
+            self.lsst_card.append( [card_info.pretty_name] )
+        self.cbox_card.set_active(self.controller.card)
+        self._set_mixer_list()
+        self.gui.get_object("chk_panel").set_active(PANEL)
+
+    def show(self):
+        """Shows the dialog again after it have been closed"""
+        self.enabled = False
+        self._load()
+        self.enabled = True
+        self.gui.get_object("win_config").present()
+
+    def _set_mixer_list(self):
+        self.lsst_mixer.clear()
+        card_info = self.controller.registry.get_card(self.controller.card)
+        for mixer_name in card_info.mixers:
+            self.lsst_mixer.append( [mixer_name] )
+        self.cbox_mixer.set_active(card_info.mixer_index(self.controller.mixer))
+
+    def on_cbox_card_changed(self, widget):
+        if not self.enabled:
+            return #prevent error when setting the comboboxes
+        if self.controller.select(widget.get_active()):
+            self._set_mixer_list()
+            write_config(self.controller)
+            self.cbox_mixer.set_sensitive(True)
+        else:
+            self.cbox_mixer.set_sensitive(False)
+            self.lsst_mixer.clear()
+
+    def on_cbox_mixer_changed(self, widget):
+        if not self.enabled or not self.cbox_mixer.get_sensitive():
+            return #prevent error when setting the comboboxes
+        card_info = self.controller.registry.get_card(self.controller.card)
+        self.controller.select(
+                self.controller.card,
+                card_info.mixers[widget.get_active()],
+                )
+        write_config(self.controller)
+
+    def on_chk_panel_toggled(self, widget):
+        if not self.enabled:
+            return
+        global PANEL
+        PANEL = widget.get_active()
+        write_config(self.controller)
+
+    def on_btn_close_clicked(self, widget):
+        self.gui.get_object("win_config").hide()
+
+    def on_win_config_delete_event(self, widget, event):
+        widget.hide()
+        return True #The dialog is reused
+
+
+class MixerPanelRow(object):
+
+    """A slider and a mute toggle of the mixers panel.
+
+    Rows are recycled when the card changes: bind() attaches the row to
+    another mixer.
+    """
+
+    def __init__(self, panel):
+        self.info = None
+        self.handle_signals = True
+        self.label = Gtk.Label()
+        self.slider = Gtk.VScale()
+        self.slider.set_inverted(True)
+        self.slider.set_range(0, 100)
+        self.slider.set_increments(1, 10)
+        self.slider.set_digits(0)
+        self.slider.set_size_request(30, 150)
+        self.slider.set_value_pos(Gtk.PositionType.BOTTOM)
+        self.mute = Gtk.CheckButton(label=_("Mute"))
+        self.box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=3)
+        self.box.pack_start(self.label, False, False, 0)
+        self.box.pack_start(self.slider, True, True, 0)
+        self.box.pack_start(self.mute, False, False, 0)
+        self.slider.connect("value-changed", panel.on_row_slider_value_changed, self)
+        self.mute.connect("toggled", panel.on_row_mute_toggled, self)
+
+    def bind(self, info):
+        self.info = info
+        self.label.set_text(info.name)
+        self.mute.set_sensitive(info.has_mute)
+        self.box.show_all()
+
+    def set_state(self, volume, mute):
+        self.handle_signals = False
+        self.slider.set_value(volume)
+        self.mute.set_active(mute)
+        self.handle_signals = True
+
+
+class MixerPanel(object):
+
+    """A popup with the sliders and mute toggles of all the usable mixers of
+    the selected card.
+
+    The widgets are only created when the panel is shown for the first
+    time, and recycled when the card changes. While the panel is visible,
+    a single subscription to the card events (the poll descriptors of one
+    of its mixers) triggers the refresh of all the rows. The mixer I/O is
+    done by the MixerWorker. A mixer handle failing is dropped, and opened
+    again on the next read (e.g. after reset(), on hotplug).
+    """
+
+    def __init__(self, worker, controller):
+        self._worker = worker
+        self._controller = controller
+        self._card = None
+        self._rows = []
+        self._sources = []
+        #Only used from the worker
+        self._mixer_names = []
+        self._mixers = {}
+        self._dropped = [] #Failed handles, closed once no longer watched
+        self._event_mixer = None
+        self._event_fds = []
+        #Writes waiting for the worker
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        #Window
+        self.window = Gtk.Window(type=Gtk.WindowType.TOPLEVEL)
+        self.window.set_decorated(False)
+        self.window.set_skip_taskbar_hint(True)
+        self.window.set_skip_pager_hint(True)
+        self.window.set_border_width(3)
+        self._box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        self.window.add(self._box)
+        self.window.connect("focus-out-event", self.on_window_focus_out_event)
+
+    def show(self):
+        if self._card != self._controller.card:
+            self._set_card(self._controller.card)
+        self._unwatch()
+        self._box.show()
+        self.window.show()
+        self._worker.call(self._read_all)
+
+    def reset(self):
+        """Opens the mixers again (the cards changed)"""
+        self._card = None
+        if self.window.get_visible():
+            self.show()
+
+    def hide(self):
+        self.window.hide()
+        self._unwatch()
+
+    def _set_card(self, card):
+        self._unwatch()
+        self._card = card
+        mixers = self._controller.registry.get_card(card).mixers
+        while len(self._rows) < len(mixers):
+            row = MixerPanelRow(self)
+            self._box.pack_start(row.box, False, False, 0)
+            self._rows.append(row)
+        for index, row in enumerate(self._rows):
+            if index < len(mixers):
+                row.bind(self._controller.registry.get_mixer(card, mixers[index]))
+            else:
+                row.info = None
+                row.box.hide()
+        self._worker.call(self._open_card, card, mixers)
+
+    def _open_card(self, card, mixers):
+        """Opens the mixers of the card (runs in the worker)"""
+        self._mixer_names = mixers
+        self._mixers = {}
+        self._dropped = []
+        self._event_mixer = None
+        self._event_fds = []
+        self._open_mixers(card)
+
+    def _open_mixers(self, card):
+        """Opens the mixers not opened yet (runs in the worker)"""
+        for mixer_name in self._mixer_names:
+            if mixer_name in self._mixers:
+                continue
+            try:
+                self._mixers[mixer_name] = alsaaudio.Mixer(
+                        control=mixer_name,
+                        cardindex=card,
+                        )
+            except alsaaudio.ALSAAudioError as detail:
+                print("W: Can't open the mixer '%s': %s" % (mixer_name, detail))
+        #One handle is enough to get the events of the whole card
+        if self._event_mixer in self._mixers:
+            return
+        self._event_fds = []
+        for mixer_name, mixer in self._mixers.items():
+            self._event_mixer = mixer_name
+            try:
+                self._event_fds = mixer.polldescriptors()
+            except (AttributeError, alsaaudio.ALSAAudioError):
+                pass
+            break
+
+    def _drop_mixer(self, mixer_name, detail):
+        """Forgets a failing mixer handle (runs in the worker)"""
+        print("W: Mixer '%s' failed: %s" % (mixer_name, detail))
+        self._dropped.append(self._mixers.pop(mixer_name))
+        if mixer_name == self._event_mixer:
+            #Watched again once another handle is opened
+            self._event_mixer = None
+            self._event_fds = []
+
+    @profiled("refresh")
+    def _read_all(self):
+        """Reads the state of all the mixers (runs in the worker)"""
+        #The card events are not watched during the reads: the dropped
+        #handles can be closed
+        self._dropped = []
+        self._open_mixers(self._card)
+        card_info = self._controller.registry.get_card(self._card)
+        states = {}
+        for mixer_name, mixer in list(self._mixers.items()):
+            try:
+                if hasattr(mixer, "handleevents"):
+                    mixer.handleevents()
+                volumes = mixer.getvolume()
+                mute = get_mute(mixer, self._controller.registry.get_mixer(self._card, mixer_name))
+            except alsaaudio.ALSAAudioError as detail:
+                self._drop_mixer(mixer_name, detail)
+                continue
+            states[mixer_name] = (volumes[0], mute)
+            if card_info is not None:
+                MEMORY.remember(card_info.name, mixer_name, volumes, mute)
+        GLib.idle_add(self._apply_states, states)
+
+    @profiled("rendering")
+    def _apply_states(self, states):
+        for row in self._rows:
+            if row.info is not None and row.info.name in states:
+                row.set_state(*states[row.info.name])
+        self._watch()
+        return False
+
+    def _watch(self):
+        if not self.window.get_visible() or len(self._sources) > 0:
+            return
+        for fd, events in self._event_fds:
+            self._sources.append(GLib.io_add_watch(
+                    fd,
+                    GLib.PRIORITY_DEFAULT,
+                    GLib.IO_IN | GLib.IO_PRI | GLib.IO_HUP | GLib.IO_ERR,
+                    self.on_card_event,
+                    ))
+
+    def _unwatch(self):
+        for source in self._sources:
+            GLib.source_remove(source)
+        self._sources = []
+
+    def _queue_write(self, mixer_name, key, value):
+        with self._pending_lock:
+            flush = len(self._pending) == 0
+            self._pending[(mixer_name, key)] = value
+        if flush:
+            self._worker.call(self._flush)
+
+    def _flush(self):
+        """Writes the pending changes, only the last value of each control
+        (runs in the worker)
+        """
+        with self._pending_lock:
+            pending = self._pending
+            self._pending = {}
+        card_info = self._controller.registry.get_card(self._card)
+        card_name = card_info.name if card_info is not None else None
+        with MixerLock():
+            for (mixer_name, key), value in pending.items():
+                mixer = self._mixers.get(mixer_name)
+                if mixer is None:
+                    continue
+                try:
+                    if key == "volume":
+                        mixer.setvolume(limit_volume(card_name, mixer_name, value))
+                    else:
+                        set_mute(mixer, value, self._controller.registry.get_mixer(self._card, mixer_name))
+                except alsaaudio.ALSAAudioError as detail:
+                    self._drop_mixer(mixer_name, detail)
+
+    def on_card_event(self, fd, condition):
+        #Stop watching until the worker have handled the events
+        self._unwatch()
+        self._worker.call(self._read_all)
+        return False
+
+    def on_row_slider_value_changed(self, widget, row):
+        if row.handle_signals and row.info is not None:
+            self._queue_write(row.info.name, "volume", int(widget.get_value()))
+
+    def on_row_mute_toggled(self, widget, row):
+        if row.handle_signals and row.info is not None:
+            self._queue_write(row.info.name, "mute", widget.get_active())
+
+    def on_window_focus_out_event(self, widget, event):
+        self.hide()
+
+
+class ALSATray(object):
+
+    """The Alsa Volume tray icon"""
+
+    def __init__(self, controller=None):
+        """The constructor.
+
+        Keyword argument:
+            * controller -- the VolumeController (default: CONTROLLER)
+        """
+        self.controller = controller or CONTROLLER
+        self.handle_menu_mute = True
+        self.handle_slider = True
+        self.volume = 0
+        self.mute = False
+        #### Widgets ####
+        #Tray icon
+        self.tray_icon = Gtk.StatusIcon()
+        #Slider window
+        self._build_slider()
+        #Mixers panel (built on the first click)
+        self.panel = None
+        #Preferences dialog (built on the first use, then reused)
+        self.config_dialog = None
+        #Menu (built on the first right click)
+        self.menu = None
+        self.menu_mute = None
+        self.menu_scenes = None
+        self._scenes = None
+        #### Signals ####
+        #Tray icon
+        self.tray_icon.connect("activate", self.on_tray_icon_activate)
+        self.tray_icon.connect(
+                "button-release-event",
+                self.on_tray_icon_button_release_event,
+                )
+        self.tray_icon.connect("scroll-event", self.on_tray_icon_scroll_event)
+        self.tray_icon.connect("popup-menu", self.on_tray_icon_popup_menu)
+        self._init_mixer_io()
+
+    def _init_mixer_io(self):
+        """Starts everything but the widgets: multimedia keys, hotplug,
+        volume memory, state file, scroll, mixer worker and timer (shared
+        with alsa_tray.sni.SNITray)
+        """
+        #### MM Keys ####
+        init_mmkeys(self)
+        #### Hotplug ####
+        self._hotplug = watch_hotplug(self.on_hotplug)
+        self._hotplug_source = None
+        self._hotplug_retries = 0
+        MEMORY.update_cards(self.controller.registry)
+        #### Shared state ####
+        self._state_file = open_state_file()
+        #### Scroll ####
+        self._scroll = ScrollAccumulator(self.on_scroll_delta)
+        #### Mixer worker ####
+        self._worker = MixerWorker(self.controller, self._update_infos)
+        self._worker.start()
+        self._event_sources = []
+        self._event_fds = []
+        #### Timer ####
+        self._timer = Timer(800, self._on_timer)
+        self._timer.start()
+
+    def _build_slider(self):
+        """Builds the popup window with the volume slider"""
+        #Slider
+        self.slider = Gtk.VScale()
+        self.slider.set_inverted(True)
+        self.slider.set_range(0, 100)
+        self.slider.set_increments(1, 10)
+        self.slider.set_digits(0)
+        self.slider.set_size_request(30, 150)
+        self.slider.set_value_pos(Gtk.PositionType.BOTTOM)
+        self.slider.set_value(self.volume)
+        self.slider.connect("value-changed", self.on_slider_value_changed)
+        #Window
+        self.window = Gtk.Window(type=Gtk.WindowType.TOPLEVEL)
+        self.window.set_decorated(False)
+        self.window.set_skip_taskbar_hint(True)
+        self.window.set_skip_pager_hint(True)
+        self.window.set_border_width(3)
+        self.window.add(self.slider)
+        self.window.connect("focus-out-event", self.on_window_focus_out_event)
+
+    @profiled("rendering")
+    def _build_menu(self):
+        """Builds the tray icon menu"""
+        self.menu_mute = Gtk.CheckMenuItem(label=_("Mute"))
+        self.menu_mute.set_active(self.mute)
+        self.menu_mute.connect("activate", self.on_menu_mute_activate)
+        #
+        self.menu = Gtk.Menu()
+        self.menu.append(self.menu_mute)
+        self.menu.append(Gtk.MenuItem())
+        #Mixers
+        launchers = find_mixer_launchers()
+        for label, command in launchers:
+            menu_mixer = Gtk.ImageMenuItem(label=label)
+            menu_mixer.set_always_show_image(True)
+            menu_mixer.set_image(Gtk.Image.new_from_pixbuf(get_mixer_icon()))
+            menu_mixer.connect("activate", self.on_menu_mixer_activate, command)
+            self.menu.append(menu_mixer)
+        if len(launchers) > 0:
+            self.menu.append(Gtk.MenuItem())
+        #Scenes (filled on popup)
+        menu_scenes = Gtk.MenuItem(label=_("Scenes"))
+        self.menu_scenes = Gtk.Menu()
+        menu_scenes.set_submenu(self.menu_scenes)
+        self.menu.append(menu_scenes)
+        self.menu.append(Gtk.MenuItem())
+        #
+        menu_preferences = Gtk.ImageMenuItem(label=Gtk.STOCK_PREFERENCES)
+        menu_preferences.connect("activate", self.on_menu_preferences_avtivate)
+        self.menu.append(menu_preferences)
+        self.menu.append(Gtk.MenuItem())
+        #
+        menu_about = Gtk.ImageMenuItem(label=Gtk.STOCK_ABOUT)
+        menu_about.connect("activate", self.on_menu_about_activate)
+        self.menu.append(menu_about)
+        #
+        menu_quit = Gtk.ImageMenuItem(label=Gtk.STOCK_QUIT)
+        menu_quit.connect("activate", self.on_menu_quit_activate)
+        self.menu.append(menu_quit)
+        #
+        self.menu.show_all()
+
+    @profiled("rendering")
+    def _update_scenes_menu(self):
+        scenes = list_scenes()
+        if scenes == self._scenes:
+            return
+        self._scenes = scenes
+        for menu_item in self.menu_scenes.get_children():
+            menu_item.destroy()
+        for scene_name in scenes:
+            menu_scene = Gtk.MenuItem(label=scene_name)
+            menu_scene.connect(
+                    "activate",
+                    self.on_menu_scene_activate,
+                    scene_name,
+                    )
+            self.menu_scenes.append(menu_scene)
+        if len(scenes) > 0:
+            self.menu_scenes.append(Gtk.MenuItem())
+        menu_save_scene = Gtk.MenuItem(label=_("Save current scene..."))
+        menu_save_scene.connect("activate", self.on_menu_save_scene_activate)
+        self.menu_scenes.append(menu_save_scene)
+        self.menu_scenes.show_all()
+
+    def _set_menu_mute(self, mute):
+        if self.menu_mute is None:
+            return
+        self.handle_menu_mute = False
+        self.menu_mute.set_active(mute)
+        self.handle_menu_mute = True
+
+    def _set_icon(self, icon_name, tooltip):
+        """Shows the given icon and tooltip (rendering hook)"""
+        self.tray_icon.set_from_icon_name(icon_name)
+        self.tray_icon.set_has_tooltip(True)
+        self.tray_icon.set_tooltip_text(tooltip)
+
+    @profiled("refresh")
+    def _on_timer(self):
+        if self._worker.is_busy():
+            self._set_icon(DEGRADED_ICON, _("Sound card busy"))
+        else:
+            self._worker.read()
+
+    def _watch(self):
+        """Watches the mixer events, with the poll descriptors of the
+        worker handle, until the next event
+        """
+        if self._event_fds != self._worker.event_fds:
+            self._unwatch()
+            self._event_fds = self._worker.event_fds
+        if len(self._event_sources) > 0:
+            return
+        for fd, events in self._event_fds:
+            self._event_sources.append(GLib.io_add_watch(
+                    fd,
+                    GLib.PRIORITY_DEFAULT,
+                    GLib.IO_IN | GLib.IO_PRI | GLib.IO_HUP | GLib.IO_ERR,
+                    self.on_mixer_event,
+                    ))
+
+    def _unwatch(self):
+        for source in self._event_sources:
+            GLib.source_remove(source)
+        self._event_sources = []
+
+    @profiled("rendering")
+    def _update_infos(self, volume, mute):
+        self._watch()
+        if (volume, mute) != (self.volume, self.mute):
+            trace_event("state", volume=volume, mute=mute)
+        if self._state_file is not None:
+            self._state_file.publish(
+                    self.controller.card,
+                    self.controller.mixer,
+                    volume,
+                    mute,
+                    )
+        if volume is None:
+            self._set_icon(DEGRADED_ICON, _("Sound card unavailable"))
+            return
+        self.volume = volume
+        self.mute = mute
+        #Tray icon
+        if mute:
+            icon_index = len(VOL_ICON) - 1
+        else:
+            icon_index = int((100 - volume) * (len(VOL_ICON) - 1) / 100)
+        self._set_icon(VOL_ICON[icon_index], volume_text(volume, mute))
+        self._set_menu_mute(mute)
+        #Slider (built on the first use by SNITray)
+        if self.slider is not None:
+            self.handle_slider = False
+            self.slider.set_value(volume)
+            self.handle_slider = True
+
+    def _set_win_position(self, window):
+        ret, screen, geometry, orient = self.tray_icon.get_geometry()
+        if not ret:
+            print("Location information haven't been set")
+        #Calculate window position
+        if orient == Gtk.Orientation.HORIZONTAL:
+            if geometry.y < screen.get_height()/2: #Panel at TOP
+                win_x = geometry.x
+                win_y = geometry.y + geometry.width
+            else:                                  #Panel at BOTTOM
+                win_x = geometry.x
+                win_y = geometry.y - geometry.width - 150
+        else:
+            if geometry.x < screen.get_width():    #Panel at LEFT
+                win_x = geometry.x + geometry.width
+                win_y = geometry.y
+            else:                                  #Panel at RIGHT
+                win_x = geometry.x - geometry.width - 32
+                win_y = geometry.y
+        #Move window
+        window.move(win_x, win_y)
+
+    def _set_volume(self, value, do_notify=False):
+        self._worker.adjust(value, do_notify)
+
+    def _toggle_mute(self, do_notify=False):
+        self._worker.toggle_mute(do_notify)
+
+    def on_mixer_event(self, fd, condition):
+        #Stop watching until the worker have handled the events
+        self._unwatch()
+        self._worker.read()
+        return False
+
+    def on_tray_icon_activate(self, widget):
+        if PANEL:
+            if self.panel is None:
+                self.panel = MixerPanel(self._worker, self.controller)
+            if self.panel.window.get_visible():
+                self.panel.hide()
+            else:
+                self._set_win_position(self.panel.window)
+                self.panel.show()
+        elif self.window.get_visible():
+            self.window.hide()
+        else:
+            self._set_win_position(self.window)
+            self.window.show_all()
+
+    def on_tray_icon_button_release_event(self, widget, event):
+        if event.button == 2: #Middle click
+            trace_event("mute")
+            self._toggle_mute(False)
+
+    @profiled("keys")
+    def on_tray_icon_scroll_event(self, widget, event):
+        if event.direction == Gdk.ScrollDirection.UP:
+            self._scroll.add(+1)
+        elif event.direction == Gdk.ScrollDirection.DOWN:
+            self._scroll.add(-1)
+        elif event.direction == Gdk.ScrollDirection.SMOOTH:
+            ret, delta_x, delta_y = event.get_scroll_deltas()
+            if ret:
+                self._scroll.add(-delta_y)
+
+    @profiled("keys")
+    def on_scroll_delta(self, value):
+        self._set_volume(value, False)
+
+    def on_tray_icon_popup_menu(self, widget, button, time):
+        if self.menu is None:
+            self._build_menu()
+        self._update_scenes_menu()
+        self.menu.popup(None, None, None, None, button, time)
+
+    def on_slider_value_changed(self, widget):
+        if self.window.get_visible() and self.handle_slider:
+            trace_event("slider", value=int(self.slider.get_value()))
+            self._worker.set_volume(int(self.slider.get_value()))
+
+    def on_window_focus_out_event(self, widget, event):
+        self.window.hide()
+
+    def on_menu_mute_activate(self, widget):
+        if self.handle_menu_mute:
+            trace_event("mute")
+            self._toggle_mute(False)
+
+    def on_menu_mixer_activate(self, widget, command):
+        import subprocess
+        try:
+            process = subprocess.Popen(command, close_fds=True)
+        except OSError as detail:
+            print("E: Can't run '%s': %s" % (" ".join(command), detail))
+            return
+        #Reap the process when it exits
+        GLib.child_watch_add(
+                GLib.PRIORITY_DEFAULT,
+                process.pid,
+                self.on_mixer_process_exit,
+                )
+
+    def on_mixer_process_exit(self, pid, status):
+        pass
+
+    def on_menu_scene_activate(self, widget, scene_name):
+        self._worker.call(self._load_scene, scene_name)
+
+    def _load_scene(self, scene_name):
+        """Loads a scene (runs in the mixer worker)"""
+        try:
+            load_scene(scene_name)
+        except (IOError, OSError) as detail:
+            print("E: Can't load the scene '%s': %s" % (scene_name, detail))
+
+    def on_menu_save_scene_activate(self, widget):
+        dialog = Gtk.Dialog(
+                title=_("Save scene - ALSA Tray"),
+                buttons=(
+                    Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                    Gtk.STOCK_SAVE, Gtk.ResponseType.OK,
+                    ),
+                )
+        dialog.set_icon_from_file(AT_ICON_PATH)
+        dialog.set_default_response(Gtk.ResponseType.OK)
+        entry = Gtk.Entry()
+        entry.set_activates_default(True)
+        dialog.get_content_area().pack_start(entry, True, True, 5)
+        dialog.show_all()
+        response = dialog.run()
+        scene_name = entry.get_text().strip()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK:
+            return
+        if not check_scene_name(scene_name):
+            print("E: Invalid scene name '%s'." % scene_name)
+            return
+        self._worker.call(self._save_scene, scene_name)
+
+    def _save_scene(self, scene_name):
+        """Saves a scene (runs in the mixer worker)"""
+        try:
+            save_scene(scene_name)
+        except (IOError, OSError) as detail:
+            print("E: Can't save the scene '%s': %s" % (scene_name, detail))
+
+    def on_menu_preferences_avtivate(self, widget):
+        if self.config_dialog is None:
+            self.config_dialog = ALSATrayConfig(self.controller)
+        else:
+            self.config_dialog.show()
+
+    def on_menu_about_activate(self, widget):
+        aboutdlg = Gtk.AboutDialog()
+        aboutdlg.set_name(__appdispname__)
+        aboutdlg.set_version(__version__)
+        aboutdlg.set_copyright(__copyright__)
+        aboutdlg.set_website(__website__)
+        img_logo = Gtk.Image()
+        img_logo.set_from_file(AT_ICON_PATH)
+        aboutdlg.set_logo(img_logo.get_pixbuf())
+        aboutdlg.set_icon_from_file(AT_ICON_PATH)
+        aboutdlg.set_translator_credits(_("translator-credits"))
+        aboutdlg.connect("response", self.on_aboutdlg_response)
+        aboutdlg.show()
+
+    def on_menu_quit_activate(self, widget):
+        Gtk.main_quit()
+
+    def on_aboutdlg_response(self, widget, response):
+        if response < 0:
+            widget.destroy()
+
+    def on_hotplug(self, monitor, file, other_file, event_type):
+        self.controller.handle.retry_now()
+        self._hotplug_retries = HOTPLUG_RETRIES
+        #A card comes with several devices: wait for all of them
+        if self._hotplug_source is None:
+            self._hotplug_source = GLib.timeout_add(
+                    HOTPLUG_DELAY,
+                    self.on_hotplug_timeout,
+                    )
+
+    def on_hotplug_timeout(self):
+        self._hotplug_source = None
+        self._worker.call(self._restore_cards)
+        self._worker.read()
+        if self.panel is not None:
+            self.panel.reset()
+        return False
+
+    def _restore_cards(self):
+        """Rescans the cards in the mixer worker, and scans them again a bit
+        later if the scan failed (e.g. card still being initialized).
+        """
+        if not restore_cards(self.controller.registry):
+            GLib.idle_add(self._retry_hotplug)
+
+    def _retry_hotplug(self):
+        if self._hotplug_retries > 0 and self._hotplug_source is None:
+            self._hotplug_retries -= 1
+            self._hotplug_source = GLib.timeout_add(
+                    HOTPLUG_DELAY,
+                    self.on_hotplug_timeout,
+                    )
+        return False
+
+    @profiled("keys")
+    def on_mmkey_pressed(self, key):
+        trace_event("mmkey", key=key)
+        if key == "volume-up":
+            self._set_volume(+5, True)
+        elif key == "volume-down":
+            self._set_volume(-5, True)
+        elif key == "mute":
+            self._toggle_mute(True)
+
+
+class ALSADaemon(object):
+
+    """The headless ALSA Tray.
+
+    Handles the multimedia keys and the notifications, and tracks the state
+    of the selected mixer, without any GTK+ widget. It only needs a GLib main
+    loop: the mixer changes are watched through the mixer poll descriptors
+    instead of being polled (except with old pyAlsaAudio versions), and
+    the mixer is reopened when it vanishes (see MixerHandle).
+    """
+
+    def __init__(self, controller=None):
+        """The constructor.
+
+        Keyword argument:
+            * controller -- the VolumeController (default: CONTROLLER)
+        """
+        self.controller = controller or CONTROLLER
+        self.volume = None
+        self.mute = None
+        self._guard = VolumeGuard(self.controller, self._update_infos)
+        self._sources = []
+        self._generation = None
+        self._timer = None
+        self._retry_source = None
+        #### MM Keys ####
+        init_mmkeys(self)
+        #### Hotplug ####
+        self._hotplug = watch_hotplug(self.on_hotplug)
+        self._hotplug_source = None
+        self._hotplug_retries = 0
+        MEMORY.update_cards(self.controller.registry)
+        #### Shared state ####
+        self._state_file = open_state_file()
+        #### Mixer events ####
+        self._update_infos()
+
+    @profiled("refresh")
+    def _update_infos(self):
+        #Mixer
+        try:
+            self._watch(self.controller.handle.get())
+            channels, mute = self.controller.read_channels()
+            volume = self._guard.check(channels)
+        except alsaaudio.ALSAAudioError as detail:
+            self.controller.handle.fail(detail)
+            self._unwatch()
+            self._schedule_retry()
+            volume = None
+            mute = None
+        else:
+            remember_state(self.controller, channels, mute)
+        #State
+        if (volume, mute) == (self.volume, self.mute):
+            return
+        self.volume = volume
+        self.mute = mute
+        trace_event("state", volume=volume, mute=mute)
+        if self._state_file is not None:
+            self._state_file.publish(
+                    self.controller.card,
+                    self.controller.mixer,
+                    volume,
+                    mute,
+                    )
+        if DEBUG and volume is not None:
+            print("I: Volume: %i%%, mute: %s" % (volume, mute))
+
+    def _watch(self, mixer):
+        """Watches the events of the mixer, once per opened handle"""
+        if self._generation == self.controller.handle.generation:
+            return
+        self._unwatch()
+        self._generation = self.controller.handle.generation
+        self._sources = watch_mixer_events(mixer, self.on_mixer_event)
+        if not self._sources and self._timer is None:
+            if DEBUG:
+                print("W: Mixer events not available, polling the mixer...")
+            self._timer = Timer(800, self._update_infos)
+            self._timer.start()
+        elif self._sources and self._timer is not None:
+            #polldescriptors() failed on a previous handle (ALSA error)
+            self._timer.stop()
+            self._timer = None
+
+    def _unwatch(self):
+        for source in self._sources:
+            GLib.source_remove(source)
+        self._sources = []
+        self._generation = None
+
+    def _schedule_retry(self):
+        if self._retry_source is not None or self._timer is not None:
+            return
+        self._retry_source = GLib.timeout_add(
+                int(self.controller.handle.retry_delay() * 1000) + 1,
+                self.on_retry_timeout,
+                )
+
+    def on_retry_timeout(self):
+        self._retry_source = None
+        self._update_infos()
+        return False
+
+    def on_mixer_event(self, fd, condition):
+        self._update_infos()
+        return True
+
+    def on_hotplug(self, monitor, file, other_file, event_type):
+        self.controller.handle.retry_now()
+        self._hotplug_retries = HOTPLUG_RETRIES
+        #A card comes with several devices: wait for all of them
+        if self._hotplug_source is None:
+            self._hotplug_source = GLib.timeout_add(
+                    HOTPLUG_DELAY,
+                    self.on_hotplug_timeout,
+                    )
+
+    def on_hotplug_timeout(self):
+        self._hotplug_source = None
+        if not restore_cards(self.controller.registry) and \
+           self._hotplug_retries > 0:
+            #Scan the cards again a bit later
+            self._hotplug_retries -= 1
+            self._hotplug_source = GLib.timeout_add(
+                    HOTPLUG_DELAY,
+                    self.on_hotplug_timeout,
+                    )
+        self._update_infos()
+        return False
+
+    @profiled("keys")
+    def on_mmkey_pressed(self, key):
+        trace_event("mmkey", key=key)
+        try:
+            if key == "volume-up":
+                volume, mute = self.controller.change_volume(+5)
+            elif key == "volume-down":
+                volume, mute = self.controller.change_volume(-5)
+            elif key == "mute":
+                volume, mute = self.controller.toggle_mute()
+            else:
+                return
+        except alsaaudio.ALSAAudioError:
+            pass
+        else:
+            if mute:
+                notify(0)
+            else:
+                notify(volume)
+        self._update_infos()
+
+
+def load_gtk():
+    """Import GTK+ 3.
+
+    GTK+ is only imported when a widget is needed, so that the daemon mode
+    does not load it in memory.
+
+    Returns:
+        True if GTK+ 3 is available, False else.
+    """
+    global Gtk, Gdk, GdkPixbuf, GTK_PLUS
+    if GTK_PLUS:
+        return True
+    if not GLIB:
+        return False
+    try:
+        gi.require_version("Gtk", "3.0")
+        from gi.repository import Gtk
+        from gi.repository import Gdk
+        from gi.repository import GdkPixbuf
+    except (ImportError, ValueError):
+        return False
+    GTK_PLUS = True
+    return True
+
+
+def load_translations():
+    """Loads the translation catalog of the current locale.
+
+    The catalog is only loaded by the first translated message, so that the
+    command line modes which print nothing translated never read it.
+
+    Returns:
+        The gettext translations (NullTranslations if there is no catalog
+        for the locale).
+    """
+    global _TRANSLATIONS, _LOCALE
+    if _TRANSLATIONS is not None:
+        return _TRANSLATIONS
+    localedir = LOCALE_PATH
+    if gettext.find(__appname__, localedir) is None:
+        localedir = None #System wide catalogs
+    _TRANSLATIONS = gettext.translation(__appname__, localedir, fallback=True)
+    _LOCALE = "C"
+    for env in ("LANGUAGE", "LC_ALL", "LC_MESSAGES", "LANG"):
+        if os.environ.get(env):
+            _LOCALE = os.environ[env].split(":")[0]
+            break
+    if localedir is not None and hasattr(locale, "bindtextdomain"):
+        #Gtk.Builder translates the dialogs with the C library gettext
+        locale.bindtextdomain(__appname__, localedir)
+    return _TRANSLATIONS
+
+
+def _(message):
+    """Returns the translation of message"""
+    return load_translations().gettext(message)
+
+
+def volume_text(volume, mute):
+    """Returns the translated volume text (tooltips, CLI output).
+
+    The texts are cached per (locale, volume, mute): there are at most 202
+    of them per locale.
+
+    Arguments:
+        * volume -- the volume (in percent)
+        * mute -- the mute state
+    """
+    text = _VOLUME_TEXTS.get((_LOCALE, volume, mute))
+    if text is not None:
+        return text
+    if mute:
+        text = _("Volume: {VOLUME}, mute")
+    else:
+        text = _("Volume: {VOLUME}")
+    text = text.replace("{VOLUME}", "%i%%" % volume)
+    #_LOCALE is only known once the catalog is loaded
+    _VOLUME_TEXTS[(_LOCALE, volume, mute)] = text
+    return text
+
+
+def find_mixer_launchers():
+    """List the installed external mixers.
+
+    The executables are only looked for once, the result is cached.
+
+    Returns:
+        A list of (label, command) tuples.
+    """
+    global _AVAILABLE_LAUNCHERS
+    if _AVAILABLE_LAUNCHERS is None:
+        _AVAILABLE_LAUNCHERS = []
+        for label, executables, command in MIXER_LAUNCHERS:
+            for executable in executables:
+                if not os.path.isfile(executable):
+                    break
+            else:
+                _AVAILABLE_LAUNCHERS.append((label, command))
+    return _AVAILABLE_LAUNCHERS
+
+
+def get_mixer_icon():
+    """Returns the mixer icon pixbuf, decoded once and shared by the menu
+    items.
+    """
+    global _MIXER_ICON
+    if _MIXER_ICON is None:
+        _MIXER_ICON = GdkPixbuf.Pixbuf.new_from_file(MIXER_ICON_PATH)
+    return _MIXER_ICON
+
+
+def init_mmkeys(main_instance):
+    """Enable the multimedia keys support if available.
+
+    Argument:
+        * main_instance -- the object whose on_mmkey_pressed() method is
+          called when a key is pressed
+    """
+    if not DBUS:
+        return
+    try:
+        MMKeys(main_instance)
+    except dbus.exceptions.DBusException as detail:
+        if DEBUG:
+            print("W: Multimedia key support non available:\n%s" % detail)
+        else:
+            print("W: Multimedia key support non available...")
+
+
+def watch_mixer_events(mixer, callback):
+    """Watch the poll descriptors of the given mixer in the GLib main loop.
+
+    Arguments:
+        * mixer -- the alsaaudio.Mixer to watch
+        * callback -- the function called with (fd, condition) when the
+          mixer changes, it must return True to keep watching
+
+    Returns:
+        The list of the GLib source ids, an empty list if the mixer can't
+        be watched (pyAlsaAudio < 0.8).
+    """
+    try:
+        descriptors = mixer.polldescriptors()
+    except (AttributeError, alsaaudio.ALSAAudioError):
+        return []
+    sources = []
+    for fd, events in descriptors:
+        sources.append(GLib.io_add_watch(
+                fd,
+                GLib.PRIORITY_DEFAULT,
+                GLib.IO_IN | GLib.IO_PRI | GLib.IO_HUP | GLib.IO_ERR,
+                callback,
+                ))
+    return sources
+
+
+def open_state_file():
+    """Opens the shared state file (see alsa_tray.statefile).
+
+    Returns:
+        The StatePublisher, None if the file can't be created.
+    """
+    from alsa_tray.statefile import StatePublisher
+    try:
+        publisher = StatePublisher(STATE_FILE_PATH)
+    except (IOError, OSError) as detail:
+        print("W: Can't create the state file: %s" % detail)
+        return None
+    atexit.register(publisher.close)
+    return publisher
+
+
+def restore_cards(registry=None):
+    """Rescans the cards and restores the recorded state of the cards that
+    appeared (see VolumeMemory).
+
+    Keyword argument:
+        * registry -- the MixerRegistry (default: REGISTRY)
+
+    Returns:
+        True if the cards were scanned, False if they can't be listed (the
+        previous lists stay in use).
+    """
+    if registry is None:
+        registry = REGISTRY
+    try:
+        registry.scan()
+    except alsaaudio.ALSAAudioError as detail:
+        print("W: Can't list the sound cards: %s" % detail)
+        return False
+    for card_info in MEMORY.update_cards(registry):
+        MEMORY.restore(card_info)
+    return True
+
+
+def remember_state(controller, volumes, mute):
+    """Records the state (volume of each channel, mute) of the mixer of the
+    given VolumeController in MEMORY.
+    """
+    card_info = controller.registry.get_card(controller.card)
+    if card_info is not None:
+        MEMORY.remember(card_info.name, controller.mixer, volumes, mute)
+
+
+def watch_hotplug(callback):
+    """Watch the sound devices being plugged and unplugged.
+
+    Argument:
+        * callback -- the function called with (monitor, file, other_file,
+          event_type) when a device appears or disappears in /dev/snd
+
+    Returns:
+        The Gio.FileMonitor (a reference must be kept), None if the devices
+        can't be watched.
+    """
+    try:
+        from gi.repository import Gio
+        monitor = Gio.File.new_for_path("/dev/snd").monitor_directory(
+                Gio.FileMonitorFlags.NONE,
+                None,
                 )
-        menu_preferences.connect("activate", self.on_menu_preferences_avtivate)
-        menu_about.connect("activate", self.on_menu_about_activate)
-        menu_quit.connect("activate", self.on_menu_quit_activate)
-        #### Timer ####
-        self._timer = Timer(800, self._update_infos)
-        self._timer.start()
+    except (ImportError, GLib.Error):
+        return None
+    monitor.connect("changed", callback)
+    return monitor
 
-    def _update_infos(self):
-        #Mixer
-        mixer = alsaaudio.Mixer(control=MIXER, cardindex=CARD)
-        volume = mixer.getvolume()[0]
-        mute = get_mute(mixer)
-        #Tray icon
-        if mute:
-            icon_index = len(VOL_ICON) - 1
-            self.tray_icon.set_has_tooltip(True)
-            self.tray_icon.set_tooltip_text(
-                _("Volume: {VOLUME}, mute").replace("{VOLUME}", "%i%%" % volume)
-            )
-            self.handle_menu_mute = False
-            self.menu_mute.set_active(True)
-            self.handle_menu_mute = True
-        else:
-            icon_index = int((100 - volume) * (len(VOL_ICON) - 1) / 100)
-            self.tray_icon.set_has_tooltip(True)
-            self.tray_icon.set_tooltip_text(
-                _("Volume: {VOLUME}").replace("{VOLUME}", "%i%%" % volume)
-            )
 
-            self.handle_menu_mute = False
-            self.menu_mute.set_active(False)
-            self.handle_menu_mute = True
-        self.tray_icon.set_from_icon_name(VOL_ICON[icon_index])
-        #Slider
-        self.slider.set_value(volume)
+def trace_event(event, **data):
+    """Records an event in the trace, if enabled (see alsa_tray.trace).
 
-    def _set_win_position(self):
-        ret, screen, geometry, orient = self.tray_icon.get_geometry()
-        if not ret:
-            print("Location information haven't been set")
-        #Calculate window position
-        if orient == Gtk.Orientation.HORIZONTAL:
-            if geometry.y < screen.get_height()/2: #Panel at TOP
-                win_x = geometry.x
-                win_y = geometry.y + geometry.width
-            else:                                  #Panel at BOTTOM
-                win_x = geometry.x
-                win_y = geometry.y - geometry.width - 150
-        else:
-            if geometry.x < screen.get_width():    #Panel at LEFT
-                win_x = geometry.x + geometry.width
-                win_y = geometry.y
-            else:                                  #Panel at RIGHT
-                win_x = geometry.x - geometry.width - 32
-                win_y = geometry.y
-        #Move window
-        self.window.move(win_x, win_y)
+    Arguments:
+        * event -- the event type
+        * data -- the event data
+    """
+    if TRACE is not None:
+        TRACE.record(event, **data)
 
-    def _set_volume(self, value, do_notify=False):
-        #Mixer
-        mixer = alsaaudio.Mixer(control=MIXER, cardindex=CARD)
-        volume = mixer.getvolume()[0]
-        #Calculate the new volume
-        volume = volume + value
-        if volume > 100:
-            volume = 100
-        elif volume < 0:
-            volume = 0
-        #Show notification
-        if do_notify:
-            notify(volume)
-        #Set the volume
-        mixer.setvolume(volume)
-        #Unmute
-        set_mute(mixer, False)
-        #Update information
-        self._update_infos()
 
-    def _toggle_mute(self, do_notify=False):
-        #Mixer
-        mixer = alsaaudio.Mixer(control=MIXER, cardindex=CARD)
-        #Mute/Unmute
-        if get_mute(mixer):
-            set_mute(mixer, False)
-        else:
-            set_mute(mixer, True)
-        #Show notification
-        if do_notify:
-            if get_mute(mixer):
-                notify(0)
-            else:
-                notify(mixer.getvolume()[0])
-        #Update infos
-        self._update_infos()
+def start_profiler(path):
+    """Profiles the session (see SessionProfiler).
 
-    def on_tray_icon_activate(self, widget):
-        if self.window.get_visible():
-            self.window.hide()
-        else:
-            self._set_win_position()
-            self.window.show_all()
+    The profile is written at exit and when SIGUSR1 is received. The modes
+    running a main loop take the signals over with watch_signals().
 
-    def on_tray_icon_button_release_event(self, widget, event):
-        if event.button == 2: #Middle click
-            self._toggle_mute(False)
+    Argument:
+        * path -- the path of the profile file
+    """
+    global PROFILER
+    PROFILER = SessionProfiler(path)
+    atexit.register(PROFILER.dump)
+    signal.signal(signal.SIGUSR1, on_sigusr1)
+    signal.signal(signal.SIGTERM, on_sigterm)
 
-    def on_tray_icon_scroll_event(self, widget, event):
-        if event.direction == Gdk.ScrollDirection.UP:
-            self._set_volume(+5, False)
-        elif event.direction == Gdk.ScrollDirection.DOWN:
-            self._set_volume(-5, False)
 
-    def on_tray_icon_popup_menu(self, widget, button, time):
-        self.menu.show_all()
-        self.menu.popup(None, None, None, None, button, time)
+def watch_signals(quit):
+    """Handles SIGTERM, SIGINT (and SIGUSR1 when profiling) in the GLib main
+    loop.
 
-    def on_slider_value_changed(self, widget):
-        if self.window.get_visible():
-            mixer = alsaaudio.Mixer(control=MIXER, cardindex=CARD)
-            mixer.setvolume(int(self.slider.get_value()))
-            set_mute(mixer, False)
-            self._update_infos()
+    The Python signal handlers are not run while GTK+/GLib is looping.
 
-    def on_window_focus_out_event(self, widget, event):
-        self.window.hide()
+    Argument:
+        * quit -- the function quitting the main loop, so that the atexit
+          handlers (volume memory, state file, profile) are run
+    """
+    if PROFILER is not None:
+        GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGUSR1, on_sigusr1)
+    GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGTERM, on_loop_sigterm, quit)
+    GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGINT, on_loop_sigterm, quit)
 
-    def on_menu_mute_activate(self, widget):
-        if self.handle_menu_mute:
-            self._toggle_mute(False)
 
-    def on_menu_mixer_activate(self, widget, command):
-        os.popen(command)
+def on_sigusr1(*args):
+    PROFILER.dump()
+    return True
 
-    def on_menu_preferences_avtivate(self, widget):
-        ALSATrayConfig()
 
-    def on_menu_about_activate(self, widget):
-        aboutdlg = Gtk.AboutDialog()
-        aboutdlg.set_name(__appdispname__)
-        aboutdlg.set_version(__version__)
-        aboutdlg.set_copyright(__copyright__)
-        aboutdlg.set_website(__website__)
-        img_logo = Gtk.Image()
-        img_logo.set_from_file(AT_ICON_PATH)
-        aboutdlg.set_logo(img_logo.get_pixbuf())
-        aboutdlg.set_icon_from_file(AT_ICON_PATH)
-        aboutdlg.set_translator_credits(_("translator-credits"))
-        aboutdlg.connect("response", self.on_aboutdlg_response)
-        aboutdlg.show()
+def on_sigterm(*args):
+    sys.exit(0) #The profile is dumped by atexit
 
-    def on_menu_quit_activate(self, widget):
-        Gtk.main_quit()
 
-    def on_aboutdlg_response(self, widget, response):
-        if response < 0:
-            widget.destroy()
+def on_loop_sigterm(quit):
+    quit()
+    return False
 
-    def on_mmkey_pressed(self, key):
-        if key == "volume-up":
-            self._set_volume(+5, True)
-        elif key == "volume-down":
-            self._set_volume(-5, True)
-        elif key == "mute":
-            self._toggle_mute(True)
 
+def use_sandbox(directory=None):
+    """Keeps the files written by ALSA Tray (volume memory, mixer lock,
+    state file, scenes) in a private directory.
+
+    The simulated cards have the names of real cards: their states must
+    never reach the files of the session (the volume memory would restore
+    them on the real hardware).
 
+    Keyword argument:
+        * directory -- the directory (default: a temporary directory,
+          removed at exit)
+
+    Returns:
+        The directory.
+    """
+    global MEMORY, LOCK_FILE_PATH, STATE_FILE_PATH, SCENES_DIR_PATH
+    if directory is None:
+        import shutil
+        directory = tempfile.mkdtemp(prefix="%s-" % __appname__)
+        #Registered first: removed after the other atexit handlers ran
+        atexit.register(shutil.rmtree, directory, True)
+    LOCK_FILE_PATH = os.path.join(directory, "%s.lock" % __appname__)
+    STATE_FILE_PATH = os.path.join(directory, "%s.state" % __appname__)
+    SCENES_DIR_PATH = os.path.join(directory, "scenes")
+    MEMORY = VolumeMemory(os.path.join(directory, "volumes.json"))
+    atexit.register(MEMORY.save)
+    return directory
+
+
+def use_backend(backend):
+    """Replace pyAlsaAudio by another backend with the same API.
+
+    Argument:
+        * backend -- the backend (e.g. alsa_tray.simulated.SimulatedBackend)
+    """
+    global alsaaudio
+    alsaaudio = backend
+
+
+@profiled("notification")
 def notify(value, default=True):
     if not NOTIFY and CLI_OPTS['notify'] != "no":
         if DEBUG:
@@ -691,70 +2891,45 @@ def notify(value, default=True):
     notification.show()
 
 
+@profiled("enumeration")
 def ls_cards_mixers():
     """ List the availaible cards and mixers.
 
     List all the available cards and all the usable mixers of each cards.
+    Raises ALSAAudioError if the cards can't be listed (see
+    list_cards_or_exit()).
     """
-    global CARD_LIST
-    global MIXER_LIST
-    CARD_LIST = alsaaudio.cards()
-    for card_name in CARD_LIST:
-        MIXER_LIST[card_name] = {
-                'pretty_name': "%s (hw:%i)" % (card_name, CARD_LIST.index(card_name)),
-                'mixers': [],
-                }
-        try:
-            for mixer_name in alsaaudio.mixers(CARD_LIST.index(card_name)):
-                mixer = alsaaudio.Mixer(control=mixer_name, cardindex=CARD_LIST.index(card_name))
-                if len(mixer.volumecap()) > 0 and mixer.volumecap()[0] in \
-                    ("Volume", "Playback Volume", "Joined Playback Volume"):
-                    try:
-                        mixer.getvolume()
-                    except alsaaudio.ALSAAudioError:
-                        pass
-                    else:
-                        MIXER_LIST[card_name]['mixers'].append(mixer_name)
-        except alsaaudio.ALSAAudioError:
-            pass
+    REGISTRY.scan()
+
+
+def list_cards_or_exit():
+    """List the available cards and mixers (see ls_cards_mixers()), exits
+    if the cards can't be listed.
+    """
+    try:
+        ls_cards_mixers()
+    except alsaaudio.ALSAAudioError as detail:
+        print("E: Can't list the sound cards: %s" % detail)
+        sys.exit(11)
 
 
 def select_default_card():
-    """Select the default card.
+    """Select the default card of CONTROLLER, exits if there is none.
 
     Select the first card that haves an usable mixer.
     """
-    if len(CARD_LIST) > 0:
-        global CARD
-        for card_name in CARD_LIST:
-            if len(MIXER_LIST[card_name]['mixers']) > 0:
-                CARD = CARD_LIST.index(card_name)
-                return
-    else:
+    if not CONTROLLER.select_default_card():
         print("E: No sound card found.")
         sys.exit(7)
 
 
-def select_default_mixer(card):
-    """Select the default mixer of the given card.
-
-    If 'Master' available, select it, else select PCM if available, else
-    select the first usable mixer.
-
-    Argument:
-        * card -- the card index
+def select_default_mixer():
+    """Select the default mixer of the card of CONTROLLER, exits if there is
+    none (see VolumeController.select_default_mixer()).
     """
-    if check_card(card):
-        global MIXER
-        if len(MIXER_LIST[CARD_LIST[card]]['mixers']) == 0:
-            print("E: No usable mixer for card 'hw:%i'." % card)
-            sys.exit(6)
-        if check_mixer("Master", card):
-            MIXER = "Master"
-        elif check_mixer("PCM", card):
-            MIXER = "PCM"
-        else:
-            MIXER = MIXER_LIST[CARD_LIST[card]]['mixers'][0]
+    if check_card(CONTROLLER.card) and not CONTROLLER.select_default_mixer():
+        print("E: No usable mixer for card 'hw:%i'." % CONTROLLER.card)
+        sys.exit(6)
 
 
 def check_card(card):
@@ -766,7 +2941,7 @@ def check_card(card):
     Returns:
         True if the card is available, False else.
     """
-    if card <= len(CARD_LIST)-1 and card >= 0:
+    if REGISTRY.get_card(card) is not None:
         return True
     else:
         return False
@@ -782,84 +2957,430 @@ def check_mixer(mixer_name, card):
     Returns:
         True if the mixer is available, False else.
     """
-    if mixer_name in MIXER_LIST[CARD_LIST[card]]['mixers']:
+    if REGISTRY.get_mixer(card, mixer_name) is not None:
         return True
     else:
         return False
 
 
 def check_all():
-    """Check card and mixer and try do fix misconfiguration"""
+    """Check the card and mixer of CONTROLLER and try do fix
+    misconfiguration
+    """
     #Check card
-    if not check_card(CARD):
-        print("E: Unknown card 'hw:%i'." % CARD)
+    if not check_card(CONTROLLER.card):
+        print("E: Unknown card 'hw:%i'." % CONTROLLER.card)
         print("Run asla-tray --card-list for seeing the available cards.")
         print("Search for the default card instead...")
         select_default_card()
         #Found...
-        print("Card 'hw:%i' selected." % CARD)
+        print("Card 'hw:%i' selected." % CONTROLLER.card)
     #Check if the card have at least one mixer
-    if len(MIXER_LIST[CARD_LIST[CARD]]['mixers']) == 0:
-        print("E: No usable mixer for card 'hw:%i'." % CARD)
+    if len(REGISTRY.get_card(CONTROLLER.card).mixers) == 0:
+        print("E: No usable mixer for card 'hw:%i'." % CONTROLLER.card)
         print("Search for the default card instead...")
         select_default_card()
         #Found...
-        print("Card 'hw:%i' selected." % CARD)
+        print("Card 'hw:%i' selected." % CONTROLLER.card)
     #Check mixer
-    if not check_mixer(MIXER, CARD):
-        print("E: Unknown or unusable mixer '%s' for card 'hw%i'." % (MIXER, CARD))
+    if not check_mixer(CONTROLLER.mixer, CONTROLLER.card):
+        print("E: Unknown or unusable mixer '%s' for card 'hw%i'." % (
+                CONTROLLER.mixer, CONTROLLER.card))
         print("Run asla-tray --mixer-list for seeing the available mixers.")
         print("Search for the default mixer instead...")
-        select_default_mixer(CARD)
+        select_default_mixer()
         #Found...
-        print("'%s' mixer of 'hw:%i' selected."  % (MIXER, CARD))
+        print("'%s' mixer of 'hw:%i' selected."  % (
+                CONTROLLER.mixer, CONTROLLER.card))
+
 
+def read_config(controller=None):
+    """Reads the configuration file.
 
-def read_config():
+    Keyword argument:
+        * controller -- the VolumeController whose card and mixer are read
+          (default: CONTROLLER)
+    """
     if not os.path.isfile(CONFIG_FILE_PATH):
         return
-    global CARD
-    global MIXER
+    if controller is None:
+        controller = CONTROLLER
+    global PANEL
     conf_file = open(CONFIG_FILE_PATH, "r")
     for line in conf_file:
         line_clean = line.replace("\n", "").replace(" ", "")
-        if line_clean[:8] == "card=hw:" and line_clean[8:].isdigit():
-            CARD = int(line_clean[8:])
+        if line_clean[:6] == "limit.":
+            #Mixer names can contain spaces
+            read_limit(line.strip()[6:])
+        elif line_clean[:8] == "card=hw:" and line_clean[8:].isdigit():
+            controller.card = int(line_clean[8:])
         elif line_clean[:6] == "mixer=" and line_clean[6:].isalnum():
-            MIXER = line_clean[6:]
+            controller.mixer = line_clean[6:]
+        elif line_clean in ("panel=yes", "panel=no"):
+            PANEL = line_clean == "panel=yes"
     conf_file.close()
 
 
-def write_config():
+def read_limit(limit):
+    """Parses a volume limit of the configuration file.
+
+    Argument:
+        * limit -- the limit: "<card name>.<mixer name>=[<floor>-]<ceiling>"
+    """
+    try:
+        key, value = limit.split("=", 1)
+        card_name, mixer_name = key.strip().split(".", 1)
+        if "-" in value:
+            floor, ceiling = [int(bound) for bound in value.split("-", 1)]
+        else:
+            floor, ceiling = 0, int(value)
+    except ValueError:
+        print("W: Invalid volume limit '%s'." % limit)
+        return
+    if not 0 <= floor <= ceiling <= 100:
+        print("W: Invalid volume limit '%s'." % limit)
+        return
+    VOLUME_LIMITS[(card_name, mixer_name.strip())] = (floor, ceiling)
+
+
+def limit_volume(card_name, mixer_name, volume):
+    """Returns the volume clamped in the limits of the given mixer.
+
+    Arguments:
+        * card_name -- the card name
+        * mixer_name -- the mixer name
+        * volume -- the volume (in percent)
+    """
+    floor, ceiling = VOLUME_LIMITS.get((card_name, mixer_name), (0, 100))
+    if volume > ceiling:
+        return ceiling
+    elif volume < floor:
+        return floor
+    return volume
+
+
+def write_config(controller=None):
+    """Writes the configuration file.
+
+    Keyword argument:
+        * controller -- the VolumeController whose selection is saved
+          (default: CONTROLLER)
+    """
+    if controller is None:
+        controller = CONTROLLER
     try:
         conf_file = open(CONFIG_FILE_PATH, "w")
-        conf_file.write("card=hw:%i\n" % CARD)
-        conf_file.write("mixer=%s\n" % MIXER)
+        conf_file.write("card=hw:%i\n" % controller.card)
+        conf_file.write("mixer=%s\n" % controller.mixer)
+        conf_file.write("panel=%s\n" % ("yes" if PANEL else "no"))
+        for (card_name, mixer_name), (floor, ceiling) in sorted(VOLUME_LIMITS.items()):
+            conf_file.write("limit.%s.%s=%i-%i\n" % (
+                    card_name, mixer_name, floor, ceiling))
     except:
         pass
     else:
         conf_file.close()
 
 
-def get_mute(mixer):
-    try:
-        return bool(mixer.getmute()[0])
-    except:
+def get_mute(mixer, info=None):
+    """Returns the mute state of the given mixer.
+
+    Arguments:
+        * mixer -- the alsaaudio.Mixer
+        * info -- the MixerInfo of the mixer, None for probing the mixer
+          (e.g. a mixer missing from the registry)
+    """
+    if info is None:
+        #Unknown capabilities
+        try:
+            return bool(mixer.getmute()[0])
+        except alsaaudio.ALSAAudioError:
+            return False
+    if not info.has_mute:
         return False
+    return bool(mixer.getmute()[0])
 
 
-def set_mute(mixer, value):
-    try:
+def set_mute(mixer, value, info=None):
+    """Mutes/Unmutes the given mixer, if it have a switch.
+
+    Arguments:
+        * mixer -- the alsaaudio.Mixer
+        * value -- True for muting the mixer
+        * info -- the MixerInfo of the mixer, None for probing the mixer
+          (e.g. a mixer missing from the registry)
+    """
+    if info is None:
+        #Unknown capabilities
+        try:
+            mixer.setmute(value)
+        except alsaaudio.ALSAAudioError:
+            pass
+    elif info.has_mute:
         mixer.setmute(value)
-    except:
-        pass
+
+
+def print_state(state):
+    """Prints the given mixer state on one line, as JSON with --json."""
+    if CLI_OPTS['json']:
+        print(json.dumps(state, sort_keys=True))
+    elif state['volume'] is None:
+        print("card=%s mixer=%s unavailable" % (state['card'], state['mixer']))
+    elif 'channels' not in state:
+        print("card=%s mixer=%s volume=%i mute=%s" % (
+                state['card'],
+                state['mixer'],
+                state['volume'],
+                "yes" if state['mute'] else "no",
+                ))
+    else:
+        print("card=%s mixer=%s volume=%i mute=%s channels=%s" % (
+                state['card'],
+                state['mixer'],
+                state['volume'],
+                "yes" if state['mute'] else "no",
+                ",".join(["%i" % volume for volume in state['channels']]),
+                ))
+    sys.stdout.flush()
+
+
+def peek_state():
+    """Prints the state published by the running tray or daemon in the
+    shared state file (see alsa_tray.statefile) and exits. ALSA is not
+    used at all.
+    """
+    from alsa_tray.statefile import read_state
+    state = read_state()
+    if state is None:
+        print("E: No running ALSA Tray.")
+        sys.exit(10)
+    print_state(state)
+    sys.exit(0)
+
+
+def watch_state(controller=None):
+    """Prints the state of the selected mixer each time it changes.
+
+    Blocks on the mixer poll descriptors, so nothing is done between two
+    changes (pyAlsaAudio < 0.8 falls back on polling every 800 ms). Never
+    returns, except if stdout is closed.
+
+    Keyword argument:
+        * controller -- the VolumeController (default: CONTROLLER)
+    """
+    import select
+    if controller is None:
+        controller = CONTROLLER
+    handle = controller.handle
+    generation = None
+    descriptors = []
+    last_state = None
+    while True:
+        try:
+            state = controller.get_state()
+        except alsaaudio.ALSAAudioError:
+            state = controller.unavailable_state()
+        if state != last_state:
+            try:
+                print_state(state)
+            except (IOError, OSError):
+                return #The status bar has gone
+            last_state = state
+        if handle.dead:
+            time.sleep(handle.retry_delay())
+            continue
+        if generation != handle.generation:
+            #(Re)opened mixer
+            generation = handle.generation
+            try:
+                descriptors = handle.get().polldescriptors()
+            except (AttributeError, alsaaudio.ALSAAudioError):
+                descriptors = []
+            poller = select.poll()
+            for fd, events in descriptors:
+                poller.register(fd, events)
+        if descriptors:
+            poller.poll()
+        else:
+            time.sleep(0.8)
+
+
+def check_scene_name(scene_name):
+    """Check if the given scene name is valid (letters, digits, '-' and '_').
+
+    Returns:
+        True if the name is valid, False else.
+    """
+    return len(scene_name) > 0 and \
+           scene_name.replace("-", "").replace("_", "").isalnum()
+
+
+def list_scenes():
+    """Returns the sorted list of the saved scenes names."""
+    if not os.path.isdir(SCENES_DIR_PATH):
+        return []
+    scenes = []
+    for file_name in os.listdir(SCENES_DIR_PATH):
+        if file_name[-6:] == ".scene" and check_scene_name(file_name[:-6]):
+            scenes.append(file_name[:-6])
+    scenes.sort()
+    return scenes
+
+
+def _get_mixer_state(mixer, info):
+    """Returns the (channels volumes, mute) of the given mixer, mute is None
+    if the mixer have no switch.
+    """
+    if info.has_mute:
+        mute = get_mute(mixer, info)
+    else:
+        mute = None
+    return mixer.getvolume(), mute
+
+
+def _restore_mixer_state(mixer, card_name, info, volumes, mute):
+    """Restores the state of a mixer, only writing what differs.
+
+    The current state is read through the same handle.
+
+    Arguments:
+        * mixer -- the alsaaudio.Mixer
+        * card_name -- the name of the card (for the volume limits)
+        * info -- the MixerInfo of the mixer
+        * volumes -- the volume of each channel
+        * mute -- the mute state, None for keeping it
+
+    Returns:
+        True if the mixer was changed, False else.
+    """
+    volumes = [limit_volume(card_name, info.name, volume) for volume in volumes]
+    current_volumes, current_mute = _get_mixer_state(mixer, info)
+    if current_mute is None:
+        mute = None
+    if current_volumes == volumes and \
+       (mute is None or current_mute == mute):
+        return False
+    if current_volumes != volumes:
+        if len(set(volumes)) == 1:
+            mixer.setvolume(volumes[0])
+        else:
+            for channel in range(min(len(volumes), len(current_volumes))):
+                mixer.setvolume(volumes[channel], channel)
+    if mute is not None and current_mute != mute:
+        set_mute(mixer, mute, info)
+    return True
+
+
+def save_scene(scene_name):
+    """Save the volume and mute state of the usable mixers of all the cards.
+
+    The scene file have one line per mixer:
+        <card name> <mixer name> <volume of each channel> <mute: 1, 0 or ->
+    Cards are saved by name since their index can change.
+
+    Argument:
+        * scene_name -- the name of the scene
+    """
+    lines = []
+    for card_info in REGISTRY.cards:
+        for mixer_name in card_info.mixers:
+            mixer = alsaaudio.Mixer(control=mixer_name, cardindex=card_info.index)
+            volumes, mute = _get_mixer_state(
+                    mixer,
+                    card_info.get_mixer(mixer_name),
+                    )
+            lines.append("%s\t%s\t%s\t%s\n" % (
+                    card_info.name,
+                    mixer_name,
+                    ",".join(["%i" % volume for volume in volumes]),
+                    "-" if mute is None else "%i" % mute,
+                    ))
+    if not os.path.isdir(SCENES_DIR_PATH):
+        os.makedirs(SCENES_DIR_PATH)
+    scene_file = open(os.path.join(SCENES_DIR_PATH, "%s.scene" % scene_name), "w")
+    try:
+        scene_file.writelines(lines)
+    finally:
+        scene_file.close()
+
+
+def load_scene(scene_name):
+    """Restore a scene saved with save_scene().
+
+    Only the mixers whose state differs from the scene are written. Mixers
+    of the scene that are not available anymore are ignored.
+
+    Argument:
+        * scene_name -- the name of the scene
+
+    Returns:
+        The number of mixers changed.
+    """
+    scene_file = open(os.path.join(SCENES_DIR_PATH, "%s.scene" % scene_name), "r")
+    try:
+        lines = scene_file.readlines()
+    finally:
+        scene_file.close()
+    changed = 0
+    with MixerLock():
+        for line in lines:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) != 4:
+                continue
+            card_name, mixer_name, volumes, mute = fields
+            card_info = REGISTRY.get_card_by_name(card_name)
+            if card_info is None:
+                continue
+            info = card_info.get_mixer(mixer_name)
+            if info is None:
+                continue
+            try:
+                volumes = [int(volume) for volume in volumes.split(",")]
+            except ValueError:
+                continue
+            mute = None if mute == "-" else mute == "1"
+            mixer = alsaaudio.Mixer(control=mixer_name, cardindex=info.card)
+            if _restore_mixer_state(mixer, card_name, info, volumes, mute):
+                changed += 1
+    return changed
 
 
 def main():
-    global DEBUG, CLI, GUI
+    global DEBUG, CLI, GUI, DAEMON, SNI, TRACE
+
+    #Shared state (before anything touching ALSA)
+    if "--peek" in sys.argv[1:]:
+        CLI_OPTS['json'] = "--json" in sys.argv[1:]
+        peek_state()
+
+    #Simulated sound cards (before anything touching ALSA)
+    latency = os.environ.get("ALSA_TRAY_SIMULATED_LATENCY", "0")
+    latency = int(latency) / 1000.0 if latency.isdigit() else 0.0
+    for arg in sys.argv[1:]:
+        if arg == "--simulated":
+            from alsa_tray import simulated
+            use_backend(simulated.SimulatedBackend(latency=latency))
+            use_sandbox()
+        elif arg[:12] == "--simulated=" and len(arg) > 12:
+            from alsa_tray import simulated
+            use_backend(simulated.SimulatedBackend(latency=latency,
+                                                   state_path=arg[12:]))
+            use_sandbox(os.path.dirname(os.path.abspath(arg[12:])))
+
+    if alsaaudio is None:
+        print("E: pyAlsaAudio is not available")
+        sys.exit(2)
+
+    #Profiling (before listing the cards, for profiling it too)
+    profile_path = os.environ.get("ALSA_TRAY_PROFILE")
+    for arg in sys.argv[1:]:
+        if arg[:10] == "--profile=" and len(arg) > 10:
+            profile_path = arg[10:]
+    if profile_path:
+        start_profiler(profile_path)
 
     #List available cards and mixers
-    ls_cards_mixers()
+    list_cards_or_exit()
     #Read configuration file
     read_config()
     #Check configuration
@@ -871,6 +3392,14 @@ def main():
                 GUI = True
             elif sys.argv[i] ==  "-tray":
                 GUI = False
+            elif sys.argv[i] in ("+daemon", "--daemon"):
+                DAEMON = True
+            elif sys.argv[i] == "-daemon":
+                DAEMON = False
+            elif sys.argv[i] in ("+sni", "--sni"):
+                SNI = True
+            elif sys.argv[i] == "-sni":
+                SNI = False
             elif sys.argv[i] in ("+debug", "--debug"):
                 DEBUG = True
             elif sys.argv[i] == "-debug":
@@ -898,30 +3427,57 @@ def main():
                  int(sys.argv[i]) <= 100:
                 CLI_OPTS['volume'] = sys.argv[i]
                 CLI = True
+            elif sys.argv[i][:13] == "--save-scene=" and \
+                 check_scene_name(sys.argv[i][13:]):
+                CLI_OPTS['scene'] = ("save", sys.argv[i][13:])
+            elif sys.argv[i][:13] == "--load-scene=" and \
+                 check_scene_name(sys.argv[i][13:]):
+                CLI_OPTS['scene'] = ("load", sys.argv[i][13:])
+            elif sys.argv[i][:8] == "--trace=" and len(sys.argv[i]) > 8:
+                from alsa_tray.trace import TraceRecorder
+                try:
+                    TRACE = TraceRecorder(sys.argv[i][8:])
+                except (IOError, OSError) as detail:
+                    print("E: Can't open the trace file: %s" % detail)
+                    sys.exit(1)
+            elif sys.argv[i][:10] == "--profile=" and len(sys.argv[i]) > 10:
+                pass #See above
+            elif sys.argv[i] == "--get":
+                CLI_OPTS['query'] = "get"
+            elif sys.argv[i] == "--watch":
+                CLI_OPTS['query'] = "watch"
+            elif sys.argv[i] == "--json":
+                CLI_OPTS['json'] = True
+            elif sys.argv[i] == "--peek":
+                pass #See above
+            elif sys.argv[i] == "--simulated" or \
+                 (sys.argv[i][:12] == "--simulated=" and len(sys.argv[i]) > 12):
+                pass #See above
             elif sys.argv[i][:8] == "--mixer=" and sys.argv[i][8:].isalnum():
-                MIXER = sys.argv[i][8:]
+                CONTROLLER.mixer = sys.argv[i][8:]
             elif sys.argv[i] in ("--mixer-list", "--mixers-list",
                  "--list-mixer", "--list-mixers"):
-                if check_card(CARD):
+                if check_card(CONTROLLER.card):
                     print("Available mixers:")
-                    for mixer_name in MIXER_LIST[CARD_LIST[CARD]]['mixers']:
+                    for mixer_name in REGISTRY.get_card(CONTROLLER.card).mixers:
                             print("  * %s" % mixer_name)
                     sys.exit(0)
                 else:
-                    print("E: Unknown card 'hw:%i'." % CARD)
+                    print("E: Unknown card 'hw:%i'." % CONTROLLER.card)
                     print("Run asla-tray --card-list for seeing the available cards.")
                     sys.exit(4)
             elif sys.argv[i][:7] == "--card=" and sys.argv[i][7:].isdigit():
-                CARD = int(sys.argv[i][7:])
+                CONTROLLER.card = int(sys.argv[i][7:])
             elif sys.argv[i][:9] in ("--card=hw", "--card=HW") and \
                  sys.argv[i][9:].isdigit():
-                CARD = int(sys.argv[i][9:])
+                CONTROLLER.card = int(sys.argv[i][9:])
             elif sys.argv[i][:10] in ("--card=hw:", "--card=HW:") and \
                  sys.argv[i][10:].isdigit():
-                CARD = int(sys.argv[i][10:])
+                CONTROLLER.card = int(sys.argv[i][10:])
             elif sys.argv[i][:7] == "--card=" and sys.argv[i][7:].isalnum():
-                if sys.argv[i][7:] in CARD_LIST:
-                    CARD = CARD_LIST.index(sys.argv[i][7:])
+                card_info = REGISTRY.get_card_by_name(sys.argv[i][7:])
+                if card_info is not None:
+                    CONTROLLER.card = card_info.index
                 else:
                     print("E: Unknown card '%s'." % sys.argv[i][7:])
                     print("Run asla-tray --card-list for seeing the available cards.")
@@ -929,8 +3485,8 @@ def main():
             elif sys.argv[i] in ("--card-list", "--cards-list",
                  "--list-card", "--list-cards"):
                 print("Available cards:")
-                for card_name in CARD_LIST:
-                    print("    * %s" % MIXER_LIST[card_name]['pretty_name'])
+                for card_info in REGISTRY.cards:
+                    print("    * %s" % card_info.pretty_name)
                 sys.exit(0)
             elif sys.argv[i] in ("-h", "--help", "-?"):
                 print("%s %s" % (__appdispname__, __version__))
@@ -957,7 +3513,9 @@ def main():
             print("Python XDG: available")
         else:
             print("Python XDG: unavailable")
-        if GTK_PLUS:
+        if DAEMON or SNI:
+            print("pyGTK: not loaded (%s mode)" % ("daemon" if DAEMON else "sni"))
+        elif load_gtk():
             print("pyGTK: available")
         else:
             print("pyGTK: unavailable")
@@ -972,13 +3530,13 @@ def main():
         print("")
         #Cards and mixers
         print("==== Cards and mixers ====")
-        for card_name in CARD_LIST:
-            info_line = "%s: " % MIXER_LIST[card_name]['pretty_name']
-            for mixer_name in MIXER_LIST[card_name]['mixers']:
+        for card_info in REGISTRY.cards:
+            info_line = "%s: " % card_info.pretty_name
+            for mixer_name in card_info.mixers:
                     info_line += "%s, " % mixer_name
             print(info_line)
-        print("Selected card: hw:%i" % CARD)
-        print("Selected mixer: %s" % MIXER)
+        print("Selected card: hw:%i" % CONTROLLER.card)
+        print("Selected mixer: %s" % CONTROLLER.mixer)
         print("")
         #Config file
         print("==== Config file ====")
@@ -1005,47 +3563,98 @@ def main():
     check_all()
 
     if CLI:
-        #Mixer
-        mixer = alsaaudio.Mixer(control=MIXER, cardindex=CARD)
-        volume = mixer.getvolume()[0]
-        mute = get_mute(mixer)
+        trace_event("cli", volume=CLI_OPTS['volume'], mute=CLI_OPTS['mute'])
         #Volume
-        if CLI_OPTS['volume'][0] == "+":
-            volume += int(CLI_OPTS['volume'][1:])
-        elif  CLI_OPTS['volume'][0] == "-":
-            volume -= int(CLI_OPTS['volume'][1:])
+        if CLI_OPTS['volume'][0] in ("+", "-"):
+            volume = None
+            delta = int(CLI_OPTS['volume'])
         else:
             volume = int(CLI_OPTS['volume'])
-        if volume > 100:
-            volume = 100
-        elif volume < 0:
-            volume = 0
+            delta = 0
         #Mute
+        mute = None
         if CLI_OPTS['mute'] == "mute":
             mute = True
         elif CLI_OPTS['mute'] == "unmute":
             mute = False
-        elif CLI_OPTS['mute'] == "toggle":
-            mute = not mute
-        #Set
-        mixer.setvolume(volume)
-        set_mute(mixer, mute)
+        try:
+            with profile_section("cli"):
+                volume, mute = CONTROLLER.update(
+                        volume=volume,
+                        delta=delta,
+                        mute=mute,
+                        toggle=CLI_OPTS['mute'] == "toggle",
+                        )
+        except alsaaudio.ALSAAudioError as detail:
+            print("E: Can't set the volume of '%s' (hw:%i): %s" % (
+                    CONTROLLER.mixer, CONTROLLER.card, detail))
+            sys.exit(9)
         #Notify
         if mute:
             notify(0, default=False)
         else:
             notify(volume, default=False)
         #Print infos
-        if mute:
-            print(_("Volume: {VOLUME}, mute").replace("{VOLUME}", "%i%%" % volume))
-        else:
-            print(_("Volume: {VOLUME}").replace("{VOLUME}", "%i%%" % volume))
+        print(volume_text(volume, mute))
+
+    if CLI_OPTS['scene'] is not None:
+        action, scene_name = CLI_OPTS['scene']
+        try:
+            if action == "save":
+                save_scene(scene_name)
+                print("Scene '%s' saved." % scene_name)
+            else:
+                changed = load_scene(scene_name)
+                print("Scene '%s' loaded (%i controls changed)." % (
+                        scene_name, changed))
+        except (IOError, OSError, alsaaudio.ALSAAudioError) as detail:
+            print("E: Can't %s the scene '%s': %s" % (action, scene_name, detail))
+            sys.exit(8)
+        sys.exit(0)
+
+    if CLI_OPTS['query'] == "get":
+        try:
+            print_state(CONTROLLER.get_state())
+        except alsaaudio.ALSAAudioError as detail:
+            print("E: Can't read the volume of '%s' (hw:%i): %s" % (
+                    CONTROLLER.mixer, CONTROLLER.card, detail))
+            sys.exit(9)
+        sys.exit(0)
+    elif CLI_OPTS['query'] == "watch":
+        try:
+            watch_state()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
 
-    if GUI or not CLI:
-        if not GTK_PLUS:
+    if DAEMON:
+        if not GLIB:
+            print("E: Can't run as a daemon: PyGObject is not available.")
+            sys.exit(5)
+        alsa_daemon = ALSADaemon()
+        loop = GLib.MainLoop()
+        watch_signals(loop.quit)
+        try:
+            loop.run()
+        except KeyboardInterrupt:
+            sys.exit(0)
+    elif SNI:
+        if not GLIB or not DBUS:
+            print("E: Can't run in systray: PyGObject or dbus-python is not available.")
+            sys.exit(5)
+        from alsa_tray.sni import SNITray
+        sni_tray = SNITray()
+        watch_signals(sni_tray.quit)
+        try:
+            sni_tray.run()
+        except KeyboardInterrupt:
+            sys.exit(0)
+    elif GUI or not CLI:
+        if not load_gtk():
             print("E: Can't run in systray: pyGTK is not available.")
             sys.exit(5)
         alsa_volume = ALSATray()
+        watch_signals(Gtk.main_quit)
         try:
              Gtk.main()
         except KeyboardInterrupt:
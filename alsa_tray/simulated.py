@@ -0,0 +1,356 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+############################################################################
+##                                                                        ##
+## ALSA Tray - provides a tray icon for setting ALSA mixers volume        ##
+##                                                                        ##
+## Copyright (C) 2010-2012  Fabien Loison (www.flogisoft.com)             ##
+## Copyright (C) 2018 Beniamin Kalinowski (beniamin.kalinowski@gmail.com) ##
+##                                                                        ##
+## This program is free software: you can redistribute it and/or modify   ##
+## it under the terms of the GNU General Public License as published by   ##
+## the Free Software Foundation, either version 3 of the License, or      ##
+## (at your option) any later version.                                    ##
+##                                                                        ##
+## This program is distributed in the hope that it will be useful,        ##
+## but WITHOUT ANY WARRANTY; without even the implied warranty of         ##
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          ##
+## GNU General Public License for more details.                           ##
+##                                                                        ##
+## You should have received a copy of the GNU General Public License      ##
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.  ##
+##                                                                        ##
+############################################################################
+
+
+"""A simulated pyAlsaAudio backend.
+
+Provides the subset of the pyAlsaAudio API used by ALSA Tray (cards(),
+mixers(), Mixer and ALSAAudioError) on top of in-memory sound cards, so
+that ALSA Tray can be run without any sound hardware. The backend can
+inject ALSA errors at a configurable rate, unplug and replug cards, add a
+latency to each call, and counts the calls made.
+
+The volumes and mute states can also be kept in a JSON file (state_path),
+so that several processes (e.g. 'alsa-tray --simulated=<File> +1') share
+the same simulated cards. Only the controls are shared: the plugged state,
+the errors, the call counters and the poll descriptors stay per process.
+
+USAGE:
+    from alsa_tray import alsa_tray, simulated
+
+    backend = simulated.SimulatedBackend(failure_rate=0.05, seed=42)
+    alsa_tray.use_backend(backend)
+    ...
+    backend.unplug("PCH")
+    ...
+    backend.plug("PCH")
+    print(backend.calls)
+"""
+
+
+import os
+import fcntl
+import json
+import random
+import threading
+import time
+import weakref
+
+
+DEFAULT_CARDS = [
+        ("PCH", ["Master", "Headphone", "Speaker", "PCM"]),
+        ("Headset", ["PCM"]),
+        ]
+
+
+class ALSAAudioError(Exception):
+
+    """The error raised by the simulated backend"""
+
+
+class SimulatedControl(object):
+
+    """The state of a simulated mixer control"""
+
+    def __init__(self, name, channels=2, has_switch=True):
+        self.name = name
+        self.volumes = [50] * channels
+        self.mute = False
+        self.has_switch = has_switch
+
+
+class SimulatedCard(object):
+
+    """A simulated sound card"""
+
+    def __init__(self, name, controls):
+        self.name = name
+        self.plugged = True
+        self.controls = []
+        for control in controls:
+            #PCM controls usually have no switch
+            self.controls.append(SimulatedControl(
+                    control,
+                    has_switch=(control != "PCM"),
+                    ))
+        #Like the real mixers, the handles are closed when released
+        self.handles = weakref.WeakSet()
+
+
+class SimulatedBackend(object):
+
+    """A simulated pyAlsaAudio module.
+
+    Methods:
+        * cards -- like alsaaudio.cards()
+        * mixers -- like alsaaudio.mixers()
+        * Mixer -- like alsaaudio.Mixer()
+        * plug -- replug a card
+        * unplug -- unplug a card
+        * set_failure_rate -- change the rate of the injected errors
+
+    Attributes:
+        * calls -- the number of calls, by function name
+        * state_path -- the file sharing the controls states, or None
+        * ALSAAudioError -- the error raised by the backend
+    """
+
+    ALSAAudioError = ALSAAudioError
+
+    def __init__(self, cards=None, failure_rate=0.0, seed=None, latency=0.0,
+                 poll_events=True, state_path=None):
+        """The constructor.
+
+        Keyword arguments:
+            * cards -- list of (card name, [control names]) (default:
+              DEFAULT_CARDS)
+            * failure_rate -- the probability of each call raising an
+              ALSAAudioError (0.0 - 1.0)
+            * seed -- the seed of the random errors
+            * latency -- the duration of each call (in seconds)
+            * poll_events -- False for mixers without poll descriptors, like
+              pyAlsaAudio < 0.8
+            * state_path -- a JSON file keeping the volumes and mute states
+              of the controls, read before each control access and written
+              after each change (default: None, states kept in memory)
+        """
+        self.calls = {}
+        self.state_path = state_path
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.poll_events = poll_events
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._cards = []
+        for card_name, controls in (cards or DEFAULT_CARDS):
+            self._cards.append(SimulatedCard(card_name, controls))
+
+    def set_failure_rate(self, failure_rate):
+        self.failure_rate = failure_rate
+
+    def plug(self, card_name):
+        with self._lock:
+            self._get_card_by_name(card_name).plugged = True
+
+    def unplug(self, card_name):
+        with self._lock:
+            card = self._get_card_by_name(card_name)
+            card.plugged = False
+            for handle in list(card.handles):
+                handle.notify()
+
+    def cards(self):
+        self._call("cards")
+        return [card.name for card in self._cards if card.plugged]
+
+    def mixers(self, cardindex=0, device="default"):
+        self._call("mixers")
+        return [control.name for control in self._get_card(cardindex).controls]
+
+    def Mixer(self, control="Master", id=0, cardindex=0, device="default"):
+        self._call("Mixer")
+        card = self._get_card(cardindex)
+        for simulated_control in card.controls:
+            if simulated_control.name == control:
+                return SimulatedMixer(self, card, simulated_control)
+        raise ALSAAudioError("Unable to find mixer control %s,%i" % (control, id))
+
+    def _call(self, name, card=None):
+        """Counts a call, waits the latency, and maybe raises an error"""
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            failed = self.failure_rate > 0 and \
+                     self._random.random() < self.failure_rate
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if failed:
+            raise ALSAAudioError("Input/output error [simulated]")
+        if card is not None and not card.plugged:
+            raise ALSAAudioError("No such device [simulated]")
+
+    def _load_state(self):
+        """Reads the states of the controls in the state file, if any"""
+        if self.state_path is None:
+            return
+        try:
+            state_file = open(self.state_path, "r")
+            try:
+                states = json.load(state_file)
+            finally:
+                state_file.close()
+        except (IOError, OSError, ValueError):
+            return #Not written yet: the initial states
+        for card in self._cards:
+            for control in card.controls:
+                key = "%s/%s" % (card.name, control.name)
+                if key in states:
+                    control.volumes, control.mute = states[key]
+
+    def _save_state(self):
+        """Writes the states of the controls in the state file (atomically,
+        the other processes never read a partial file)
+        """
+        if self.state_path is None:
+            return
+        states = {}
+        for card in self._cards:
+            for control in card.controls:
+                states["%s/%s" % (card.name, control.name)] = \
+                        [control.volumes, control.mute]
+        temp_path = "%s.%i.tmp" % (self.state_path, os.getpid())
+        state_file = open(temp_path, "w")
+        try:
+            json.dump(states, state_file, sort_keys=True)
+        finally:
+            state_file.close()
+        os.rename(temp_path, self.state_path)
+
+    def _get_card(self, cardindex):
+        plugged = [card for card in self._cards if card.plugged]
+        if cardindex < 0 or cardindex >= len(plugged):
+            raise ALSAAudioError("No such card [simulated]")
+        return plugged[cardindex]
+
+    def _get_card_by_name(self, card_name):
+        for card in self._cards:
+            if card.name == card_name:
+                return card
+        raise ValueError("Unknown simulated card '%s'" % card_name)
+
+
+class SimulatedMixer(object):
+
+    """A simulated alsaaudio.Mixer.
+
+    Like the real one, each handle have a poll descriptor that becomes
+    readable when the controls of the card are changed by another handle,
+    until handleevents() is called.
+    """
+
+    def __init__(self, backend, card, control):
+        self._backend = backend
+        self._card = card
+        self._control = control
+        self._read_fd, self._write_fd = os.pipe()
+        for fd in (self._read_fd, self._write_fd):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        card.handles.add(self)
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if self._read_fd is None:
+            return
+        self._card.handles.discard(self)
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+        self._read_fd = None
+        self._write_fd = None
+
+    def notify(self):
+        """Makes the poll descriptor readable"""
+        try:
+            os.write(self._write_fd, b"!")
+        except (OSError, TypeError):
+            pass #Pipe full (already readable) or closed
+
+    def _changed(self):
+        with self._backend._lock:
+            for handle in list(self._card.handles):
+                if handle is not self:
+                    handle.notify()
+
+    def cardname(self):
+        return self._card.name
+
+    def mixer(self):
+        return self._control.name
+
+    def volumecap(self):
+        self._backend._call("volumecap", self._card)
+        return ["Volume", "Joined Volume"]
+
+    def switchcap(self):
+        self._backend._call("switchcap", self._card)
+        if self._control.has_switch:
+            return ["Mute", "Joined Mute"]
+        return []
+
+    def getrange(self):
+        self._backend._call("getrange", self._card)
+        return [0, 100]
+
+    def getvolume(self):
+        self._backend._call("getvolume", self._card)
+        with self._backend._lock:
+            self._backend._load_state()
+            return list(self._control.volumes)
+
+    def setvolume(self, volume, channel=None):
+        self._backend._call("setvolume", self._card)
+        with self._backend._lock:
+            self._backend._load_state()
+            if channel is None:
+                self._control.volumes = [volume] * len(self._control.volumes)
+            else:
+                self._control.volumes[channel] = volume
+            self._backend._save_state()
+        self._changed()
+
+    def getmute(self):
+        self._backend._call("getmute", self._card)
+        if not self._control.has_switch:
+            raise ALSAAudioError("Mixer %s has no mute switch" % self._control.name)
+        with self._backend._lock:
+            self._backend._load_state()
+            return [int(self._control.mute)] * len(self._control.volumes)
+
+    def setmute(self, mute, channel=None):
+        self._backend._call("setmute", self._card)
+        if not self._control.has_switch:
+            raise ALSAAudioError("Mixer %s has no mute switch" % self._control.name)
+        with self._backend._lock:
+            self._backend._load_state()
+            self._control.mute = bool(mute)
+            self._backend._save_state()
+        self._changed()
+
+    def polldescriptors(self):
+        if not self._backend.poll_events:
+            raise AttributeError("'alsaaudio.Mixer' object has no attribute "
+                                 "'polldescriptors'")
+        self._backend._call("polldescriptors", self._card)
+        return [(self._read_fd, 1)] #POLLIN
+
+    def handleevents(self):
+        self._backend._call("handleevents", self._card)
+        try:
+            while os.read(self._read_fd, 64):
+                pass
+        except OSError:
+            pass #Nothing left
+        return 0
@@ -0,0 +1,650 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+############################################################################
+##                                                                        ##
+## ALSA Tray - provides a tray icon for setting ALSA mixers volume        ##
+##                                                                        ##
+## Copyright (C) 2010-2012  Fabien Loison (www.flogisoft.com)             ##
+## Copyright (C) 2018 Beniamin Kalinowski (beniamin.kalinowski@gmail.com) ##
+##                                                                        ##
+## This program is free software: you can redistribute it and/or modify   ##
+## it under the terms of the GNU General Public License as published by   ##
+## the Free Software Foundation, either version 3 of the License, or      ##
+## (at your option) any later version.                                    ##
+##                                                                        ##
+## This program is distributed in the hope that it will be useful,        ##
+## but WITHOUT ANY WARRANTY; without even the implied warranty of         ##
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          ##
+## GNU General Public License for more details.                           ##
+##                                                                        ##
+## You should have received a copy of the GNU General Public License      ##
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.  ##
+##                                                                        ##
+############################################################################
+
+
+"""A StatusNotifierItem tray backend (alsa-tray --sni).
+
+Exports the tray icon, its tooltip and its menu on the D-Bus session bus
+with the StatusNotifierItem and DBusMenu protocols, used by the modern
+panels (KDE Plasma, Xfce, LXQt, waybar, GNOME with the AppIndicator
+extension...) instead of the XEmbed protocol of Gtk.StatusIcon.
+
+Only PyGObject's GLib and dbus-python are needed for the icon and the menu:
+GTK+ is loaded when the slider popup, the mixers panel or a dialog is
+opened for the first time.
+
+The property changes are batched: the changes made during one main loop
+iteration are emitted once, in one signal per changed property.
+
+SYNOPSIS:
+    python -m alsa_tray.sni [--simulated]
+
+OPTIONS:
+    --simulated
+        Run on the simulated backend (see alsa_tray.simulated), e.g. for
+        testing on a private session bus:
+            dbus-run-session -- python -m alsa_tray.sni --simulated
+"""
+
+
+import os
+import sys
+
+import dbus
+import dbus.service
+from dbus.mainloop.glib import DBusGMainLoop
+from gi.repository import GLib
+
+from alsa_tray import alsa_tray
+from alsa_tray.alsa_tray import _
+
+
+SNI_INTERFACE = "org.kde.StatusNotifierItem"
+SNI_PATH = "/StatusNotifierItem"
+WATCHER_NAME = "org.kde.StatusNotifierWatcher"
+WATCHER_PATH = "/StatusNotifierWatcher"
+MENU_INTERFACE = "com.canonical.dbusmenu"
+MENU_PATH = "/MenuBar"
+
+
+class StatusNotifierItem(dbus.service.Object):
+
+    """The org.kde.StatusNotifierItem object.
+
+    Methods:
+        * set -- change some properties (batched)
+
+    The Activate, SecondaryActivate, Scroll and ContextMenu calls of the
+    host are forwarded to the on_activate, on_secondary_activate,
+    on_scroll and on_context_menu methods of the tray.
+    """
+
+    #The signal emitted when each property changes
+    SIGNALS = {
+            'Title': "NewTitle",
+            'IconName': "NewIcon",
+            'AttentionIconName': "NewAttentionIcon",
+            'OverlayIconName': "NewOverlayIcon",
+            'ToolTip': "NewToolTip",
+            }
+
+    def __init__(self, bus, tray, properties):
+        """The constructor.
+
+        Arguments:
+            * bus -- the dbus.SessionBus
+            * tray -- the SNITray
+            * properties -- the initial properties
+        """
+        dbus.service.Object.__init__(self, bus, SNI_PATH)
+        self._tray = tray
+        self._properties = properties
+        self._changed = {}
+        self._flush_source = None
+
+    def set(self, **properties):
+        """Changes some properties.
+
+        The signals are emitted once per main loop iteration, only for the
+        properties whose value changed.
+        """
+        for name, value in properties.items():
+            if self._properties.get(name) == value:
+                continue
+            self._properties[name] = value
+            self._changed[name] = value
+        if self._changed and self._flush_source is None:
+            self._flush_source = GLib.idle_add(self._flush)
+
+    def _flush(self):
+        self._flush_source = None
+        changed = self._changed
+        self._changed = {}
+        for name in changed:
+            if name == "Status":
+                self.NewStatus(changed[name])
+            elif name in self.SIGNALS:
+                getattr(self, self.SIGNALS[name])()
+        self.PropertiesChanged(SNI_INTERFACE, changed, [])
+        return False
+
+    #### org.kde.StatusNotifierItem ####
+
+    @dbus.service.method(SNI_INTERFACE, in_signature="ii")
+    def Activate(self, x, y):
+        self._tray.on_activate(x, y)
+
+    @dbus.service.method(SNI_INTERFACE, in_signature="ii")
+    def SecondaryActivate(self, x, y):
+        self._tray.on_secondary_activate(x, y)
+
+    @dbus.service.method(SNI_INTERFACE, in_signature="is")
+    def Scroll(self, delta, orientation):
+        self._tray.on_scroll(delta, orientation)
+
+    @dbus.service.method(SNI_INTERFACE, in_signature="ii")
+    def ContextMenu(self, x, y):
+        self._tray.on_context_menu(x, y)
+
+    @dbus.service.signal(SNI_INTERFACE)
+    def NewTitle(self):
+        pass
+
+    @dbus.service.signal(SNI_INTERFACE)
+    def NewIcon(self):
+        pass
+
+    @dbus.service.signal(SNI_INTERFACE)
+    def NewAttentionIcon(self):
+        pass
+
+    @dbus.service.signal(SNI_INTERFACE)
+    def NewOverlayIcon(self):
+        pass
+
+    @dbus.service.signal(SNI_INTERFACE)
+    def NewToolTip(self):
+        pass
+
+    @dbus.service.signal(SNI_INTERFACE, signature="s")
+    def NewStatus(self, status):
+        pass
+
+    #### org.freedesktop.DBus.Properties ####
+
+    @dbus.service.method(dbus.PROPERTIES_IFACE, in_signature="ss", out_signature="v")
+    def Get(self, interface, name):
+        if interface != SNI_INTERFACE or name not in self._properties:
+            raise dbus.exceptions.DBusException(
+                    "Unknown property %s.%s" % (interface, name),
+                    name="org.freedesktop.DBus.Error.UnknownProperty",
+                    )
+        return self._properties[name]
+
+    @dbus.service.method(dbus.PROPERTIES_IFACE, in_signature="s", out_signature="a{sv}")
+    def GetAll(self, interface):
+        if interface != SNI_INTERFACE:
+            return dbus.Dictionary({}, signature="sv")
+        return dbus.Dictionary(self._properties, signature="sv")
+
+    @dbus.service.signal(dbus.PROPERTIES_IFACE, signature="sa{sv}as")
+    def PropertiesChanged(self, interface, changed, invalidated):
+        pass
+
+
+class DBusMenu(dbus.service.Object):
+
+    """The com.canonical.dbusmenu object of the tray menu.
+
+    The item 0 is the root of the menu. Items are dicts of DBusMenu
+    properties (label, type, toggle-type, toggle-state, children-display,
+    icon-data...).
+
+    Methods:
+        * add_item -- add an item
+        * clear -- remove the children of an item
+        * set_properties -- change the properties of an item (batched)
+    """
+
+    def __init__(self, bus):
+        """The constructor.
+
+        Argument:
+            * bus -- the dbus.SessionBus
+        """
+        dbus.service.Object.__init__(self, bus, MENU_PATH)
+        self._revision = 1
+        self._next_id = 1
+        self._items = {0: {'children-display': "submenu"}}
+        self._children = {0: []}
+        self._callbacks = {}
+        self._about_to_show = {}
+        self._changed = {}
+        self._layout_changed = set()
+        self._flush_source = None
+
+    def add_item(self, parent, properties, callback=None, args=(),
+                 about_to_show=None):
+        """Adds an item.
+
+        Arguments:
+            * parent -- the id of the parent item
+            * properties -- the properties of the item
+
+        Keyword arguments:
+            * callback -- the function called with (None, *args) when the
+              item is clicked, like the GTK+ menu items handlers
+            * args -- the extra arguments of the callback
+            * about_to_show -- the function called before showing the
+              children of the item, returns True if they changed
+
+        Returns:
+            The id of the item.
+        """
+        item_id = self._next_id
+        self._next_id += 1
+        self._items[item_id] = dict(properties)
+        self._children[item_id] = []
+        self._children[parent].append(item_id)
+        if callback is not None:
+            self._callbacks[item_id] = (callback, args)
+        if about_to_show is not None:
+            self._about_to_show[item_id] = about_to_show
+        self._schedule(layout=parent)
+        return item_id
+
+    def clear(self, parent):
+        """Removes all the children of an item"""
+        for item_id in self._children[parent]:
+            self.clear(item_id)
+            del self._items[item_id]
+            del self._children[item_id]
+            self._callbacks.pop(item_id, None)
+            self._about_to_show.pop(item_id, None)
+            self._changed.pop(item_id, None)
+        self._children[parent] = []
+        self._schedule(layout=parent)
+
+    def set_properties(self, item_id, **properties):
+        """Changes some properties of an item.
+
+        The ItemsPropertiesUpdated signal is emitted once per main loop
+        iteration, with only the properties whose value changed.
+        """
+        item = self._items[item_id]
+        for name, value in properties.items():
+            if item.get(name) == value:
+                continue
+            item[name] = value
+            self._changed.setdefault(item_id, {})[name] = value
+        if item_id in self._changed:
+            self._schedule()
+
+    def _schedule(self, layout=None):
+        if layout is not None:
+            self._layout_changed.add(layout)
+        if self._flush_source is None:
+            self._flush_source = GLib.idle_add(self._flush)
+
+    def _flush(self):
+        self._flush_source = None
+        if self._layout_changed:
+            self._revision += 1
+            #The parent of all the changed items
+            parent = 0 if len(self._layout_changed) > 1 else self._layout_changed.pop()
+            self._layout_changed = set()
+            self._changed = {}
+            self.LayoutUpdated(self._revision, parent)
+        elif self._changed:
+            changed = self._changed
+            self._changed = {}
+            self.ItemsPropertiesUpdated(
+                    [dbus.Struct((item_id, dbus.Dictionary(properties, signature="sv")),
+                                 signature="ia{sv}")
+                     for item_id, properties in changed.items()],
+                    dbus.Array([], signature="(ias)"),
+                    )
+        return False
+
+    def _get_properties(self, item_id, names):
+        properties = self._items[item_id]
+        if len(names) > 0:
+            properties = dict([(name, value) for name, value in properties.items()
+                               if name in names])
+        return dbus.Dictionary(properties, signature="sv")
+
+    def _get_layout(self, item_id, depth, names):
+        children = []
+        if depth != 0:
+            for child_id in self._children[item_id]:
+                children.append(self._get_layout(child_id, depth - 1, names))
+        return dbus.Struct(
+                (
+                    dbus.Int32(item_id),
+                    self._get_properties(item_id, names),
+                    dbus.Array(children, signature="v"),
+                ),
+                signature="ia{sv}av",
+                )
+
+    #### com.canonical.dbusmenu ####
+
+    @dbus.service.method(MENU_INTERFACE, in_signature="iias",
+                         out_signature="u(ia{sv}av)")
+    def GetLayout(self, parent_id, recursion_depth, property_names):
+        if parent_id not in self._items:
+            raise dbus.exceptions.DBusException("Unknown item %i" % parent_id)
+        return (
+                dbus.UInt32(self._revision),
+                self._get_layout(parent_id, recursion_depth, property_names),
+                )
+
+    @dbus.service.method(MENU_INTERFACE, in_signature="aias",
+                         out_signature="a(ia{sv})")
+    def GetGroupProperties(self, ids, property_names):
+        if len(ids) == 0:
+            ids = self._items.keys()
+        return [dbus.Struct((item_id, self._get_properties(item_id, property_names)),
+                            signature="ia{sv}")
+                for item_id in ids if item_id in self._items]
+
+    @dbus.service.method(MENU_INTERFACE, in_signature="is", out_signature="v")
+    def GetProperty(self, item_id, name):
+        try:
+            return self._items[item_id][name]
+        except KeyError:
+            raise dbus.exceptions.DBusException(
+                    "Unknown property %s of item %i" % (name, item_id))
+
+    @dbus.service.method(MENU_INTERFACE, in_signature="isvu")
+    def Event(self, item_id, event_id, data, timestamp):
+        if event_id != "clicked" or item_id not in self._callbacks:
+            return
+        callback, args = self._callbacks[item_id]
+        #Out of the D-Bus call: the callback can open a modal dialog
+        GLib.idle_add(self._run_callback, callback, args)
+
+    @dbus.service.method(MENU_INTERFACE, in_signature="a(isvu)", out_signature="ai")
+    def EventGroup(self, events):
+        errors = []
+        for item_id, event_id, data, timestamp in events:
+            if item_id in self._items:
+                self.Event(item_id, event_id, data, timestamp)
+            else:
+                errors.append(item_id)
+        return dbus.Array(errors, signature="i")
+
+    @dbus.service.method(MENU_INTERFACE, in_signature="i", out_signature="b")
+    def AboutToShow(self, item_id):
+        if item_id in self._about_to_show:
+            return bool(self._about_to_show[item_id]())
+        return False
+
+    @dbus.service.method(MENU_INTERFACE, in_signature="ai", out_signature="aiai")
+    def AboutToShowGroup(self, ids):
+        updates = [item_id for item_id in ids if self.AboutToShow(item_id)]
+        errors = [item_id for item_id in ids if item_id not in self._items]
+        return (dbus.Array(updates, signature="i"), dbus.Array(errors, signature="i"))
+
+    @dbus.service.signal(MENU_INTERFACE, signature="a(ia{sv})a(ias)")
+    def ItemsPropertiesUpdated(self, updated, removed):
+        pass
+
+    @dbus.service.signal(MENU_INTERFACE, signature="ui")
+    def LayoutUpdated(self, revision, parent):
+        pass
+
+    #### org.freedesktop.DBus.Properties ####
+
+    @dbus.service.method(dbus.PROPERTIES_IFACE, in_signature="ss", out_signature="v")
+    def Get(self, interface, name):
+        return self.GetAll(interface)[name]
+
+    @dbus.service.method(dbus.PROPERTIES_IFACE, in_signature="s", out_signature="a{sv}")
+    def GetAll(self, interface):
+        return dbus.Dictionary({
+                'Version': dbus.UInt32(3),
+                'TextDirection': "ltr",
+                'Status': "normal",
+                'IconThemePath': dbus.Array([], signature="s"),
+                }, signature="sv")
+
+    def _run_callback(self, callback, args):
+        callback(None, *args)
+        return False
+
+
+class SNITray(alsa_tray.ALSATray):
+
+    """The ALSA Tray icon, exported with the StatusNotifierItem protocol.
+
+    The mixer I/O, the scenes, the multimedia keys, the dialogs... are the
+    ones of ALSATray; only the icon and the menu are replaced, and the
+    GTK+ widgets are built on their first use.
+    """
+
+    def __init__(self, controller=None, bus=None):
+        """The constructor.
+
+        Keyword arguments:
+            * controller -- the VolumeController (default: CONTROLLER)
+            * bus -- the dbus.SessionBus (default: a new connection)
+        """
+        self.controller = controller or alsa_tray.CONTROLLER
+        self.handle_menu_mute = True
+        self.handle_slider = True
+        self.volume = 0
+        self.mute = False
+        #### GTK+ widgets (built on the first use) ####
+        self.window = None
+        self.slider = None
+        self.panel = None
+        self.config_dialog = None
+        self._position = (0, 0)
+        self._loop = GLib.MainLoop()
+        #### D-Bus ####
+        if bus is None:
+            bus = dbus.SessionBus(mainloop=DBusGMainLoop())
+        self._bus = bus
+        self._bus_name = dbus.service.BusName(
+                "org.kde.StatusNotifierItem-%i-1" % os.getpid(),
+                bus,
+                )
+        self._item = StatusNotifierItem(bus, self, {
+                'Category': "Hardware",
+                'Id': alsa_tray.__appname__,
+                'Title': alsa_tray.__appdispname__,
+                'Status': "Active",
+                'IconName': alsa_tray.VOL_ICON[0],
+                'IconThemePath': "",
+                'ToolTip': self._get_tooltip(""),
+                'ItemIsMenu': False,
+                'Menu': dbus.ObjectPath(MENU_PATH),
+                'WindowId': dbus.Int32(0),
+                })
+        self._menu = DBusMenu(bus)
+        self._build_menu()
+        #(Re)register each time a host (panel) appears
+        bus.watch_name_owner(WATCHER_NAME, self.on_watcher_owner_changed)
+        self._init_mixer_io()
+
+    def run(self):
+        self._loop.run()
+
+    def quit(self):
+        self._loop.quit()
+
+    def _build_menu(self):
+        menu = self._menu
+        self._menu_mute = menu.add_item(0, {
+                'label': _("Mute"),
+                'toggle-type': "checkmark",
+                'toggle-state': 0,
+                }, self.on_menu_mute_activate)
+        menu.add_item(0, {'type': "separator"})
+        #Mixers
+        launchers = alsa_tray.find_mixer_launchers()
+        icon_data = self._get_mixer_icon_data()
+        for label, command in launchers:
+            properties = {'label': label}
+            if icon_data is not None:
+                properties['icon-data'] = icon_data
+            menu.add_item(0, properties, self.on_menu_mixer_activate, (command,))
+        if len(launchers) > 0:
+            menu.add_item(0, {'type': "separator"})
+        #Scenes (filled before being shown)
+        self._menu_scenes = menu.add_item(0, {
+                'label': _("Scenes"),
+                'children-display': "submenu",
+                }, about_to_show=self._update_scenes_menu)
+        self._scenes = None
+        self._update_scenes_menu()
+        menu.add_item(0, {'type': "separator"})
+        #
+        menu.add_item(0, {'label': _("Preferences"), 'icon-name': "preferences-system"},
+                      self._with_gtk(self.on_menu_preferences_avtivate))
+        menu.add_item(0, {'type': "separator"})
+        menu.add_item(0, {'label': _("About"), 'icon-name': "help-about"},
+                      self._with_gtk(self.on_menu_about_activate))
+        menu.add_item(0, {'label': _("Quit"), 'icon-name': "application-exit"},
+                      self.on_menu_quit_activate)
+
+    def _update_scenes_menu(self):
+        scenes = alsa_tray.list_scenes()
+        if scenes == self._scenes:
+            return False
+        self._scenes = scenes
+        self._menu.clear(self._menu_scenes)
+        for scene_name in scenes:
+            self._menu.add_item(
+                    self._menu_scenes,
+                    {'label': scene_name},
+                    self.on_menu_scene_activate,
+                    (scene_name,),
+                    )
+        if len(scenes) > 0:
+            self._menu.add_item(self._menu_scenes, {'type': "separator"})
+        self._menu.add_item(
+                self._menu_scenes,
+                {'label': _("Save current scene...")},
+                self._with_gtk(self.on_menu_save_scene_activate),
+                )
+        return True
+
+    def _get_mixer_icon_data(self):
+        """Returns the PNG data of the mixer icon, None if not found"""
+        try:
+            icon_file = open(alsa_tray.MIXER_ICON_PATH, "rb")
+        except (IOError, OSError):
+            return None
+        try:
+            return dbus.ByteArray(icon_file.read())
+        finally:
+            icon_file.close()
+
+    def _get_tooltip(self, text):
+        return dbus.Struct(
+                ("", dbus.Array([], signature="(iiay)"), alsa_tray.__appdispname__, text),
+                signature="sa(iiay)ss",
+                )
+
+    def _with_gtk(self, handler):
+        """Returns a menu handler loading GTK+ before calling handler"""
+        def gtk_handler(widget, *args):
+            if not alsa_tray.load_gtk():
+                print("E: GTK+ 3 is not available.")
+                return
+            handler(widget, *args)
+        return gtk_handler
+
+    def _set_menu_mute(self, mute):
+        self._menu.set_properties(self._menu_mute, **{'toggle-state': int(mute)})
+
+    def _set_icon(self, icon_name, tooltip):
+        self._item.set(IconName=icon_name, ToolTip=self._get_tooltip(tooltip))
+
+    def _set_win_position(self, window):
+        """Moves the window next to the point where the icon was clicked"""
+        x, y = self._position
+        screen = alsa_tray.Gdk.Screen.get_default()
+        width, height = window.get_size()
+        if y > screen.get_height() / 2: #Panel at BOTTOM
+            y -= height
+        if x > screen.get_width() - width: #Panel at RIGHT
+            x -= width
+        window.move(max(0, x), max(0, y))
+
+    def on_activate(self, x, y):
+        if not alsa_tray.load_gtk():
+            print("E: GTK+ 3 is not available.")
+            return
+        self._position = (x, y)
+        if self.window is None:
+            self._build_slider()
+        self.on_tray_icon_activate(None)
+        if self.window.get_visible():
+            self.window.present()
+
+    def on_secondary_activate(self, x, y):
+        alsa_tray.trace_event("mute")
+        self._toggle_mute(False)
+
+    def on_scroll(self, delta, orientation):
+        if orientation.lower() != "vertical":
+            return
+        #Some hosts send 120 per wheel notch, others 1
+        if abs(delta) >= 120:
+            self._scroll.add(delta / 120.0)
+        else:
+            self._scroll.add(delta)
+
+    def on_context_menu(self, x, y):
+        pass #The host shows the DBusMenu
+
+    def on_menu_quit_activate(self, widget):
+        self.quit()
+
+    def on_watcher_owner_changed(self, owner):
+        if not owner:
+            if alsa_tray.DEBUG:
+                print("W: No StatusNotifierWatcher on the session bus, waiting for one...")
+            return
+        watcher = self._bus.get_object(WATCHER_NAME, WATCHER_PATH)
+        watcher.RegisterStatusNotifierItem(
+                self._bus_name.get_name(),
+                dbus_interface=WATCHER_NAME,
+                reply_handler=self.on_register_reply,
+                error_handler=self.on_register_error,
+                )
+
+    def on_register_reply(self):
+        if alsa_tray.DEBUG:
+            print("I: Registered on the StatusNotifierWatcher.")
+
+    def on_register_error(self, error):
+        print("W: Can't register on the StatusNotifierWatcher: %s" % error)
+
+
+def main():
+    if "--simulated" in sys.argv[1:]:
+        from alsa_tray import simulated
+        alsa_tray.use_backend(simulated.SimulatedBackend())
+        alsa_tray.use_sandbox()
+    elif alsa_tray.alsaaudio is None:
+        print("E: pyAlsaAudio is not available")
+        sys.exit(2)
+    alsa_tray.list_cards_or_exit()
+    alsa_tray.read_config()
+    alsa_tray.check_all()
+    tray = SNITray()
+    alsa_tray.watch_signals(tray.quit)
+    try:
+        tray.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
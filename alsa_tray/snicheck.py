@@ -0,0 +1,222 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+############################################################################
+##                                                                        ##
+## ALSA Tray - provides a tray icon for setting ALSA mixers volume        ##
+##                                                                        ##
+## Copyright (C) 2010-2012  Fabien Loison (www.flogisoft.com)             ##
+## Copyright (C) 2018 Beniamin Kalinowski (beniamin.kalinowski@gmail.com) ##
+##                                                                        ##
+## This program is free software: you can redistribute it and/or modify   ##
+## it under the terms of the GNU General Public License as published by   ##
+## the Free Software Foundation, either version 3 of the License, or      ##
+## (at your option) any later version.                                    ##
+##                                                                        ##
+## This program is distributed in the hope that it will be useful,        ##
+## but WITHOUT ANY WARRANTY; without even the implied warranty of         ##
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          ##
+## GNU General Public License for more details.                           ##
+##                                                                        ##
+## You should have received a copy of the GNU General Public License      ##
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.  ##
+##                                                                        ##
+############################################################################
+
+
+"""Automated check of the StatusNotifierItem mode (alsa_tray.sni).
+
+Starts 'python -m alsa_tray.sni --simulated' on the session bus, then, as
+a StatusNotifierItem host would, checks its properties, scrolls on it,
+middle-clicks it (SecondaryActivate), reads its menu (GetLayout) and stops
+it with SIGTERM. Needs dbus-python, and is meant to run on a private
+session bus.
+
+SYNOPSIS:
+    dbus-run-session -- python -m alsa_tray.snicheck [options]
+
+OPTIONS:
+    --timeout=<Seconds>
+        Maximum wait of each step (default: 10).
+
+EXIT STATUS:
+    0 if all the checks passed, 1 else.
+"""
+
+
+import sys
+import os
+import re
+import signal
+import subprocess
+import time
+
+import dbus
+
+from alsa_tray import alsa_tray
+from alsa_tray import sni
+
+
+class CheckFailed(Exception):
+
+    """A check of the StatusNotifierItem failed"""
+
+
+def wait_for(function, timeout, what):
+    """Calls function until it returns a true value.
+
+    Returns:
+        The value returned by function.
+
+    Raises CheckFailed after timeout seconds.
+    """
+    deadline = time.time() + timeout
+    while True:
+        value = function()
+        if value:
+            return value
+        if time.time() > deadline:
+            raise CheckFailed("timed out waiting for %s" % what)
+        time.sleep(0.05)
+
+
+class SNIClient(object):
+
+    """The host side of the StatusNotifierItem and DBusMenu protocols"""
+
+    def __init__(self, bus, bus_name):
+        item = bus.get_object(bus_name, sni.SNI_PATH)
+        self._item = dbus.Interface(item, sni.SNI_INTERFACE)
+        self._properties = dbus.Interface(item, dbus.PROPERTIES_IFACE)
+        menu = bus.get_object(bus_name, sni.MENU_PATH)
+        self._menu = dbus.Interface(menu, sni.MENU_INTERFACE)
+
+    def get_properties(self):
+        return self._properties.GetAll(sni.SNI_INTERFACE)
+
+    def get_state(self):
+        """Returns the (volume, mute) shown in the tooltip, None if no volume
+        is shown yet
+        """
+        tooltip = self.get_properties()['ToolTip'][3]
+        match = re.search(r"(\d+)%", tooltip)
+        if match is None:
+            return None
+        return (int(match.group(1)), "mute" in tooltip)
+
+    def scroll(self, delta):
+        self._item.Scroll(delta, "vertical")
+
+    def secondary_activate(self):
+        self._item.SecondaryActivate(0, 0)
+
+    def get_layout(self):
+        revision, layout = self._menu.GetLayout(0, -1, dbus.Array([], signature="s"))
+        return layout
+
+
+def get_menu_items(layout):
+    """Returns the {label: properties} of the items of a menu layout"""
+    item_id, properties, children = layout
+    items = {}
+    if 'label' in properties:
+        items[str(properties['label'])] = properties
+    for child in children:
+        items.update(get_menu_items(child))
+    return items
+
+
+def check(bus, bus_name, timeout=10):
+    """Runs the checks on the StatusNotifierItem of the given bus name.
+
+    Raises CheckFailed if a check fails.
+    """
+    client = SNIClient(bus, bus_name)
+    #Properties
+    properties = client.get_properties()
+    expected = {
+            'Id': alsa_tray.__appname__,
+            'Title': alsa_tray.__appdispname__,
+            'Status': "Active",
+            'Menu': sni.MENU_PATH,
+            }
+    for name, value in expected.items():
+        if properties.get(name) != value:
+            raise CheckFailed("property %s is %r, expected %r" % (
+                    name, properties.get(name), value))
+    volume, mute = wait_for(client.get_state, timeout, "the first volume")
+    if mute:
+        raise CheckFailed("muted at start")
+    #Scroll
+    client.scroll(120) #One wheel notch
+    wait_for(lambda: client.get_state()[0] > volume, timeout,
+             "the volume to increase after Scroll")
+    #SecondaryActivate (middle click): toggles the mute state
+    client.secondary_activate()
+    wait_for(lambda: client.get_state()[1], timeout,
+             "the mute state after SecondaryActivate")
+    if client.get_properties()['IconName'] != alsa_tray.VOL_ICON[-1]:
+        raise CheckFailed("muted, but the icon is %s" % (
+                client.get_properties()['IconName']))
+    #GetLayout
+    items = wait_for(
+            lambda: get_menu_items(client.get_layout()).get("Mute", {}).get("toggle-state") == 1 and
+                    get_menu_items(client.get_layout()),
+            timeout,
+            "the Mute menu item to be checked",
+            )
+    for label in ("Mute", "Scenes", "Preferences", "About", "Quit"):
+        if label not in items:
+            raise CheckFailed("no '%s' item in the menu" % label)
+    if items["Mute"].get("toggle-type") != "checkmark":
+        raise CheckFailed("the Mute menu item is not a checkmark")
+
+
+def main():
+    timeout = 10
+    for arg in sys.argv[1:]:
+        if arg[:10] == "--timeout=" and arg[10:].isdigit():
+            timeout = int(arg[10:])
+        elif arg in ("-h", "--help", "-?"):
+            print(__doc__)
+            sys.exit(0)
+        else:
+            print("E: Invalide option '%s'." % arg)
+            sys.exit(1)
+    if not os.environ.get("DBUS_SESSION_BUS_ADDRESS"):
+        print("E: No session bus, run 'dbus-run-session -- python -m alsa_tray.snicheck'.")
+        sys.exit(1)
+    bus = dbus.SessionBus()
+    env = dict(os.environ)
+    env['LANGUAGE'] = "C" #The tooltip is parsed
+    process = subprocess.Popen(
+            [sys.executable, "-m", "alsa_tray.sni", "--simulated"],
+            env=env,
+            )
+    bus_name = "org.kde.StatusNotifierItem-%i-1" % process.pid
+    failure = None
+    try:
+        wait_for(lambda: bus.name_has_owner(bus_name) or process.poll() is not None,
+                 timeout, "the StatusNotifierItem on the bus")
+        if process.poll() is not None:
+            raise CheckFailed("alsa_tray.sni exited with status %i" % process.returncode)
+        check(bus, bus_name, timeout)
+        #SIGTERM: clean exit (atexit handlers run)
+        process.send_signal(signal.SIGTERM)
+        wait_for(lambda: process.poll() is not None, timeout, "the exit on SIGTERM")
+        if process.returncode != 0:
+            raise CheckFailed("exit status %i on SIGTERM" % process.returncode)
+    except (CheckFailed, dbus.exceptions.DBusException) as detail:
+        failure = detail
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    if failure is not None:
+        print("FAIL: %s" % failure)
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+############################################################################
+##                                                                        ##
+## ALSA Tray - provides a tray icon for setting ALSA mixers volume        ##
+##                                                                        ##
+## Copyright (C) 2010-2012  Fabien Loison (www.flogisoft.com)             ##
+## Copyright (C) 2018 Beniamin Kalinowski (beniamin.kalinowski@gmail.com) ##
+##                                                                        ##
+## This program is free software: you can redistribute it and/or modify   ##
+## it under the terms of the GNU General Public License as published by   ##
+## the Free Software Foundation, either version 3 of the License, or      ##
+## (at your option) any later version.                                    ##
+##                                                                        ##
+## This program is distributed in the hope that it will be useful,        ##
+## but WITHOUT ANY WARRANTY; without even the implied warranty of         ##
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          ##
+## GNU General Public License for more details.                           ##
+##                                                                        ##
+## You should have received a copy of the GNU General Public License      ##
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.  ##
+##                                                                        ##
+############################################################################
+
+
+"""Soak and stress test of ALSA Tray.
+
+Drives an ALSA Tray instance on the simulated backend with a long stream of
+events (multimedia keys, scroll, slider, external mixer changes, timer
+ticks, preferences dialog) and samples its resources: RSS, live GObjects,
+open file descriptors and GLib main loop dispatch latency. Fails if one of
+them grows past its threshold after the warm up.
+
+With --failure-rate, the ALSA calls also fail at the given rate and the
+card of the mixer is unplugged and plugged again every 200 events, which
+runs the error paths: the backoff of the mixer handle, the hotplug handlers
+and the restoration of the remembered volumes (the retry delays of the
+mixer handle are scaled down to 1-50 ms, the pace of the events). The test then also fails on
+any uncaught exception (in the event handlers, the GLib callbacks or the
+mixer worker).
+
+SYNOPSIS:
+    python -m alsa_tray.soak [options]
+
+OPTIONS:
+    --target=<daemon|tray>
+        The instance to drive (default: daemon). The tray needs GTK+ and
+        a display (e.g. run it under xvfb-run).
+    --events=<Number>
+        Number of events (default: 1000000).
+    --samples=<Number>
+        Number of resource samples (default: 20).
+    --max-rss-growth=<KiB>
+        Maximum RSS growth (default: 8192).
+    --max-gobject-growth=<Number>
+        Maximum growth of the live GObjects count (default: 100).
+    --max-fd-growth=<Number>
+        Maximum growth of the open file descriptors count (default: 4).
+    --max-latency=<Milliseconds>
+        Maximum main loop dispatch latency (default: 50).
+    --idle=<Seconds>
+        After the events, leave the instance idle for this duration and
+        report its RSS and the CPU time it used (default: 0, no idle
+        measure).
+    --polling
+        Simulate mixers without poll descriptors (pyAlsaAudio < 0.8): the
+        mixer is then polled every 800 ms.
+    --failure-rate=<Rate>
+        Probability of each ALSA call failing, from 0 to 1, e.g. 0.2
+        (default: 0, no error and no hotplug).
+
+EXAMPLE:
+    python -m alsa_tray.soak --events=20000 --failure-rate=0.2
+
+EXIT STATUS:
+    0 if all the resources stayed under their thresholds (and no exception
+    was left uncaught), 1 else.
+"""
+
+
+import sys
+import os
+import gc
+import time
+import resource
+import traceback
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+def get_rss():
+    """Returns the resident set size of the process (in KiB)"""
+    statm = open("/proc/self/statm", "r")
+    try:
+        pages = int(statm.read().split()[1])
+    finally:
+        statm.close()
+    return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def count_fds():
+    """Returns the number of open file descriptors of the process"""
+    return len(os.listdir("/proc/self/fd"))
+
+
+def count_gobjects():
+    """Returns the number of live GObjects wrappers"""
+    from gi.repository import GObject
+    gc.collect()
+    count = 0
+    for obj in gc.get_objects():
+        if isinstance(obj, GObject.Object):
+            count += 1
+    return count
+
+
+def iterate_main_loop():
+    """Dispatches all the pending GLib events"""
+    from gi.repository import GLib
+    context = GLib.MainContext.default()
+    while context.pending():
+        context.iteration(False)
+
+
+def measure_latency(timeout=5.0):
+    """Returns the time (in milliseconds) the main loop takes to dispatch an
+    idle callback.
+    """
+    from gi.repository import GLib
+    dispatched = []
+    def on_idle():
+        dispatched.append(clock())
+        return False
+    start = clock()
+    GLib.idle_add(on_idle, priority=GLib.PRIORITY_DEFAULT)
+    context = GLib.MainContext.default()
+    while not dispatched and clock() - start < timeout:
+        context.iteration(True)
+    if not dispatched:
+        return timeout * 1000
+    return (dispatched[0] - start) * 1000
+
+
+class ExceptionCatcher(object):
+
+    """Collects the uncaught exceptions.
+
+    The exceptions of the GLib callbacks and of the mixer worker are
+    reported through sys.excepthook, which is replaced while the catcher
+    is installed.
+
+    Methods:
+        * install -- replace sys.excepthook
+        * uninstall -- restore sys.excepthook
+        * catch -- record the exception being handled
+
+    Attribute:
+        * exceptions -- the formatted exceptions
+    """
+
+    def __init__(self):
+        self.exceptions = []
+        self._excepthook = None
+
+    def install(self):
+        self._excepthook = sys.excepthook
+        sys.excepthook = self.on_exception
+
+    def uninstall(self):
+        if self._excepthook is not None:
+            sys.excepthook = self._excepthook
+            self._excepthook = None
+
+    def catch(self):
+        self.on_exception(*sys.exc_info())
+
+    def on_exception(self, exc_type, exc_value, exc_traceback):
+        self.exceptions.append("".join(traceback.format_exception(
+                exc_type, exc_value, exc_traceback)))
+        (self._excepthook or sys.__excepthook__)(
+                exc_type, exc_value, exc_traceback)
+
+
+class SoakDriver(object):
+
+    """Feeds the events to the driven instance"""
+
+    def __init__(self, alsa_tray, backend, target, hotplug=False):
+        self._alsa_tray = alsa_tray
+        self._backend = backend
+        self._target = target
+        self._hotplug = hotplug
+        self._card_name = backend.cards()[alsa_tray.CONTROLLER.card]
+        #Another "process" changing the mixer
+        self._external = backend.Mixer(
+                control=alsa_tray.CONTROLLER.mixer,
+                cardindex=alsa_tray.CONTROLLER.card,
+                )
+        if target == "tray":
+            self.instance = alsa_tray.ALSATray()
+        else:
+            self.instance = alsa_tray.ALSADaemon()
+
+    def run_event(self, index):
+        if self._hotplug and index % 100 == 99:
+            #The card of the mixer disappears, then comes back (which also
+            #ends the backoff of the mixer handle)
+            if index % 200 == 99:
+                self._backend.unplug(self._card_name)
+            else:
+                self._backend.plug(self._card_name)
+            self.instance.on_hotplug(None, None, None, None)
+            #Without waiting for HOTPLUG_DELAY
+            self.instance.on_hotplug_timeout()
+        action = index % 10
+        if action in (0, 1):
+            self.instance.on_mmkey_pressed("volume-up")
+        elif action in (2, 3):
+            self.instance.on_mmkey_pressed("volume-down")
+        elif action == 4:
+            self.instance.on_mmkey_pressed("mute")
+        elif action == 5:
+            try:
+                self._external.setvolume(index % 101)
+            except self._backend.ALSAAudioError:
+                pass #Injected error, or card unplugged
+        elif action == 6 and self._target == "tray":
+            self.instance.on_scroll_delta(+3 if index % 20 < 10 else -3)
+        elif action == 7 and self._target == "tray":
+            #What the slider handler does (the popup window stays hidden)
+            self.instance._worker.set_volume(index % 101)
+        elif action == 8:
+            #Timer tick
+            if self._target == "tray":
+                self.instance._on_timer()
+            else:
+                self.instance._update_infos()
+        elif action == 9 and self._target == "tray" and index % 10000 == 9:
+            self.instance.on_menu_preferences_avtivate(None)
+            self.instance.config_dialog.on_btn_close_clicked(None)
+        iterate_main_loop()
+
+
+def measure_idle(seconds):
+    """Runs the main loop for the given duration without any event.
+
+    Returns:
+        A dict with the RSS at the end (rss, in KiB) and the CPU time used
+        (cpu, in milliseconds per minute).
+    """
+    from gi.repository import GLib
+    loop = GLib.MainLoop()
+    GLib.timeout_add_seconds(seconds, loop.quit)
+    start = resource.getrusage(resource.RUSAGE_SELF)
+    loop.run()
+    end = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (end.ru_utime - start.ru_utime) + (end.ru_stime - start.ru_stime)
+    return {'rss': get_rss(), 'cpu': cpu * 1000 * 60 / seconds}
+
+
+def sample(with_gobjects):
+    return {
+            'rss': get_rss(),
+            'fds': count_fds(),
+            'gobjects': count_gobjects() if with_gobjects else 0,
+            'latency': measure_latency(),
+            }
+
+
+def soak(target="daemon", events=1000000, samples=20, thresholds=None,
+         idle=0, polling=False, failure_rate=0.0):
+    """Runs the soak test.
+
+    Keyword arguments:
+        * target -- "daemon" or "tray"
+        * events -- the number of events
+        * samples -- the number of samples
+        * thresholds -- dict of the maximum growths (rss, gobjects, fds)
+          and dispatch latency (latency)
+        * idle -- the duration of the idle measure (in seconds, see
+          measure_idle())
+        * polling -- simulate mixers without poll descriptors
+        * failure_rate -- the probability of each ALSA call failing (the
+          card is also unplugged and plugged again if it is not 0)
+
+    Returns:
+        A (samples list, failures list) tuple.
+    """
+    from alsa_tray import alsa_tray
+    from alsa_tray import simulated
+    if thresholds is None:
+        thresholds = {'rss': 8192, 'gobjects': 100, 'fds': 4, 'latency': 50}
+    backend = simulated.SimulatedBackend(poll_events=not polling)
+    alsa_tray.use_backend(backend)
+    alsa_tray.use_sandbox()
+    alsa_tray.CLI_OPTS['notify'] = "no"
+    alsa_tray.ls_cards_mixers()
+    alsa_tray.select_default_card()
+    alsa_tray.select_default_mixer()
+    if target == "tray" and not alsa_tray.load_gtk():
+        raise RuntimeError("GTK+ 3 is not available")
+    if failure_rate > 0:
+        alsa_tray.CONTROLLER.handle = alsa_tray.MixerHandle(
+                alsa_tray.CONTROLLER, min_delay=0.001, max_delay=0.05)
+    driver = SoakDriver(alsa_tray, backend, target, failure_rate > 0)
+    backend.set_failure_rate(failure_rate)
+    catcher = ExceptionCatcher()
+    catcher.install()
+    def run_event(index):
+        try:
+            driver.run_event(index)
+        except Exception:
+            catcher.catch()
+    with_gobjects = target == "tray"
+    #Warm up: caches, lazy widgets...
+    for index in range(min(10000, events // 10)):
+        run_event(index)
+    baseline = sample(with_gobjects)
+    results = [baseline]
+    print("%10s %10s %6s %9s %12s" % (
+            "events", "rss (KiB)", "fds", "gobjects", "latency (ms)"))
+    step = max(1, events // samples)
+    for index in range(events):
+        run_event(index)
+        if (index + 1) % step == 0:
+            result = sample(with_gobjects)
+            result['events'] = index + 1
+            results.append(result)
+            print("%(events)10i %(rss)10i %(fds)6i %(gobjects)9i "
+                  "%(latency)12.3f" % result)
+            sys.stdout.flush()
+    final = results[-1]
+    #Let the worker post its last states
+    measure_latency()
+    catcher.uninstall()
+    failures = []
+    if failure_rate > 0:
+        print("%i ALSA calls, mixer reopened %i times" % (
+                sum(backend.calls.values()),
+                alsa_tray.CONTROLLER.handle.generation))
+    if catcher.exceptions:
+        failures.append("%i uncaught exceptions, the first one:\n%s" % (
+                len(catcher.exceptions), catcher.exceptions[0].rstrip()))
+    for key in ("rss", "gobjects", "fds"):
+        growth = final[key] - baseline[key]
+        if growth > thresholds[key]:
+            failures.append("%s grew by %i (max %i)" % (key, growth, thresholds[key]))
+    worst_latency = max([result['latency'] for result in results])
+    if worst_latency > thresholds['latency']:
+        failures.append("dispatch latency reached %.3f ms (max %i)" % (
+                worst_latency, thresholds['latency']))
+    if idle > 0:
+        result = measure_idle(idle)
+        print("idle: rss %(rss)i KiB, cpu %(cpu).1f ms/min" % result)
+    return results, failures
+
+
+def main():
+    target = "daemon"
+    events = 1000000
+    samples = 20
+    idle = 0
+    polling = False
+    failure_rate = 0.0
+    thresholds = {'rss': 8192, 'gobjects': 100, 'fds': 4, 'latency': 50}
+    for arg in sys.argv[1:]:
+        if arg in ("--target=daemon", "--target=tray"):
+            target = arg[9:]
+        elif arg[:9] == "--events=" and arg[9:].isdigit():
+            events = int(arg[9:])
+        elif arg[:10] == "--samples=" and arg[10:].isdigit():
+            samples = int(arg[10:])
+        elif arg[:17] == "--max-rss-growth=" and arg[17:].isdigit():
+            thresholds['rss'] = int(arg[17:])
+        elif arg[:21] == "--max-gobject-growth=" and arg[21:].isdigit():
+            thresholds['gobjects'] = int(arg[21:])
+        elif arg[:16] == "--max-fd-growth=" and arg[16:].isdigit():
+            thresholds['fds'] = int(arg[16:])
+        elif arg[:14] == "--max-latency=" and arg[14:].isdigit():
+            thresholds['latency'] = int(arg[14:])
+        elif arg[:7] == "--idle=" and arg[7:].isdigit():
+            idle = int(arg[7:])
+        elif arg == "--polling":
+            polling = True
+        elif arg[:15] == "--failure-rate=":
+            try:
+                failure_rate = float(arg[15:])
+            except ValueError:
+                failure_rate = -1
+            if not 0 <= failure_rate <= 1:
+                print("E: Invalide failure rate '%s'." % arg[15:])
+                sys.exit(1)
+        elif arg in ("-h", "--help", "-?"):
+            print(__doc__)
+            sys.exit(0)
+        else:
+            print("E: Invalide option '%s'." % arg)
+            sys.exit(1)
+    results, failures = soak(target, events, samples, thresholds, idle,
+                             polling, failure_rate)
+    if failures:
+        for failure in failures:
+            print("FAIL: %s" % failure)
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+############################################################################
+##                                                                        ##
+## ALSA Tray - provides a tray icon for setting ALSA mixers volume        ##
+##                                                                        ##
+## Copyright (C) 2010-2012  Fabien Loison (www.flogisoft.com)             ##
+## Copyright (C) 2018 Beniamin Kalinowski (beniamin.kalinowski@gmail.com) ##
+##                                                                        ##
+## This program is free software: you can redistribute it and/or modify   ##
+## it under the terms of the GNU General Public License as published by   ##
+## the Free Software Foundation, either version 3 of the License, or      ##
+## (at your option) any later version.                                    ##
+##                                                                        ##
+## This program is distributed in the hope that it will be useful,        ##
+## but WITHOUT ANY WARRANTY; without even the implied warranty of         ##
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          ##
+## GNU General Public License for more details.                           ##
+##                                                                        ##
+## You should have received a copy of the GNU General Public License      ##
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.  ##
+##                                                                        ##
+############################################################################
+
+
+"""The shared state file of a running ALSA Tray.
+
+The tray and the daemon publish the state of their mixer in a small
+memory-mapped file, so that other programs (status bars, OSD scripts...)
+can read it without enumerating ALSA or asking ALSA Tray anything:
+
+    from alsa_tray.statefile import read_state
+    state = read_state() #None if no ALSA Tray is running
+
+This module only uses the standard library: it can be imported without
+pyAlsaAudio or PyGObject.
+
+LAYOUT (64 bytes, little-endian):
+    0   4s   magic ("ATS1")
+    4   I    sequence: odd while the state is being written
+    8   h    card index
+    10  h    volume (in percent), -1 if the mixer is unavailable
+    12  b    mute: 1, 0, or -1 if unavailable
+    13  x    padding
+    14  32s  mixer name (UTF-8, NUL padded)
+    46  2x   padding
+    48  I    PID of the writer, 0 once it exited
+    52  4x   padding
+    56  d    time of the last change (seconds since the epoch)
+
+Readers copy the state between two reads of the sequence and retry while
+it is odd or changed (seqlock), so they always get a consistent snapshot.
+"""
+
+
+import os
+import errno
+import mmap
+import stat
+import struct
+import tempfile
+import time
+
+
+MAGIC = b"ATS1"
+STATE_FORMAT = "<4sIhhbx32s2xI4xd"
+STATE_SIZE = struct.calcsize(STATE_FORMAT)
+_PAYLOAD_FORMAT = "<hhbx32s2xI4xd"
+_SEQUENCE = struct.Struct("<I")
+_PAYLOAD = struct.Struct(_PAYLOAD_FORMAT)
+
+
+def get_state_file_path():
+    """Returns the state file path, in $XDG_RUNTIME_DIR if defined."""
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "alsa-tray.state")
+    return os.path.join(
+            tempfile.gettempdir(),
+            "alsa-tray-%i.state" % os.getuid(),
+            )
+
+
+def open_user_file(path, flags, mode=0o600):
+    """Opens a file of the user, refusing the files planted by others.
+
+    The fallback paths in /tmp are predictable: another local user could
+    put a symlink or a hard link to a file of the victim there. The file
+    is opened without following symlinks, and must be a regular file owned
+    by the user, with no other link.
+
+    Arguments:
+        * path -- the file path
+        * flags -- the os.open() flags (O_NOFOLLOW is added)
+
+    Keyword argument:
+        * mode -- the permissions of a new file
+
+    Returns:
+        The file descriptor.
+
+    Raises OSError if the file can't be opened or is not safe.
+    """
+    fd = os.open(path, flags | getattr(os, "O_NOFOLLOW", 0), mode)
+    try:
+        info = os.fstat(fd)
+        if not stat.S_ISREG(info.st_mode) or info.st_uid != os.getuid() or \
+           info.st_nlink != 1:
+            raise OSError(errno.EPERM, "Not a regular file of the user", path)
+    except:
+        os.close(fd)
+        raise
+    return fd
+
+
+class StatePublisher(object):
+
+    """Writes the state of a running ALSA Tray in the state file.
+
+    Methods:
+        * publish -- write a new state
+        * close -- mark the writer as exited and unmap the file
+    """
+
+    def __init__(self, path=None):
+        """The constructor.
+
+        Keyword argument:
+            * path -- the state file path (default: get_state_file_path())
+
+        Raises IOError/OSError if the file can't be created, or if it is not
+        a regular file of the user (see open_user_file()).
+        """
+        self._last = None
+        fd = open_user_file(path or get_state_file_path(), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, STATE_SIZE)
+            self._map = mmap.mmap(fd, STATE_SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd) #The mapping stays valid
+        self._map[0:4] = MAGIC
+        sequence = _SEQUENCE.unpack_from(self._map, 4)[0]
+        #Even: no write in progress
+        self._sequence = sequence + (sequence % 2)
+
+    def publish(self, card, mixer, volume, mute):
+        """Writes a new state, if it changed.
+
+        Arguments:
+            * card -- the card index
+            * mixer -- the mixer name
+            * volume -- the volume (in percent), None if unavailable
+            * mute -- the mute state, None if unavailable
+        """
+        state = (card, mixer, volume, mute)
+        if state == self._last or self._map is None:
+            return
+        self._last = state
+        self._write(card, mixer, volume, mute, os.getpid())
+
+    def close(self):
+        if self._map is None:
+            return
+        if self._last is not None:
+            self._write(self._last[0], self._last[1], None, None, 0)
+        self._map.close()
+        self._map = None
+
+    def _write(self, card, mixer, volume, mute, pid):
+        payload = _PAYLOAD.pack(
+                card,
+                -1 if volume is None else volume,
+                -1 if mute is None else int(bool(mute)),
+                mixer.encode("utf-8")[:32],
+                pid,
+                time.time(),
+                )
+        self._sequence += 1
+        _SEQUENCE.pack_into(self._map, 4, self._sequence)
+        self._map[8:STATE_SIZE] = payload
+        self._sequence += 1
+        _SEQUENCE.pack_into(self._map, 4, self._sequence)
+
+
+def read_state(path=None, retries=100):
+    """Reads the state published by a running ALSA Tray.
+
+    Keyword arguments:
+        * path -- the state file path (default: get_state_file_path())
+        * retries -- the number of reads before giving up if the state keeps
+          being rewritten
+
+    Returns:
+        A dict with the card, mixer, volume, mute, pid and time keys
+        (volume and mute are None if the mixer is unavailable), or None if
+        no ALSA Tray is running.
+    """
+    try:
+        state_file = open(path or get_state_file_path(), "rb")
+    except (IOError, OSError):
+        return None
+    try:
+        if os.fstat(state_file.fileno()).st_size < STATE_SIZE:
+            return None
+        state_map = mmap.mmap(state_file.fileno(), STATE_SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+    finally:
+        state_file.close()
+    try:
+        if state_map[0:4] != MAGIC:
+            return None
+        for retry in range(retries):
+            sequence = _SEQUENCE.unpack_from(state_map, 4)[0]
+            if sequence % 2 == 1:
+                continue #Being written
+            payload = state_map[8:STATE_SIZE]
+            if _SEQUENCE.unpack_from(state_map, 4)[0] == sequence:
+                break
+        else:
+            return None
+    finally:
+        state_map.close()
+    card, volume, mute, mixer, pid, changed = _PAYLOAD.unpack(payload)
+    if pid == 0 or not _is_running(pid):
+        return None
+    return {
+            'card': "hw:%i" % card,
+            'mixer': mixer.rstrip(b"\0").decode("utf-8", "replace"),
+            'volume': None if volume < 0 else volume,
+            'mute': None if mute < 0 else bool(mute),
+            'pid': pid,
+            'time': changed,
+            }
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as detail:
+        return detail.errno == errno.EPERM #Running as another user
+    return True
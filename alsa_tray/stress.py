@@ -0,0 +1,222 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+############################################################################
+##                                                                        ##
+## ALSA Tray - provides a tray icon for setting ALSA mixers volume        ##
+##                                                                        ##
+## Copyright (C) 2010-2012  Fabien Loison (www.flogisoft.com)             ##
+## Copyright (C) 2018 Beniamin Kalinowski (beniamin.kalinowski@gmail.com) ##
+##                                                                        ##
+## This program is free software: you can redistribute it and/or modify   ##
+## it under the terms of the GNU General Public License as published by   ##
+## the Free Software Foundation, either version 3 of the License, or      ##
+## (at your option) any later version.                                    ##
+##                                                                        ##
+## This program is distributed in the hope that it will be useful,        ##
+## but WITHOUT ANY WARRANTY; without even the implied warranty of         ##
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          ##
+## GNU General Public License for more details.                           ##
+##                                                                        ##
+## You should have received a copy of the GNU General Public License      ##
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.  ##
+##                                                                        ##
+############################################################################
+
+
+"""Stress test of the relative volume changes.
+
+Runs N threads at once, each one with its own VolumeController (like N
+"alsa-tray +1" processes spawned by a held volume key), on the simulated
+backend. Each thread raises the volume by 1 %: the read-modify-write of
+each change is serialized by the MixerLock, so the volume must grow by
+exactly N.
+
+The threads share one interpreter, one backend and the lock file, but not
+the process-wide parts of a real run (startup, card listing, atexit
+handlers). With --processes, N real 'python -m alsa_tray.alsa_tray
+--simulated=<File> +1' processes are spawned instead, the simulated cards
+being shared through a state file (see alsa_tray.simulated) and the
+MixerLock through its directory. They are slower to start, so they race
+less often than the threads: use both.
+
+SYNOPSIS:
+    python -m alsa_tray.stress [options]
+
+OPTIONS:
+    --threads=<Number>
+        Number of parallel changes (default: 50, max: 100).
+    --rounds=<Number>
+        Number of times the test is run (default: 10).
+    --processes=<Number>
+        Spawn this number of CLI processes instead of the threads (max:
+        100).
+    --latency=<Milliseconds>
+        Duration of each simulated ALSA call, which widens the window
+        between the read and the write (default: 1).
+
+EXIT STATUS:
+    0 if no change was lost, 1 else.
+"""
+
+
+import sys
+import os
+import threading
+
+
+def stress(threads=50, rounds=10, latency=0.001):
+    """Runs the stress test.
+
+    Keyword arguments:
+        * threads -- the number of parallel +1 changes
+        * rounds -- the number of times the test is run
+        * latency -- the duration of each simulated ALSA call (in seconds)
+
+    Returns:
+        The list of the failures (empty if no change was lost).
+    """
+    from alsa_tray import alsa_tray
+    from alsa_tray import simulated
+    backend = simulated.SimulatedBackend(latency=latency)
+    alsa_tray.use_backend(backend)
+    alsa_tray.use_sandbox()
+    alsa_tray.ls_cards_mixers()
+    alsa_tray.select_default_card()
+    alsa_tray.select_default_mixer()
+    card, mixer = alsa_tray.CONTROLLER.card, alsa_tray.CONTROLLER.mixer
+    start = (100 - threads) // 2
+    failures = []
+    for round_ in range(rounds):
+        alsa_tray.CONTROLLER.set_volume(start)
+        go = threading.Event()
+        errors = []
+        def change(controller):
+            go.wait()
+            try:
+                controller.change_volume(+1)
+            except Exception as detail:
+                errors.append(detail)
+        workers = []
+        for index in range(threads):
+            #One controller (and mixer handle) per thread, like processes
+            controller = alsa_tray.VolumeController(card, mixer)
+            workers.append(threading.Thread(target=change, args=(controller,)))
+        for worker in workers:
+            worker.start()
+        go.set()
+        for worker in workers:
+            worker.join()
+        volume = alsa_tray.CONTROLLER.read()[0]
+        print("round %i: %i -> %i (expected %i)" % (
+                round_ + 1, start, volume, start + threads))
+        if errors:
+            failures.append("round %i: %s" % (round_ + 1, errors[0]))
+        elif volume != start + threads:
+            failures.append("round %i: %i changes lost" % (
+                    round_ + 1, start + threads - volume))
+    return failures
+
+
+def stress_processes(processes=50, rounds=10, latency=0.001):
+    """Runs the stress test with CLI processes.
+
+    Keyword arguments:
+        * processes -- the number of parallel 'alsa-tray +1' processes
+        * rounds -- the number of times the test is run
+        * latency -- the duration of each simulated ALSA call (in seconds)
+
+    Returns:
+        The list of the failures (empty if no change was lost).
+    """
+    import shutil
+    import subprocess
+    import tempfile
+    from alsa_tray import alsa_tray
+    from alsa_tray import simulated
+    directory = tempfile.mkdtemp(prefix="%s-stress-" % alsa_tray.__appname__)
+    state_path = os.path.join(directory, "cards.json")
+    #The view of the harness on the shared cards
+    backend = simulated.SimulatedBackend(state_path=state_path)
+    alsa_tray.use_backend(backend)
+    alsa_tray.use_sandbox(directory)
+    alsa_tray.ls_cards_mixers()
+    alsa_tray.select_default_card()
+    alsa_tray.select_default_mixer()
+    command = [
+            sys.executable, "-m", "alsa_tray.alsa_tray",
+            "--simulated=%s" % state_path,
+            "-notify",
+            "--card=%i" % alsa_tray.CONTROLLER.card,
+            "--mixer=%s" % alsa_tray.CONTROLLER.mixer,
+            "+1",
+            ]
+    env = dict(os.environ)
+    env['ALSA_TRAY_SIMULATED_LATENCY'] = str(int(latency * 1000))
+    start = (100 - processes) // 2
+    failures = []
+    try:
+        for round_ in range(rounds):
+            alsa_tray.CONTROLLER.set_volume(start)
+            children = []
+            for index in range(processes):
+                children.append(subprocess.Popen(
+                        command,
+                        env=env,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                        ))
+            errors = []
+            for child in children:
+                output = child.communicate()[0]
+                if child.returncode != 0:
+                    errors.append("exit status %i: %s" % (
+                            child.returncode, output.decode("utf-8", "replace").strip()))
+            volume = alsa_tray.CONTROLLER.read()[0]
+            print("round %i: %i -> %i (expected %i)" % (
+                    round_ + 1, start, volume, start + processes))
+            if errors:
+                failures.append("round %i: %s" % (round_ + 1, errors[0]))
+            elif volume != start + processes:
+                failures.append("round %i: %i changes lost" % (
+                        round_ + 1, start + processes - volume))
+    finally:
+        shutil.rmtree(directory, True)
+    return failures
+
+
+def main():
+    threads = 50
+    processes = 0
+    rounds = 10
+    latency = 1
+    for arg in sys.argv[1:]:
+        if arg[:10] == "--threads=" and arg[10:].isdigit() and \
+           0 < int(arg[10:]) <= 100:
+            threads = int(arg[10:])
+        elif arg[:12] == "--processes=" and arg[12:].isdigit() and \
+             0 < int(arg[12:]) <= 100:
+            processes = int(arg[12:])
+        elif arg[:9] == "--rounds=" and arg[9:].isdigit():
+            rounds = int(arg[9:])
+        elif arg[:10] == "--latency=" and arg[10:].isdigit():
+            latency = int(arg[10:])
+        elif arg in ("-h", "--help", "-?"):
+            print(__doc__)
+            sys.exit(0)
+        else:
+            print("E: Invalide option '%s'." % arg)
+            sys.exit(1)
+    if processes > 0:
+        failures = stress_processes(processes, rounds, latency / 1000.0)
+    else:
+        failures = stress(threads, rounds, latency / 1000.0)
+    if failures:
+        for failure in failures:
+            print("FAIL: %s" % failure)
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
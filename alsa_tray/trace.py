@@ -0,0 +1,365 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+############################################################################
+##                                                                        ##
+## ALSA Tray - provides a tray icon for setting ALSA mixers volume        ##
+##                                                                        ##
+## Copyright (C) 2010-2012  Fabien Loison (www.flogisoft.com)             ##
+## Copyright (C) 2018 Beniamin Kalinowski (beniamin.kalinowski@gmail.com) ##
+##                                                                        ##
+## This program is free software: you can redistribute it and/or modify   ##
+## it under the terms of the GNU General Public License as published by   ##
+## the Free Software Foundation, either version 3 of the License, or      ##
+## (at your option) any later version.                                    ##
+##                                                                        ##
+## This program is distributed in the hope that it will be useful,        ##
+## but WITHOUT ANY WARRANTY; without even the implied warranty of         ##
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          ##
+## GNU General Public License for more details.                           ##
+##                                                                        ##
+## You should have received a copy of the GNU General Public License      ##
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.  ##
+##                                                                        ##
+############################################################################
+
+
+"""Records and replays ALSA Tray event traces.
+
+A trace is recorded by running ALSA Tray with --trace=<File>. It is a JSON
+lines file: one object per input event (scroll, multimedia key, slider,
+mute toggle, CLI command) or observed mixer state change, with its time
+(in seconds since the start of the recording).
+
+The replay feeds the input events of a trace to the handlers of an ALSA
+Tray instance (the daemon or the tray) running on the simulated backend,
+in a sandbox directory (see alsa_tray.use_sandbox), and reports the
+handling latency and the number of ALSA calls. The latency of an event is
+the time from the event to the end of its handling: the GLib main loop,
+the scroll accumulator and the mixer worker have nothing left to do.
+Comparing the reports of two versions shows the performance regressions.
+
+The daemon only handles the multimedia keys and the CLI commands, the
+other events are skipped. The tray needs GTK+ and a display (e.g. run it
+under xvfb-run).
+
+SYNOPSIS:
+    python -m alsa_tray.trace [options] <File>
+
+OPTIONS:
+    --target=<daemon|tray>
+        The instance to drive (default: daemon).
+    --speed=<Factor>
+        Replay speed: 1 for the original speed, 10 for ten times faster,
+        0 (default) for as fast as possible.
+    --latency=<Milliseconds>
+        Duration of each simulated ALSA call (default: 0).
+    --json
+        Print the report as JSON.
+"""
+
+
+import sys
+import json
+import threading
+import time
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+INPUT_EVENTS = ("scroll", "mmkey", "slider", "mute", "cli")
+
+
+class TraceRecorder(object):
+
+    """Records the events of a running ALSA Tray in a JSON lines file.
+
+    Methods:
+        * record -- record an event
+        * close -- close the trace file
+    """
+
+    def __init__(self, path):
+        """The constructor.
+
+        Argument:
+            * path -- the trace file path
+        """
+        self._file = open(path, "w")
+        self._lock = threading.Lock()
+        self._start = clock()
+
+    def record(self, event, **data):
+        """Records an event.
+
+        Arguments:
+            * event -- the event type (see INPUT_EVENTS, or "state")
+            * data -- the event data (JSON serializable)
+        """
+        data['t'] = round(clock() - self._start, 6)
+        data['event'] = event
+        line = json.dumps(data, sort_keys=True)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_trace(path):
+    """Returns the list of the events of a trace file"""
+    events = []
+    trace_file = open(path, "r")
+    try:
+        for line in trace_file:
+            line = line.strip()
+            if len(line) > 0:
+                events.append(json.loads(line))
+    finally:
+        trace_file.close()
+    return events
+
+
+class ReplayProbe(object):
+
+    """Follows the handling of the replayed events.
+
+    The events are handled once the mixer worker of the instance posted
+    back the state of all the commands queued (MixerWorker.queued and
+    done), nothing is waiting in the scroll accumulator and the main loop
+    have nothing to dispatch.
+
+    Methods:
+        * feed -- record the time of a new event
+        * discard -- forget the last event (not handled)
+        * update -- complete the handled events
+
+    Attribute:
+        * latencies -- the handling latency of each event (in milliseconds)
+    """
+
+    def __init__(self, instance, context):
+        self.latencies = []
+        self._instance = instance
+        self._context = context
+        self._pending = []
+
+    def feed(self):
+        self._pending.append(clock())
+
+    def discard(self):
+        self._pending.pop()
+
+    def is_idle(self):
+        scroll = getattr(self._instance, "_scroll", None)
+        if scroll is not None and scroll._source is not None:
+            return False
+        worker = getattr(self._instance, "_worker", None)
+        if worker is not None and worker.done != worker.queued:
+            return False
+        return not self._context.pending()
+
+    def update(self):
+        if len(self._pending) == 0 or not self.is_idle():
+            return
+        now = clock()
+        for begin in self._pending:
+            self.latencies.append((now - begin) * 1000)
+        self._pending = []
+
+
+def _handle_event(instance, event):
+    """Passes an input event to the handler of the instance.
+
+    Returns:
+        False if the instance does not handle this event, True else.
+    """
+    if event['event'] == "scroll":
+        if not hasattr(instance, "_scroll"):
+            return False
+        if "notches" in event:
+            instance._scroll.add(event['notches'])
+        else:
+            #Older traces: the merged volume changes
+            instance.on_scroll_delta(event['value'])
+    elif event['event'] == "mmkey":
+        instance.on_mmkey_pressed(event['key'])
+    elif event['event'] == "slider":
+        if not hasattr(instance, "_worker"):
+            return False
+        #What the slider handler does (the popup window stays hidden)
+        instance._worker.set_volume(event['value'])
+    elif event['event'] == "mute":
+        if not hasattr(instance, "_toggle_mute"):
+            return False
+        instance._toggle_mute(False)
+    elif event['event'] == "cli":
+        #The CLI is another process, it uses the controller directly
+        volume = event['volume']
+        mute = None
+        if event['mute'] in ("mute", "unmute"):
+            mute = event['mute'] == "mute"
+        if volume[0] in ("+", "-"):
+            instance.controller.update(delta=int(volume), mute=mute,
+                                       toggle=event['mute'] == "toggle")
+        else:
+            instance.controller.update(volume=int(volume), mute=mute,
+                                       toggle=event['mute'] == "toggle")
+    return True
+
+
+def _run_loop(context, probe, deadline=None):
+    """Runs the main loop until the deadline, or until all the events are
+    handled if deadline is None
+    """
+    from gi.repository import GLib
+    if deadline is None:
+        while not probe.is_idle():
+            #Woken up by the worker and the accumulator
+            context.iteration(True)
+        probe.update()
+        return
+    expired = []
+    GLib.timeout_add(
+            max(0, int((deadline - clock()) * 1000)),
+            expired.append, #Returns None: one shot
+            True,
+            )
+    while not expired:
+        context.iteration(True)
+        probe.update()
+
+
+def _percentile(values, percent):
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def replay(events, speed=0, latency=0.0, target="daemon"):
+    """Replays the input events of a trace on the simulated backend.
+
+    Arguments:
+        * events -- the trace events (see read_trace())
+        * speed -- the replay speed factor (0: as fast as possible, each
+          event being handled before the next one)
+        * latency -- the duration of each simulated ALSA call (in seconds)
+        * target -- "daemon" or "tray"
+
+    Returns:
+        The report dict: number of events, of skipped events and of errors,
+        handling latencies (in milliseconds) and ALSA calls by function.
+    """
+    from gi.repository import GLib
+    from alsa_tray import alsa_tray
+    from alsa_tray import simulated
+    backend = simulated.SimulatedBackend(latency=latency)
+    alsa_tray.use_backend(backend)
+    alsa_tray.use_sandbox()
+    if not alsa_tray.NOTIFY:
+        alsa_tray.CLI_OPTS['notify'] = "no" #No warning for each event
+    alsa_tray.ls_cards_mixers()
+    alsa_tray.select_default_card()
+    alsa_tray.select_default_mixer()
+    if target == "tray":
+        if not alsa_tray.load_gtk():
+            raise RuntimeError("GTK+ 3 is not available")
+        instance = alsa_tray.ALSATray()
+    else:
+        instance = alsa_tray.ALSADaemon()
+    context = GLib.MainContext.default()
+    probe = ReplayProbe(instance, context)
+    _run_loop(context, probe)
+    #Only count the calls made while handling the events
+    backend.calls = {}
+    skipped = 0
+    errors = 0
+    start = clock()
+    for event in events:
+        if event['event'] not in INPUT_EVENTS:
+            continue
+        if speed > 0:
+            _run_loop(context, probe, start + event['t'] / speed)
+        probe.feed()
+        try:
+            handled = _handle_event(instance, event)
+        except backend.ALSAAudioError:
+            handled = True
+            errors += 1
+        if not handled:
+            probe.discard()
+            skipped += 1
+        elif speed == 0:
+            _run_loop(context, probe)
+    _run_loop(context, probe)
+    if skipped > 0:
+        print("W: %i events not handled by the %s were skipped (replay them "
+              "with --target=tray)." % (skipped, target))
+    latencies = probe.latencies
+    return {
+            'events': len(latencies),
+            'skipped': skipped,
+            'errors': errors,
+            'latency_ms': {
+                'mean': round(sum(latencies) / max(1, len(latencies)), 3),
+                'p50': round(_percentile(latencies, 50), 3),
+                'p95': round(_percentile(latencies, 95), 3),
+                'max': round(max(latencies or [0]), 3),
+                },
+            'alsa_calls': backend.calls,
+            'alsa_calls_total': sum(backend.calls.values()),
+            }
+
+
+def print_report(report):
+    print("Events: %i (%i skipped, %i errors)" % (
+            report['events'], report['skipped'], report['errors']))
+    print("Latency (ms): mean %(mean).3f, p50 %(p50).3f, p95 %(p95).3f, "
+          "max %(max).3f" % report['latency_ms'])
+    print("ALSA calls: %i" % report['alsa_calls_total'])
+    for name in sorted(report['alsa_calls']):
+        print("    * %s: %i" % (name, report['alsa_calls'][name]))
+
+
+def main():
+    speed = 0
+    latency = 0.0
+    as_json = False
+    target = "daemon"
+    path = None
+    for arg in sys.argv[1:]:
+        if arg in ("--target=daemon", "--target=tray"):
+            target = arg[9:]
+        elif arg[:8] == "--speed=":
+            speed = float(arg[8:])
+        elif arg[:10] == "--latency=":
+            latency = float(arg[10:]) / 1000
+        elif arg == "--json":
+            as_json = True
+        elif arg in ("-h", "--help", "-?"):
+            print(__doc__)
+            sys.exit(0)
+        elif path is None:
+            path = arg
+        else:
+            print("E: Invalide option '%s'." % arg)
+            sys.exit(1)
+    if path is None:
+        print("E: No trace file given.")
+        sys.exit(1)
+    report = replay(read_trace(path), speed, latency, target)
+    if as_json:
+        print(json.dumps(report, sort_keys=True, indent=4))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
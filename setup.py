@@ -1,6 +1,10 @@
 #!/usr/bin/env python
 
+import glob
+import subprocess
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
+from setuptools.command.develop import develop
 from codecs import open
 from os import path
 
@@ -26,6 +30,47 @@ def get_version():
     return alsa_tray.__version__
 
 
+def compile_catalogs(command, package_dir):
+    """Compiles locales/*.po to <package_dir>/locale/<lang>/LC_MESSAGES/
+    alsa-tray.mo (needs msgfmt, from GNU gettext).
+    """
+    for po_path in sorted(glob.glob(path.join(here, 'locales', '*.po'))):
+        lang = path.splitext(path.basename(po_path))[0]
+        mo_dir = path.join(package_dir, 'locale', lang, 'LC_MESSAGES')
+        command.mkpath(mo_dir)
+        mo_path = path.join(mo_dir, 'alsa-tray.mo')
+        try:
+            subprocess.check_call(['msgfmt', '--check-format', '-o', mo_path, po_path])
+        except OSError:
+            print("W: msgfmt (GNU gettext) not found, the translations are not installed.")
+            return
+        except subprocess.CalledProcessError:
+            print("W: Can't compile %s, skipped." % po_path)
+
+
+class build_py_with_catalogs(build_py):
+    """Also compiles the translations (see compile_catalogs())"""
+
+    def run(self):
+        build_py.run(self)
+        if getattr(self, 'editable_mode', False):
+            #pip install -e: the package is imported from the source tree
+            compile_catalogs(self, path.join(here, 'alsa_tray'))
+        else:
+            compile_catalogs(self, path.join(self.build_lib, 'alsa_tray'))
+
+
+class develop_with_catalogs(develop):
+    """Also compiles the translations in the source tree (setup.py develop
+    does not run build_py)
+    """
+
+    def run(self):
+        develop.run(self)
+        if not self.uninstall:
+            compile_catalogs(self, path.join(here, 'alsa_tray'))
+
+
 setup(name='ALSATray',
       version=get_version(),
       description='ALSA Tray - Set the volume of the ALSA Master mixer.',
@@ -61,6 +106,10 @@ setup(name='ALSATray',
       package_data={
          'code':['../pixmaps/*.png', '*.glade', '../locales/*'],
       },
+    cmdclass={
+        'build_py': build_py_with_catalogs,
+        'develop': develop_with_catalogs,
+    },
     entry_points={
         'console_scripts': [
             'alsa-tray=alsa_tray.alsa_tray:main',